@@ -1,31 +1,87 @@
+from startup import StartupTimer # first: starts the startup clock
 import streamlit as st
 import cv2
 import numpy as np
 from PIL import Image
 from face_auth import FaceManager
-from attendance import AttendanceLogger
+from attendance import AttendanceLogger, LOGGED, DUPLICATE
 from liveness import LivenessDetector
-import os
+from frame_analysis import FrameAnalysis
+import threading
+import metrics
 
 # Page Config
 st.set_page_config(page_title="Face Attendance", page_icon="📸", layout="centered")
 
 # Initialize Backend & Detectors
-if 'face_manager' not in st.session_state:
-    st.session_state.face_manager = FaceManager()
-if 'logger' not in st.session_state:
-    st.session_state.logger = AttendanceLogger()
-if 'liveness_detector' not in st.session_state:
-    st.session_state.liveness_detector = LivenessDetector()
-
-# Load Cascade (Lightweight for Web)
+# Process-wide singletons shared by every browser session: one copy of the model
+# weights, gallery embeddings and cascades in RAM, built by the first visitor only.
+@st.cache_resource
+def get_face_manager():
+    metrics.enable_from_env() # once per process (ATTENDANCE_METRICS_PORT / ATTENDANCE_METRICS_LOG)
+    # The model loads in the background: the page renders right away and only
+    # identification/registration wait for it
+    timer = StartupTimer("streamlit")
+    timer.mark("page")
+    def ready(manager):
+        if manager.is_ready:
+            timer.mark("model_ready")
+            timer.save()
+    manager = FaceManager(lazy=True)
+    manager.start_warmup(on_ready=ready)
+    return manager
+
+@st.cache_resource
+def get_logger():
+    return AttendanceLogger()
+
+@st.cache_resource
+def get_liveness_detector():
+    return LivenessDetector()
+
+@st.cache_resource
+def get_face_cascade():
+    # Load Cascade (Lightweight for Web)
+    return cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+@st.cache_resource
+def get_detector_lock():
+    # OpenCV cascades are not guaranteed thread-safe; sessions take turns on the shared ones
+    return threading.Lock()
+
+face_manager = get_face_manager()
+logger = get_logger()
+liveness_detector = get_liveness_detector()
+detector_lock = get_detector_lock()
 try:
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    face_cascade = get_face_cascade()
 except:
     st.error("Error loading Face Cascade")
 
+# Only reloads if enrolment changed elsewhere (e.g. the desktop app); otherwise a stat()
+face_manager.refresh_if_changed()
+
+def identify_everyone(analysis, eye_statuses):
+    """
+    Recognised people in the snapshot (one batched inference, no re-detection).
+    Returns: (names whose own face passed the eye check, names recognised
+    without it). Only the first are punched, so a bystander or a photo held up
+    next to a live person is not marked present.
+    """
+    results = face_manager.identify_analysis(analysis) if analysis.faces else []
+    live, unverified = {}, {}
+    for (name, _), status in zip(results, eye_statuses):
+        if name != "Unknown":
+            (live if status == "Open" else unverified)[name] = True
+    return list(live), [name for name in unverified if name not in live]
+
 st.title("📸 AI Face Attendance")
 
+if face_manager.state == face_manager.FAILED:
+    st.error(f"Face model failed to load: {face_manager.error}")
+elif not face_manager.is_ready:
+    st.info("⏳ Face model is warming up; the first check may take a few seconds.")
+
 # Tabs
 tab1, tab2, tab3 = st.tabs(["🏠 Punch Attendance", "👤 Register", "📊 Logs"])
 
@@ -41,25 +97,29 @@ with tab1:
         cv2_img = cv2.imdecode(np.frombuffer(bytes_data, np.uint8), cv2.IMREAD_COLOR)
         
         # 1. Detect Face First (Needed for Liveness)
-        gray = cv2.cvtColor(cv2_img, cv2.COLOR_BGR2GRAY)
+        # Gray, boxes and crops are computed once and shared by liveness and identification.
+        # Analysed on a clean copy so crops never include the drawn rectangles.
         # Tuned parameters: 1.1 scale (more sensitive), 4 neighbors (less strict)
-        faces = face_cascade.detectMultiScale(gray, 1.1, 4)
+        with detector_lock:
+            analysis = FrameAnalysis(cv2_img.copy(), face_cascade, 1.1, 4)
+        faces = analysis.faces
         
         eye_status = "Unknown"
+        eye_statuses = [] # per face, parallel to analysis.faces
         
         if len(faces) == 0:
             st.warning("⚠️ No Face Detected! Please align your face clearly.")
         else:
-            # Sort largest face
-            faces = sorted(faces, key=lambda f: f[2]*f[3], reverse=True)
-            
-            # Draw Face Rectangle
-            (x, y, w, h) = faces[0]
-            face_coords = (x, y, w, h)
-            cv2.rectangle(cv2_img, (x, y), (x+w, y+h), (0, 255, 0), 2)
+            # Draw Face Rectangles (largest first)
+            for (fx, fy, fw, fh) in faces:
+                cv2.rectangle(cv2_img, (fx, fy), (fx+fw, fy+fh), (0, 255, 0), 2)
+            face_coords = analysis.largest
             
-            # --- SINGLE SHOT LIVENESS CHECK ---
-            eye_status = st.session_state.liveness_detector.get_eye_status(cv2_img, face_coords)
+            # --- SINGLE SHOT LIVENESS CHECK (every face: only faces that pass are punched) ---
+            with detector_lock:
+                eye_statuses = [liveness_detector.get_eye_status(cv2_img, box, roi_gray=analysis.gray_crop(i))
+                                for i, box in enumerate(faces)]
+            eye_status = eye_statuses[0] # largest face
             
             if eye_status == "Open":
                 st.success("✅ **Liveness Check Passed**: Eyes Detected (Open)")
@@ -79,33 +139,50 @@ with tab1:
         with col1:
             if st.button("PUNCH IN", type="primary", use_container_width=True):
                 # Enforce Liveness? (Optional, currently just warning)
-                if eye_status == "Closed":
+                if faces and "Open" not in eye_statuses:
                      st.error("Cannot Punch In: Eyes Closed/Not Detected.")
                 elif eye_status == "Unknown" and len(faces) == 0:
                      st.error("Cannot Punch In: No Face Detected.")
                 else:
                     with st.spinner("Identifying..."):
-                        name, dist = st.session_state.face_manager.identify_face(cv2_img)
-                        if name != "Unknown":
-                            msg = st.session_state.logger.mark_attendance(name, "Punch In")
-                            st.success(f"Welcome {name}! ({msg})")
+                        # Everyone in the snapshot is identified in one batched pass
+                        names, unverified = identify_everyone(analysis, eye_statuses)
+                        for name in unverified:
+                            st.warning(f"{name}: eyes not visible, not punched.")
+                        if names:
+                            for name in names:
+                                status, msg = logger.mark_attendance(name, "Punch In")
+                                if status == LOGGED:
+                                    st.success(f"Welcome {name}! ({msg})")
+                                elif status == DUPLICATE:
+                                    st.info(f"{name}: {msg}")
+                                else:
+                                    st.error(f"{name}: {msg}")
                             st.balloons()
-                        else:
+                        elif not unverified:
                             st.error("Face not recognized. Please Register first.")
                         
         with col2:
             if st.button("PUNCH OUT", type="secondary", use_container_width=True):
-                if eye_status == "Closed":
+                if faces and "Open" not in eye_statuses:
                      st.error("Cannot Punch Out: Eyes Closed.")
                 elif eye_status == "Unknown" and len(faces) == 0:
                      st.error("Cannot Punch Out: No Face Detected.")
                 else:
                     with st.spinner("Identifying..."):
-                        name, dist = st.session_state.face_manager.identify_face(cv2_img)
-                        if name != "Unknown":
-                            msg = st.session_state.logger.mark_attendance(name, "Punch Out")
-                            st.info(f"Goodbye {name}! ({msg})")
-                        else:
+                        names, unverified = identify_everyone(analysis, eye_statuses)
+                        for name in unverified:
+                            st.warning(f"{name}: eyes not visible, not punched.")
+                        if names:
+                            for name in names:
+                                status, msg = logger.mark_attendance(name, "Punch Out")
+                                if status == LOGGED:
+                                    st.info(f"Goodbye {name}! ({msg})")
+                                elif status == DUPLICATE:
+                                    st.info(f"{name}: {msg}")
+                                else:
+                                    st.error(f"{name}: {msg}")
+                        elif not unverified:
                             st.error("Face not recognized.")
 
 with tab2:
@@ -125,19 +202,26 @@ with tab2:
             cv2_img = cv2.imdecode(np.frombuffer(bytes_data, np.uint8), cv2.IMREAD_COLOR)
             
             # Check Duplicate
-            existing_name = st.session_state.face_manager.check_existing_face(cv2_img)
+            existing_name = face_manager.check_existing_face(cv2_img)
             old_name_to_del = None
             
             proceed = True
-            if existing_name:
+            add_sample = False
+            if existing_name and existing_name.lower() == new_name.lower():
+                st.info(f"Note: '{existing_name}' is already registered. Adding this photo as an extra sample.")
+                add_sample = True
+            elif existing_name:
                 st.info(f"Note: This face matched '{existing_name}'. Updating identity to '{new_name}'.")
                 old_name_to_del = existing_name
             
             if proceed:
-                success, msg = st.session_state.face_manager.register_face(cv2_img, new_name, old_name=old_name_to_del)
+                if add_sample:
+                    success, msg = face_manager.add_face_sample(cv2_img, existing_name)
+                else:
+                    success, msg = face_manager.register_face(cv2_img, new_name, old_name=old_name_to_del)
                 if success:
                     st.success(f"Registered {new_name} successfully!")
-                    st.session_state.logger.mark_attendance(new_name, "Registration")
+                    logger.mark_attendance(new_name, "Registration")
                 else:
                     st.error(msg)
     
@@ -146,5 +230,15 @@ with tab2:
 with tab3:
     st.header("Attendance Logs")
     if st.button("Refresh Logs"):
-        logs = st.session_state.logger.get_todays_logs()
+        # Precomputed per-person totals; no re-aggregation of raw events
+        summaries = logger.get_daily_summaries()
+        st.subheader("Today's Summary")
+        st.dataframe(
+            [(name, first_in or "-", last_out or "-", f"{worked // 3600}h {worked % 3600 // 60:02d}m", punches)
+             for name, _, first_in, last_out, worked, punches in summaries],
+            column_config={0: "Name", 1: "First In", 2: "Last Out", 3: "Worked", 4: "Punches"},
+            use_container_width=True)
+        
+        st.subheader("Events")
+        logs = logger.get_todays_logs()
         st.dataframe(logs, column_config={0: "Name", 1: "Action", 2: "Time"}, use_container_width=True)
@@ -1,16 +1,75 @@
 import sqlite3
-import os
-from datetime import datetime
+import threading
+import queue
+import atexit
+from datetime import datetime, timedelta
+from log_sinks import CsvMirrorSink
+import metrics
+
+PUNCH_IN = "Punch In"
+PUNCH_OUT = "Punch Out"
+
+# mark_attendance() outcome
+LOGGED = "logged"
+DUPLICATE = "duplicate"
+FAILED = "failed"
+
+class _PendingWrite:
+    """One queued insert; the caller waits on 'done' until its batch is committed."""
+    def __init__(self, row):
+        self.row = row
+        self.done = threading.Event()
+        self.error = None
 
 class AttendanceLogger:
-    def __init__(self, db_name="attendance.db"):
+    def __init__(self, db_name="attendance.db", batch_size=256, write_timeout=10.0, sinks=None,
+                 dedup_window=60.0, dedup_actions=(PUNCH_IN, PUNCH_OUT)):
+        """
+        batch_size: max inserts grouped into one commit by the writer thread.
+        write_timeout: seconds mark_attendance waits for its commit.
+        sinks: extra event mirrors with write(name, action, time_str, date_str)
+               and close(); defaults to the daily CSV files in logs/.
+        dedup_window: seconds during which a repeat of the same name + action is
+                      suppressed (0 disables). Only applies to dedup_actions.
+        """
         self.db_name = db_name
+        self.dedup_window = dedup_window
+        self.dedup_actions = set(dedup_actions)
+        self.sinks = [CsvMirrorSink("logs")] if sinks is None else list(sinks)
+        self.batch_size = batch_size
+        self.write_timeout = write_timeout
+        
+        # Long-lived connections: one owned by the writer thread, one shared for reads.
+        # With WAL, readers never block the writer (and vice versa).
+        self._write_conn = self._connect()
+        self._write_lock = threading.Lock() # writer thread vs. rebuild_summaries
+        self._read_conn = self._connect()
+        self._read_lock = threading.Lock()
         self._init_db()
+        
+        # (name, action) -> datetime of the last logged event, for de-duplication
+        self._last_event = {}
+        self._last_event_lock = threading.Lock()
+        self._seed_last_events()
+        
+        self._queue = queue.Queue()
+        self._closed = False
+        self._writer = threading.Thread(target=self._writer_loop, name="attendance-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_name, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL") # durable at checkpoints, far fewer fsyncs
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-16000") # ~16 MB page cache
+        return conn
 
     def _init_db(self):
         """Initialize the SQLite database and create table if not exists."""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+        cursor = self._write_conn.cursor()
         
         # Create table
         cursor.execute('''
@@ -23,59 +82,307 @@ class AttendanceLogger:
             )
         ''')
         
-        conn.commit()
-        conn.close()
+        # Indexes for the "today's logs" and per-person queries
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_date ON attendance_logs (date_str)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_name_date ON attendance_logs (name, date_str)')
+        
+        # Per person per day: first punch-in, last punch-out, worked time, punch count.
+        # open_in holds a Punch In still waiting for its Punch Out.
+        cursor.execute(self._DAILY_TABLE.format(temp="", table="attendance_daily"))
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_daily_date ON attendance_daily (date_str, name)')
+        
+        self._write_conn.commit()
+        
+        # Databases created before the summary table existed get it backfilled once
+        has_summaries = cursor.execute('SELECT 1 FROM attendance_daily LIMIT 1').fetchone()
+        has_logs = cursor.execute('SELECT 1 FROM attendance_logs LIMIT 1').fetchone()
+        if has_logs and not has_summaries:
+            self.rebuild_summaries()
+
+    # --- Daily summaries ---
+    # An overnight shift (In 22:00, Out 06:00) belongs to the day it started:
+    # that day gets the worked time and last_out (a timestamp on the next date);
+    # the Out day only counts the punch.
+    OVERNIGHT_MAX_SECONDS = 16 * 3600 # longest shift an Out may close across midnight
+
+    _DAILY_TABLE = '''
+        CREATE {temp} TABLE IF NOT EXISTS {table} (
+            name TEXT NOT NULL,
+            date_str TEXT NOT NULL,
+            first_in DATETIME,
+            last_out DATETIME,
+            worked_seconds INTEGER NOT NULL DEFAULT 0,
+            punch_count INTEGER NOT NULL DEFAULT 0,
+            open_in DATETIME,
+            PRIMARY KEY (name, date_str)
+        )
+    '''
+    _SUMMARY_SQL = {
+        PUNCH_IN: '''
+            INSERT INTO {table} (name, date_str, first_in, punch_count, open_in)
+            VALUES (:name, :date_str, :ts, 1, :ts)
+            ON CONFLICT (name, date_str) DO UPDATE SET
+                first_in = CASE WHEN first_in IS NULL OR excluded.first_in < first_in THEN excluded.first_in ELSE first_in END,
+                punch_count = punch_count + 1,
+                open_in = COALESCE(open_in, excluded.open_in)
+        ''',
+        PUNCH_OUT: '''
+            INSERT INTO {table} (name, date_str, last_out, punch_count)
+            VALUES (:name, :date_str, :ts, 1)
+            ON CONFLICT (name, date_str) DO UPDATE SET
+                last_out = CASE WHEN last_out IS NULL OR excluded.last_out > last_out THEN excluded.last_out ELSE last_out END,
+                punch_count = punch_count + 1,
+                worked_seconds = worked_seconds + CASE WHEN open_in IS NULL THEN 0
+                    ELSE CAST(strftime('%s', excluded.last_out) - strftime('%s', open_in) AS INTEGER) END,
+                open_in = NULL
+        ''',
+    }
+    # Closes yesterday's open Punch In, if this Out is today's first punch and
+    # close enough to it
+    _OVERNIGHT_SQL = '''
+        UPDATE {table} SET
+            worked_seconds = worked_seconds + CAST(strftime('%s', :ts) - strftime('%s', open_in) AS INTEGER),
+            last_out = :ts,
+            open_in = NULL
+        WHERE name = :name AND date_str = :prev_date AND open_in IS NOT NULL
+          AND strftime('%s', :ts) - strftime('%s', open_in) <= :max_gap
+          AND NOT EXISTS (SELECT 1 FROM {table} WHERE name = :name AND date_str = :date_str)
+    '''
+    _OVERNIGHT_OUT_SQL = '''
+        INSERT INTO {table} (name, date_str, punch_count) VALUES (:name, :date_str, 1)
+        ON CONFLICT (name, date_str) DO UPDATE SET punch_count = punch_count + 1
+    '''
+
+    def _apply_summaries(self, conn, rows, table="attendance_daily"):
+        """Folds (name, action, timestamp, date_str) events into the daily summaries, in order."""
+        for name, action, ts, date_str in rows:
+            sql = self._SUMMARY_SQL.get(action)
+            if sql is None: # Registrations etc. are not punches
+                continue
+            params = {"name": name, "date_str": date_str, "ts": ts}
+            if action == PUNCH_OUT:
+                prev_date = (datetime.strptime(date_str, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+                overnight = conn.execute(self._OVERNIGHT_SQL.format(table=table),
+                                         dict(params, prev_date=prev_date, max_gap=self.OVERNIGHT_MAX_SECONDS))
+                if overnight.rowcount:
+                    sql = self._OVERNIGHT_OUT_SQL
+            conn.execute(sql.format(table=table), params)
+
+    @staticmethod
+    def _shift_date(date_str, days):
+        return (datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=days)).strftime("%Y-%m-%d")
+
+    @staticmethod
+    def _date_range(start, end):
+        clauses, params = [], []
+        if start:
+            clauses.append("date_str >= ?")
+            params.append(start)
+        if end:
+            clauses.append("date_str <= ?")
+            params.append(end)
+        return (f" WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+    def rebuild_summaries(self, start=None, end=None):
+        """
+        Recomputes attendance_daily from the raw events for an inclusive
+        'YYYY-MM-DD' date range (everything if omitted).
+        Shifts crossing the range's edges are paired exactly: the day before and
+        the day after are replayed too (into a scratch table), only the range is
+        written back.
+        Returns: number of person-days rebuilt.
+        """
+        where, params = self._date_range(start, end)
+        with self._write_lock, self._write_conn:
+            conn = self._write_conn
+            if not where:
+                conn.execute("DELETE FROM attendance_daily")
+                events = conn.execute("SELECT name, action, timestamp, date_str FROM attendance_logs ORDER BY timestamp, id")
+                self._apply_summaries(conn, events.fetchall())
+                return conn.execute("SELECT COUNT(*) FROM attendance_daily").fetchone()[0]
+
+            wide_where, wide_params = self._date_range(start and self._shift_date(start, -1), end and self._shift_date(end, 1))
+            conn.execute("DROP TABLE IF EXISTS temp.rebuild_daily")
+            conn.execute(self._DAILY_TABLE.format(temp="TEMP", table="rebuild_daily"))
+            try:
+                events = conn.execute(
+                    f"SELECT name, action, timestamp, date_str FROM attendance_logs{wide_where} ORDER BY timestamp, id", wide_params)
+                self._apply_summaries(conn, events.fetchall(), table="rebuild_daily")
+                conn.execute(f"DELETE FROM attendance_daily{where}", params)
+                conn.execute(f"INSERT INTO attendance_daily SELECT * FROM rebuild_daily{where}", params)
+            finally:
+                conn.execute("DROP TABLE temp.rebuild_daily")
+            return conn.execute(f"SELECT COUNT(*) FROM attendance_daily{where}", params).fetchone()[0]
+
+    def get_daily_summaries(self, start=None, end=None, name=None):
+        """
+        Precomputed per person per day rows, newest day first:
+        (name, date_str, first_in, last_out, worked_seconds, punch_count)
+        An overnight shift is reported on the day it started (last_out is then
+        on the next date).
+        start / end: inclusive 'YYYY-MM-DD' bounds (default: today only).
+        """
+        if start is None and end is None:
+            start = end = datetime.now().strftime("%Y-%m-%d")
+        clauses, params = [], []
+        if name:
+            clauses.append("name = ?")
+            params.append(name)
+        if start:
+            clauses.append("date_str >= ?")
+            params.append(start)
+        if end:
+            clauses.append("date_str <= ?")
+            params.append(end)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(f'''
+            SELECT name, date_str, first_in, last_out, worked_seconds, punch_count
+            FROM attendance_daily{where} ORDER BY date_str DESC, name
+        ''', params)
+
+    # --- Background writer (group commit) ---
+    def _writer_loop(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            # Everything queued while the previous commit ran goes into this one
+            batch = [first]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._commit_batch(batch)
+            if stop:
+                return
+
+    def _commit_batch(self, batch):
+        error = None
+        rows = [item.row for item in batch]
+        metrics.observe("db_batch_rows", len(rows))
+        try:
+            # Raw events and their daily summaries land in the same transaction
+            with metrics.timer("db_commit_seconds"), self._write_lock, self._write_conn:
+                self._write_conn.executemany('''
+                    INSERT INTO attendance_logs (name, action, timestamp, date_str)
+                    VALUES (?, ?, ?, ?)
+                ''', rows)
+                self._apply_summaries(self._write_conn, rows)
+        except sqlite3.Error as e:
+            error = e
+            metrics.inc("db_errors_total")
+        for item in batch:
+            item.error = error
+            item.done.set()
+
+    def _write(self, row):
+        """Queues one insert and waits until the writer has committed it."""
+        if self._closed:
+            raise sqlite3.ProgrammingError("AttendanceLogger is closed")
+        pending = _PendingWrite(row)
+        self._queue.put(pending)
+        if not pending.done.wait(self.write_timeout):
+            raise sqlite3.OperationalError("Timed out waiting for the attendance writer")
+        if pending.error is not None:
+            raise pending.error
+
+    def close(self):
+        """Flushes pending writes and closes the connections."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join(timeout=self.write_timeout)
+        self._write_conn.close()
+        with self._read_lock:
+            self._read_conn.close()
+        for sink in self.sinks:
+            sink.close()
+
+    # --- De-duplication ---
+    def _seed_last_events(self):
+        """Loads the latest event per (name, action) so a restart does not reopen the window."""
+        if not self.dedup_window:
+            return
+        since = (datetime.now() - timedelta(seconds=self.dedup_window)).strftime("%Y-%m-%d")
+        rows = self._query('''
+            SELECT name, action, MAX(timestamp) FROM attendance_logs
+            WHERE date_str >= ? GROUP BY name, action
+        ''', (since,))
+        for name, action, ts in rows:
+            try:
+                self._last_event[(name, action)] = datetime.strptime(ts, "%Y-%m-%d %H:%M:%S")
+            except (TypeError, ValueError):
+                continue
+
+    def _claim(self, name, action, now):
+        """
+        Reserves (name, action) at 'now' unless it was logged within the window.
+        Returns: (True, None) to proceed, or (False, time of the earlier event).
+        """
+        if not self.dedup_window or action not in self.dedup_actions:
+            return True, None
+        key = (name, action)
+        with self._last_event_lock:
+            last = self._last_event.get(key)
+            if last is not None and (now - last).total_seconds() < self.dedup_window:
+                return False, last
+            self._last_event[key] = now
+            return True, last
+
+    def _release(self, name, action, previous):
+        """Undoes a _claim whose write failed."""
+        with self._last_event_lock:
+            if previous is None:
+                self._last_event.pop((name, action), None)
+            else:
+                self._last_event[(name, action)] = previous
 
     def mark_attendance(self, name, action):
         """
         Marks attendance in the SQLite Query.
+        Repeats of the same name + action within dedup_window are not stored.
+        Returns: (status, message) where status is LOGGED, DUPLICATE or FAILED.
         """
         now = datetime.now()
         time_str = now.strftime("%H:%M:%S")
         date_str = now.strftime("%Y-%m-%d")
         
+        claimed, previous = self._claim(name, action, now)
+        if not claimed:
+            metrics.inc("punches_total", status=DUPLICATE)
+            return DUPLICATE, f"{action} already logged at {previous.strftime('%H:%M:%S')} (duplicate ignored)"
+        
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-            
-            # Insert record
-            cursor.execute('''
-                INSERT INTO attendance_logs (name, action, timestamp, date_str)
-                VALUES (?, ?, ?, ?)
-            ''', (name, action, now.strftime("%Y-%m-%d %H:%M:%S"), date_str))
+            # Insert record (batched with concurrent punches into one commit)
+            self._write((name, action, now.strftime("%Y-%m-%d %H:%M:%S"), date_str))
             
-            conn.commit()
-            conn.close()
-            
-            # --- DUAL LOGGING START ---
-            # Also write to CSV for easy viewing
-            log_dir = "logs"
-            if not os.path.exists(log_dir):
-                os.makedirs(log_dir)
-            csv_path = os.path.join(log_dir, f"attendance_{date_str}.csv")
-            
-            # Check if header needed
-            needs_header = not os.path.exists(csv_path)
-            
-            import csv
-            with open(csv_path, "a", newline="") as f:
-                writer = csv.writer(f)
-                if needs_header:
-                    writer.writerow(["Name", "Action", "Time", "Date"])
-                writer.writerow([name, action, time_str, date_str])
-            # --- DUAL LOGGING END ---
-
-            return f"{action} Logged (DB+CSV) at {time_str}"
+            # --- DUAL LOGGING ---
+            # Mirrors (CSV) are fed through their own queues; a slow or network
+            # log directory never adds latency here
+            for sink in self.sinks:
+                sink.write(name, action, time_str, date_str)
+
+            targets = "+".join(["DB"] + [sink.label for sink in self.sinks])
+            metrics.inc("punches_total", status=LOGGED)
+            return LOGGED, f"{action} Logged ({targets}) at {time_str}"
             
         except sqlite3.Error as e:
-            return f"DB Error: {e}"
+            self._release(name, action, previous)
+            metrics.inc("punches_total", status=FAILED)
+            return FAILED, f"DB Error: {e}"
+
+    def _query(self, sql, params=()):
+        with self._read_lock:
+            return self._read_conn.execute(sql, params).fetchall()
 
     def get_todays_logs(self):
         """Fetch logs for today to show in UI."""
         date_str = datetime.now().strftime("%Y-%m-%d")
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        cursor.execute('SELECT name, action, timestamp FROM attendance_logs WHERE date_str = ? ORDER BY id DESC', (date_str,))
-        rows = cursor.fetchall()
-        conn.close()
-        return rows
+        return self._query('SELECT name, action, timestamp FROM attendance_logs WHERE date_str = ? ORDER BY id DESC', (date_str,))
@@ -0,0 +1,360 @@
+"""
+End-to-end stage benchmarks: detection, liveness, embedding, matching,
+logging and export, each timed separately.
+
+Runs offline on synthetic frames, or on recorded images with --images:
+    python -m benchmarks.pipeline                        # synthetic, no model needed
+    python -m benchmarks.pipeline --images shots/ --model
+    python -m benchmarks.pipeline --stages model --face-models VGG-Face Facenet512 SFace
+    python -m benchmarks.pipeline --stages model --gallery-sizes 10 1000 10000 100000   # identify_face vs gallery size
+    python -m benchmarks.pipeline --stages match --precisions float32 float16 int8
+    python -m benchmarks.pipeline --compare benchmarks/results/a.json benchmarks/results/b.json
+
+Every run is saved as JSON (benchmarks/results/ by default) so two commits
+can be compared with --compare.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import platform
+import tempfile
+import subprocess
+import threading
+from datetime import datetime
+import cv2
+import numpy as np
+from gallery import EmbeddingGallery, PRECISIONS
+from frame_analysis import FrameAnalysis
+from liveness import LivenessDetector, LivenessEngine
+from tracking import FaceTracker
+from attendance import AttendanceLogger
+from export_logs import export_logs
+from face_auth import configured_model, embedding_size
+from benchmarks.search_recall import synthetic_gallery, make_queries
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def summarize(latencies_ms, wall_seconds=None, items=None):
+    """p50/p95/p99 (ms) and throughput (items per second of wall time)."""
+    latencies = np.asarray(latencies_ms, dtype=np.float64)
+    wall_seconds = wall_seconds if wall_seconds is not None else latencies.sum() / 1000.0
+    items = items if items is not None else len(latencies)
+    return {
+        "count": int(len(latencies)),
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "throughput_per_s": float(items / wall_seconds) if wall_seconds > 0 else 0.0,
+    }
+
+
+def measure(fn, inputs, warmup=3):
+    """Calls fn(x) for every input; returns the summary of the per-call latencies."""
+    for x in inputs[:warmup]:
+        fn(x)
+    latencies = []
+    start = time.perf_counter()
+    for x in inputs:
+        t = time.perf_counter()
+        fn(x)
+        latencies.append((time.perf_counter() - t) * 1000)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+# --- Inputs ---
+def load_frames(images, count, size=(640, 480), seed=0):
+    """Recorded images (cycled up to 'count'), or synthetic textured frames."""
+    if images:
+        paths = sorted(p for ext in ("jpg", "jpeg", "png") for p in glob.glob(os.path.join(images, f"*.{ext}")))
+        frames = [cv2.imread(p) for p in paths]
+        frames = [f for f in frames if f is not None]
+        if not frames:
+            raise SystemExit(f"No images found in {images}")
+        return [frames[i % len(frames)] for i in range(count)]
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(count):
+        noise = rng.integers(0, 255, (size[1] // 8, size[0] // 8, 3), dtype=np.uint8)
+        frames.append(cv2.resize(noise, size, interpolation=cv2.INTER_LINEAR))
+    return frames
+
+
+def face_boxes(frames, face_cascade):
+    """Haar boxes per frame; frames without a face get a centred box (synthetic input)."""
+    boxes = []
+    for frame in frames:
+        found = face_cascade.detectMultiScale(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), 1.3, 5)
+        if len(found):
+            boxes.append([tuple(int(v) for v in f) for f in found])
+        else:
+            h, w = frame.shape[:2]
+            boxes.append([(w // 2 - 100, h // 2 - 120, 200, 240)])
+    return boxes
+
+
+# --- Stages ---
+def bench_detection(frames, face_cascade, detect_every):
+    grays = [cv2.cvtColor(f, cv2.COLOR_BGR2GRAY) for f in frames]
+    results = {"detect.haar": measure(lambda g: face_cascade.detectMultiScale(g, 1.3, 5), grays)}
+    tracker = FaceTracker(face_cascade, detect_every=detect_every)
+    pairs = list(zip(frames, grays))
+    results[f"detect.tracked_every_{detect_every}"] = measure(lambda p: tracker.update(*p), pairs)
+    return results
+
+
+def bench_liveness(frames, boxes):
+    detector = LivenessDetector()
+    analyses = [FrameAnalysis(f, None, faces=b) for f, b in zip(frames, boxes)]
+    results = {"liveness.check_liveness": measure(lambda a: detector.check_liveness(a.frame, a.largest, roi_gray=a.gray_crop(0)), analyses)}
+
+    engine = LivenessEngine()
+    single = [FrameAnalysis(a.frame, None, faces=[a.largest]) for a in analyses]
+    results["liveness.engine_1_face"] = measure(engine.update, single)
+    # Many faces per frame: the vectorised engine's case
+    crowd = []
+    for a in analyses:
+        (x, y, w, h) = a.largest
+        crowd.append(FrameAnalysis(a.frame, None, faces=[(x + dx, y, w // 2, h // 2) for dx in range(0, 8 * 10, 10)]))
+    results["liveness.engine_8_faces"] = measure(lambda a: engine.update(a), crowd)
+    return results
+
+
+def bench_matching(sizes, dim, queries, precisions=("float32",)):
+    results = {}
+    for size in sizes:
+        matrix = synthetic_gallery(size, dim, max(1, size // 50))
+        probes = make_queries(matrix, queries, noise=0.8)
+        for precision in precisions:
+            gallery = EmbeddingGallery(precision=precision)
+            gallery.load((f"user{i}", f"user{i}", row) for i, row in enumerate(matrix))
+            suffix = "" if precision == "float32" else f"_{precision}"
+            stats = measure(lambda p: gallery.search(p, k=1), list(probes))
+            stats["gallery_mb"] = (gallery.matrix.nbytes + sum(s.nbytes for s in gallery.samples.values())) / 2**20
+            results[f"match.gallery_{size}{suffix}"] = stats
+            del gallery
+        del matrix
+    return results
+
+
+def bench_model(frames, boxes, batch_sizes, model_name=None, gallery_sizes=()):
+    """
+    Embedding and full identify_face with the real model (needs deepface),
+    against one enrolled face and then against synthetic galleries of each
+    size in 'gallery_sizes' (embeddings of the model's own size).
+    """
+    from face_auth import FaceManager, MODEL_NAME
+    workdir = tempfile.mkdtemp(prefix="bench_faces_")
+    try:
+        manager = FaceManager(db_path=workdir, model_name=model_name)
+        if not manager.is_ready:
+            print(f"[WARNING] Model unavailable, skipping embedding stages: {manager.error}")
+            return {}
+        print(f"[INFO] {manager.model_name} loaded in {manager.load_seconds:.1f}s")
+        # The default model keeps the historical stage names so old runs still compare
+        prefix = "" if manager.model_name == MODEL_NAME else f"{manager.model_name}."
+        crops = [FrameAnalysis(f, None, faces=b).crop(0) for f, b in zip(frames, boxes)]
+        results = {}
+        for batch in batch_sizes:
+            groups = [crops[i:i + batch] for i in range(0, len(crops) - batch + 1, batch)]
+            stats = measure(manager._embed_crops, groups)
+            stats["throughput_per_s"] *= batch # faces, not batches
+            results[f"embed.{prefix}batch_{batch}"] = stats
+        # identify_face returns early on an empty gallery: enrol one face in memory
+        embedding = manager._embed_crops(crops[:1])[0]
+        manager.gallery.add("bench", "bench", embedding)
+        probes = frames[:min(len(frames), 30)]
+        stats = measure(manager.identify_face, probes)
+        stats["dim"] = int(embedding.shape[0])
+        results[f"identify_face{'.' + manager.model_name if prefix else ''}"] = stats
+
+        # The same call once the gallery holds 'size' people (the real face among them)
+        for size in gallery_sizes:
+            matrix = synthetic_gallery(size, len(embedding), max(1, size // 50))
+            entries = [(f"user{i}", f"user{i}", row) for i, row in enumerate(matrix[:size - 1])]
+            with manager._lock:
+                manager.gallery.load(entries + [("bench", "bench", embedding)])
+            stats = measure(manager.identify_face, probes)
+            stats["dim"] = int(embedding.shape[0])
+            results[f"identify_face.{prefix}gallery_{size}"] = stats
+            del matrix, entries
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_logging(writers, per_writer):
+    workdir = tempfile.mkdtemp(prefix="bench_db_")
+    try:
+        logger = AttendanceLogger(os.path.join(workdir, "bench.db"), sinks=[], dedup_window=0)
+        latencies, lock = [], threading.Lock()
+
+        def writer(w):
+            local = []
+            for i in range(per_writer):
+                t = time.perf_counter()
+                logger.mark_attendance(f"user{w}", "Punch In" if i % 2 == 0 else "Punch Out")
+                local.append((time.perf_counter() - t) * 1000)
+            with lock:
+                latencies.extend(local)
+
+        threads = [threading.Thread(target=writer, args=(w,)) for w in range(writers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = summarize(latencies, time.perf_counter() - start)
+        stats["writers"] = writers
+        logger.close()
+        return {f"log.mark_attendance_{writers}_writers": stats}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_export(rows, repeat):
+    workdir = tempfile.mkdtemp(prefix="bench_export_")
+    try:
+        db = os.path.join(workdir, "bench.db")
+        AttendanceLogger(db, sinks=[]).close() # creates the schema
+        conn = sqlite3.connect(db)
+        conn.executemany("INSERT INTO attendance_logs (name, action, timestamp, date_str) VALUES (?, ?, ?, ?)",
+                         ((f"user{i % 500}", "Punch In", f"2026-01-{1 + i % 28:02d} 09:00:00", f"2026-01-{1 + i % 28:02d}") for i in range(rows)))
+        conn.commit()
+        conn.close()
+        output = os.path.join(workdir, "out.csv")
+        # export_to_csv() is export_logs() to a dated file in the working directory
+        stats = measure(lambda _: export_logs(db, output, "csv", progress=False), list(range(repeat)), warmup=1)
+        stats["throughput_per_s"] *= rows # rows, not exports
+        stats["rows"] = rows
+        return {"export.csv": stats}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# --- Results ---
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_results(stages):
+    print(f"\n{'stage':<34}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'per s':>12}")
+    for name, s in stages.items():
+        print(f"{name:<34}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}{s['throughput_per_s']:>12.1f}")
+
+
+def compare(base_path, new_path, tolerance):
+    """Prints p50/p95 changes per stage; returns 1 if any stage got slower than 'tolerance'."""
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{base['meta']['commit']} -> {new['meta']['commit']}")
+    print(f"{'stage':<34}{'p50 ms':>18}{'p95 ms':>18}")
+    regressed = False
+    for name, s in new["stages"].items():
+        old = base["stages"].get(name)
+        if old is None:
+            print(f"{name:<34}{'(new)':>18}")
+            continue
+        cells = []
+        for key in ("p50_ms", "p95_ms"):
+            change = (s[key] - old[key]) / old[key] if old[key] > 0 else 0.0
+            regressed |= change > tolerance
+            cells.append(f"{s[key]:.2f} ({change:+.0%})")
+        flag = "  <-- slower" if any(
+            old[k] > 0 and (s[k] - old[k]) / old[k] > tolerance for k in ("p50_ms", "p95_ms")) else ""
+        print(f"{name:<34}{cells[0]:>18}{cells[1]:>18}{flag}")
+    return 1 if regressed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="Folder of recorded frames (default: synthetic frames)")
+    parser.add_argument("--frames", type=int, default=200, help="Frames per detection/liveness stage")
+    parser.add_argument("--stages", nargs="+", default=["detect", "liveness", "match", "log", "export"],
+                        choices=["detect", "liveness", "match", "model", "log", "export"])
+    parser.add_argument("--model", action="store_true", help="Also time embedding / identify_face (loads the model)")
+    parser.add_argument("--face-models", nargs="+", default=[None], metavar="NAME",
+                        help="DeepFace models for the model stage, e.g. VGG-Face Facenet512 SFace")
+    parser.add_argument("--precisions", nargs="+", default=["float32"], choices=PRECISIONS,
+                        help="Gallery precisions for the match stage")
+    parser.add_argument("--detect-every", type=int, default=5)
+    parser.add_argument("--gallery-sizes", type=int, nargs="+", default=[10, 1000, 10000, 100000],
+                        help="Gallery sizes for the match stage and the model stage's identify_face sweep")
+    parser.add_argument("--dim", type=int, default=embedding_size(configured_model()) or 512,
+                        help="Synthetic embedding size for the match stage (default: the configured model's)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--writers", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--writes", type=int, default=200, help="mark_attendance calls per writer")
+    parser.add_argument("--export-rows", type=int, default=100000)
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<time>_<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="Compare two saved runs instead of running")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Slowdown flagged by --compare (default 10%%)")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return compare(args.compare[0], args.compare[1], args.tolerance)
+
+    stages = list(args.stages) + (["model"] if args.model and "model" not in args.stages else [])
+    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    frames = load_frames(args.images, args.frames)
+    boxes = face_boxes(frames, face_cascade)
+
+    results = {}
+    if "detect" in stages:
+        results.update(bench_detection(frames, face_cascade, args.detect_every))
+    if "liveness" in stages:
+        results.update(bench_liveness(frames, boxes))
+    if "match" in stages:
+        results.update(bench_matching(args.gallery_sizes, args.dim, args.queries, args.precisions))
+    if "model" in stages:
+        for model_name in args.face_models:
+            results.update(bench_model(frames, boxes, args.batch_sizes, model_name, args.gallery_sizes))
+    if "log" in stages:
+        for writers in args.writers:
+            results.update(bench_logging(writers, args.writes))
+    if "export" in stages:
+        results.update(bench_export(args.export_rows, repeat=5))
+    print_results(results)
+
+    commit = git_commit()
+    record = {
+        "meta": {
+            "commit": commit,
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "cpus": os.cpu_count(),
+            "platform": platform.platform(),
+            "input": args.images or "synthetic",
+            "args": vars(args),
+        },
+        "stages": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{commit}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(record, f, indent=2)
+    print(f"\nSaved {output}")
+
+    # Frame budget: what the camera loop can actually sustain on this machine
+    per_frame = sum(results[k]["p95_ms"] for k in (f"detect.tracked_every_{args.detect_every}", "liveness.engine_1_face") if k in results)
+    if per_frame:
+        print(f"Detection + liveness p95: {per_frame:.1f} ms/frame (~{1000 / per_frame:.0f} FPS sustainable)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
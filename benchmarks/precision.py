@@ -0,0 +1,94 @@
+"""
+Accuracy, memory and latency of the gallery at each storage precision
+(float32 / float16 / int8), checked against float32.
+
+Runs on synthetic embeddings, so no model or camera is needed:
+    python -m benchmarks.precision --identities 10000 --samples 3 --dim 4096
+--dim defaults to the embedding size of the configured model
+($ATTENDANCE_FACE_MODEL, else VGG-Face: 4096; Facenet512 512, SFace 128).
+"""
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from gallery import EmbeddingGallery, PRECISIONS
+from embedding_store import EmbeddingStore
+from face_auth import configured_model, embedding_size
+from benchmarks.search_recall import synthetic_gallery, make_queries
+
+
+def enrolment_entries(identities, samples, noise, seed=2):
+    """Several noisy photos per identity, like real enrolments."""
+    rng = np.random.default_rng(seed)
+    dim = identities.shape[1]
+    entries = []
+    for i, identity in enumerate(identities):
+        shots = identity + noise * rng.standard_normal((samples, dim)).astype(np.float32) / np.sqrt(dim)
+        for s, shot in enumerate(shots):
+            entries.append((f"user{i}", f"user{i}" if s == 0 else f"user{i}__{s + 1}", shot))
+    return entries
+
+
+def run(gallery, probes):
+    """Top-1 (name, distance) per probe and the per-search latencies (ms)."""
+    answers, latencies = [], []
+    for probe in probes:
+        start = time.perf_counter()
+        match = gallery.search(probe, k=1)
+        latencies.append((time.perf_counter() - start) * 1000)
+        answers.append(match[0] if match else (None, 1.0))
+    return answers, np.array(latencies)
+
+
+def store_bytes(gallery, precision):
+    """Size on disk of the EmbeddingStore holding this gallery."""
+    workdir = tempfile.mkdtemp(prefix="bench_store_")
+    try:
+        EmbeddingStore(workdir, precision=precision).compact(gallery, {})
+        return sum(os.path.getsize(os.path.join(workdir, f)) for f in os.listdir(workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--identities", type=int, default=10000)
+    parser.add_argument("--samples", type=int, default=3, help="Enrolment samples per identity")
+    parser.add_argument("--dim", type=int, default=embedding_size(configured_model()) or 512,
+                        help="Embedding size (default: the configured model's)")
+    parser.add_argument("--groups", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.8)
+    parser.add_argument("--threshold", type=float, default=0.4, help="Accept distance used to count flipped decisions")
+    args = parser.parse_args()
+
+    print(f"Building synthetic gallery: {args.identities} x {args.samples} samples x {args.dim}")
+    identities = synthetic_gallery(args.identities, args.dim, args.groups)
+    entries = enrolment_entries(identities, args.samples, args.noise)
+    probes = make_queries(identities, args.queries, args.noise)
+    truth = [f"user{i}" for i in np.random.default_rng(1).integers(len(identities), size=args.queries)] # rows make_queries drew
+
+    reference = None
+    print(f"\n{'precision':<10}{'RAM MB':>9}{'disk MB':>9}{'p50 ms':>9}{'p95 ms':>9}{'recall@1':>10}"
+          f"{'same top-1':>12}{'max |dd|':>10}{'flipped':>9}")
+    for precision in PRECISIONS:
+        gallery = EmbeddingGallery(precision=precision)
+        gallery.load(entries)
+        answers, latencies = run(gallery, probes)
+        if reference is None:
+            reference = answers # float32 is the reference
+        ram = gallery.matrix.nbytes + sum(s.nbytes for s in gallery.samples.values())
+        disk = store_bytes(gallery, precision)
+        recall = np.mean([name == t for (name, _), t in zip(answers, truth)])
+        same = np.mean([a[0] == r[0] for a, r in zip(answers, reference)])
+        error = max(abs(a[1] - r[1]) for a, r in zip(answers, reference))
+        flipped = sum((a[1] <= args.threshold) != (r[1] <= args.threshold) for a, r in zip(answers, reference))
+        print(f"{precision:<10}{ram / 2**20:>9.1f}{disk / 2**20:>9.1f}{np.percentile(latencies, 50):>9.3f}"
+              f"{np.percentile(latencies, 95):>9.3f}{recall:>10.1%}{same:>12.1%}{error:>10.5f}{flipped:>9}")
+        del gallery
+
+
+if __name__ == "__main__":
+    main()
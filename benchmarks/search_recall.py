@@ -0,0 +1,77 @@
+"""
+Recall@1 vs latency of the approximate (IVF) gallery index against exact search.
+
+Runs on synthetic embeddings, so no model or camera is needed:
+    python -m benchmarks.search_recall --identities 100000 --dim 512
+"""
+import argparse
+import time
+import numpy as np
+from gallery import EmbeddingGallery
+from search_index import ExactIndex, IVFIndex
+
+
+def synthetic_gallery(identities, dim, groups, seed=0):
+    """
+    Face embeddings are not uniformly spread, people with similar features
+    cluster together. Mimic that with identities scattered around 'groups' centres.
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((groups, dim)).astype(np.float32)
+    members = rng.integers(groups, size=identities)
+    gallery = centres[members] + 0.6 * rng.standard_normal((identities, dim)).astype(np.float32)
+    return EmbeddingGallery.normalize(gallery)
+
+
+def make_queries(matrix, count, noise, seed=1):
+    """Probes = random enrolled identities seen again with some capture noise."""
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(len(matrix), size=count)
+    probes = matrix[rows] + noise * rng.standard_normal((count, matrix.shape[1])).astype(np.float32) / np.sqrt(matrix.shape[1])
+    return EmbeddingGallery.normalize(probes)
+
+
+def time_index(index, matrix, probes):
+    latencies, answers = [], []
+    for probe in probes:
+        start = time.perf_counter()
+        rows, _ = index.search(matrix, probe, 1)
+        latencies.append((time.perf_counter() - start) * 1000)
+        answers.append(int(rows[0]) if len(rows) else -1)
+    return np.array(answers), np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--identities", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=512, help="Embedding size (VGG-Face is 4096)")
+    parser.add_argument("--groups", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.8)
+    parser.add_argument("--nlist", type=int, default=None, help="IVF cells (default sqrt(N))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    print(f"Building synthetic gallery: {args.identities} x {args.dim}")
+    matrix = synthetic_gallery(args.identities, args.dim, args.groups)
+    probes = make_queries(matrix, args.queries, args.noise)
+
+    truth, exact_ms = time_index(ExactIndex(), matrix, probes)
+
+    ivf = IVFIndex(nlist=args.nlist, min_rows=0)
+    start = time.perf_counter()
+    ivf.fit(matrix)
+    print(f"IVF trained: {len(ivf.centroids)} cells in {time.perf_counter() - start:.1f}s\n")
+
+    print(f"{'backend':<14}{'recall@1':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    print(f"{'exact':<14}{1.0:>10.3f}{np.percentile(exact_ms, 50):>10.2f}{np.percentile(exact_ms, 95):>10.2f}")
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        answers, ivf_ms = time_index(ivf, matrix, probes)
+        recall = float(np.mean(answers == truth))
+        label = f"ivf nprobe={nprobe}"
+        print(f"{label:<14}{recall:>10.3f}{np.percentile(ivf_ms, 50):>10.2f}{np.percentile(ivf_ms, 95):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import threading
+import time
+from collections import deque
+import cv2
+from frame_analysis import FrameAnalysis
+import metrics
+
+
+_END = object() # queued by the capture thread when a video file runs out
+
+
+class FrameQueue:
+    """
+    Bounded, thread-safe frame queue that drops the OLDEST frame when full.
+    A slow consumer then always works on the freshest frames instead of
+    falling further and further behind the camera.
+    """
+    def __init__(self, maxsize=2):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, item):
+        """Adds an item. Returns True if an older item had to be dropped."""
+        with self._cond:
+            dropped = False
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+                dropped = True
+            self._items.append(item)
+            self._cond.notify()
+            return dropped
+
+    def get(self, timeout=None):
+        """Oldest queued item, or None on timeout / after close()."""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def close(self):
+        """Wakes up any waiting consumer so it can exit."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+
+class RateMeter:
+    """Events per second over a sliding window (for FPS readouts)."""
+    def __init__(self, window=2.0):
+        self.window = window
+        self.count = 0
+        self._stamps = deque()
+        self._lock = threading.Lock()
+
+    def tick(self):
+        now = time.monotonic()
+        with self._lock:
+            self.count += 1
+            self._stamps.append(now)
+            while self._stamps and now - self._stamps[0] > self.window:
+                self._stamps.popleft()
+
+    def rate(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._stamps and now - self._stamps[0] > self.window:
+                self._stamps.popleft()
+            if len(self._stamps) < 2:
+                return 0.0
+            return (len(self._stamps) - 1) / max(now - self._stamps[0], 1e-6)
+
+
+class ProcessedFrame:
+    """Result of the worker for one frame. Never mutated after it is published."""
+    def __init__(self, frame, analysis, liveness, display):
+        self.frame = frame # clean BGR frame (safe to identify / register from)
+        self.analysis = analysis # FrameAnalysis (gray, boxes, crops)
+        self.liveness = liveness # [(openness, blinked, live)] per face (see LivenessEngine.update)
+        self.display = display # RGB image ready to blit (None when not rendering)
+
+
+class CapturePipeline:
+    """
+    Producer/consumer camera pipeline for the desktop app:
+    capture thread -> bounded drop-oldest FrameQueue -> processing worker
+    (detection + liveness + drawing) -> latest result slot.
+    The UI thread only blits latest() and never touches the camera or cascades.
+    """
+    def __init__(self, video_capture, face_cascade, liveness_detector, annotate=None, queue_size=2, mirror=True, tracker=None,
+                 render=True, stop_at_end=False):
+        """
+        annotate: optional callback(display_frame, analysis) drawing overlays,
+                  called on the worker thread before the RGB conversion.
+        liveness_detector: a LivenessEngine, updated with every processed frame.
+        tracker: optional FaceTracker; faces are then detected every N frames
+                 and followed in between (only the worker thread touches it).
+        render: False skips the display copy / RGB conversion (headless use).
+        stop_at_end: treat a failed read as the end of the stream (video files)
+                     instead of retrying; 'finished' is set once it is processed.
+        """
+        self.video_capture = video_capture
+        self.face_cascade = face_cascade
+        self.liveness_detector = liveness_detector
+        self.annotate = annotate
+        self.mirror = mirror
+        self.tracker = tracker
+        self.render = render
+        self.stop_at_end = stop_at_end
+        self.finished = threading.Event()
+
+        self.queue = FrameQueue(queue_size)
+        self.capture_rate = RateMeter()
+        self.process_rate = RateMeter()
+
+        self._latest = None
+        self._latest_lock = threading.Lock()
+        self._running = False
+        self._threads = []
+
+    def start(self):
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name="capture", daemon=True),
+            threading.Thread(target=self._process_loop, name="process", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._running = False
+        self.queue.close()
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+
+    def latest(self):
+        """Most recent ProcessedFrame (or None before the first one)."""
+        with self._latest_lock:
+            return self._latest
+
+    def stats(self):
+        stats = {
+            "capture_fps": self.capture_rate.rate(),
+            "process_fps": self.process_rate.rate(),
+            "dropped": self.queue.dropped,
+        }
+        if self.tracker is not None:
+            stats["detect_ratio"] = self.tracker.stats()["detect_ratio"]
+        return stats
+
+    # --- Threads ---
+    def _capture_loop(self):
+        while self._running:
+            ret, frame = self.video_capture.read()
+            if not ret:
+                if self.stop_at_end:
+                    self.queue.put(_END) # end-of-stream marker for the worker
+                    return
+                time.sleep(0.01)
+                continue
+            if self.mirror:
+                frame = cv2.flip(frame, 1) # Mirror effect
+            self.capture_rate.tick()
+            metrics.inc("frames_captured_total")
+            if self.queue.put(frame):
+                metrics.inc("frames_dropped_total")
+
+    def _process_loop(self):
+        while self._running:
+            item = self.queue.get(timeout=0.5)
+            if item is None:
+                continue
+            if item is _END:
+                self.finished.set()
+                return
+            frame = item
+            try:
+                with metrics.timer("frame_process_seconds"):
+                    result = self._process(frame)
+            except Exception as e:
+                print(f"[WARNING] Frame processing error: {e}")
+                metrics.inc("frame_errors_total")
+                continue
+            with self._latest_lock:
+                self._latest = result
+            self.process_rate.tick()
+
+    def _process(self, frame):
+        analysis = FrameAnalysis(frame, self.face_cascade, 1.3, 5, tracker=self.tracker)
+        # Every face's blink state, keyed by its track, in one vectorised update
+        liveness = self.liveness_detector.update(analysis)
+
+        display = None
+        if self.render:
+            display = frame.copy()
+            if self.annotate is not None:
+                self.annotate(display, analysis)
+            display = cv2.cvtColor(display, cv2.COLOR_BGR2RGB) # Needed for Display
+        return ProcessedFrame(frame, analysis, liveness, display)
@@ -0,0 +1,276 @@
+import os
+import json
+import glob
+from contextlib import contextmanager
+import numpy as np
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+from gallery import PRECISIONS, int8_rows, decode, convert
+
+
+class StaleStoreError(RuntimeError):
+    """Another process compacted the store since this one opened it."""
+
+
+class StoreSnapshot:
+    """
+    What EmbeddingStore.open() returns.
+    The compacted part is grouped by user: user i owns sample rows
+    offsets[i]:offsets[i+1] and template row i. 'ops' are the journal entries
+    written since the last compaction, to replay on top of it.
+    Samples keep the store's precision; templates are float32.
+    """
+    def __init__(self, names, templates, offsets, keys, stamps, samples, ops):
+        self.names = names
+        self.templates = templates
+        self.offsets = offsets
+        self.keys = keys
+        self.stamps = stamps
+        self.samples = samples
+        self.ops = ops
+
+    def vector(self, row):
+        """Sample 'row' as a float32 vector."""
+        return decode(self.samples[row:row + 1])[0]
+
+
+class EmbeddingStore:
+    """
+    On-disk gallery: raw float32 / float16 / int8 rows opened with np.memmap
+    (no unpickling, pages shared read-only between processes) plus a small
+    JSON table of user names, sample keys and image stamps.
+
+    Layout of the store directory, for generation g:
+      meta.json         current generation, precision ("dtype"), dim, row counts
+      samples.g.bin     sample rows (compacted rows first, then appended ones)
+      templates.g.bin   one float32 template row per user (the first search pass)
+      table.g.json      names, per-user row offsets, sample keys, stamps
+      journal.g.log     JSON lines: adds (pointing at appended rows) and removals
+
+    Enrolments and deletions only append (one vector + one journal line).
+    compact() rewrites everything as generation g+1 and switches meta.json
+    over atomically; readers that still map generation g keep working.
+    Any number of processes may read. Writers take an exclusive lock on the
+    "lock" file for each append / removal / compaction, and raise
+    StaleStoreError if another process moved the store to a newer generation
+    meanwhile, so nothing lands in a deleted one.
+    """
+    VERSION = 1
+
+    def __init__(self, path, precision="float32", compact_ratio=0.25, compact_min=256, dim=None):
+        """
+        precision: what compact() writes samples at: "float32", "float16" (half
+                   the size) or "int8" (about a quarter, one float32 scale per row).
+                   A store written at another precision is read as it is.
+        compact_ratio / compact_min: needs_compaction() once the journal holds
+        more than max(compact_min, compact_ratio * rows) entries.
+        dim: embedding size of the model, when known; otherwise the first
+             sample appended to an empty store fixes it.
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision {precision!r} (expected one of {', '.join(PRECISIONS)})")
+        self.path = path
+        self.precision = precision
+        self.compact_ratio = compact_ratio
+        self.compact_min = compact_min
+        self.dim = dim
+        self.meta = None
+        self.journal_entries = 0
+
+    # --- Paths ---
+    @property
+    def meta_path(self):
+        return os.path.join(self.path, "meta.json")
+
+    def _file(self, kind, generation):
+        extension = {"samples": "bin", "templates": "bin", "table": "json", "journal": "log"}[kind]
+        return os.path.join(self.path, f"{kind}.{generation}.{extension}")
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock between writing processes (blocks until it is free)."""
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "lock"), "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def exists(self):
+        return os.path.exists(self.meta_path)
+
+    def version(self):
+        """Changes whenever anything was written (cheap: two stat() calls and a tiny read)."""
+        try:
+            meta = os.stat(self.meta_path)
+            generation = self._read_meta()["generation"]
+            journal = os.stat(self._file("journal", generation)).st_size
+        except (OSError, ValueError, KeyError):
+            return None
+        return (meta.st_mtime_ns, generation, journal)
+
+    def _read_meta(self):
+        with open(self.meta_path) as f:
+            return json.load(f)
+
+    @property
+    def stored_precision(self):
+        """Precision of the files on disk (None before open() / compact())."""
+        return self.meta["dtype"] if self.meta else None
+
+    @staticmethod
+    def _layout(precision, dim):
+        """numpy dtype and shape of one row."""
+        if precision == "int8":
+            return int8_rows(dim), ()
+        return np.dtype(precision), (dim,)
+
+    def _map(self, path, precision, dim):
+        """Copy-on-write memmap: shared pages until this process modifies a row."""
+        dtype, shape = self._layout(precision, dim)
+        rows = os.path.getsize(path) // (dtype.itemsize * (dim if shape else 1)) if dim else 0
+        if rows == 0:
+            return np.empty((0,) + shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="c", shape=(rows,) + shape)
+
+    # --- Reading ---
+    def open(self):
+        """Maps the current generation. Returns a StoreSnapshot."""
+        self.meta = meta = self._read_meta()
+        if meta.get("version") != self.VERSION:
+            raise ValueError(f"Unsupported embedding store version {meta.get('version')}")
+        generation, dim, precision = meta["generation"], meta["dim"], meta["dtype"]
+        with open(self._file("table", generation)) as f:
+            table = json.load(f)
+
+        samples = self._map(self._file("samples", generation), precision, dim)
+        # Stores written before templates were kept float32 have them at 'dtype'
+        templates = decode(self._map(self._file("templates", generation), meta.get("templates", precision), dim))
+        ops = []
+        journal_path = self._file("journal", generation)
+        if os.path.exists(journal_path):
+            with open(journal_path) as f:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                    except ValueError:
+                        break # torn last line after a crash
+                    if op["op"] == "add" and op["row"] >= len(samples):
+                        break # the vector never made it to disk
+                    ops.append(op)
+        self.journal_entries = len(ops)
+        return StoreSnapshot(table["names"], templates, table["offsets"], table["keys"], table["stamps"], samples, ops)
+
+    # --- Appending ---
+    def append(self, key, owner, stamp, vector):
+        """
+        Appends one sample: its row to the samples file, then a journal line.
+        vector: a float vector, or a one-row array encoded by gallery.encode().
+        """
+        rows = np.asarray(vector)
+        if not rows.dtype.names:
+            rows = rows.reshape(1, -1)
+        with self._locked(): # row number and journal line must not interleave with another writer
+            meta = self._current_meta()
+            rows = convert(rows, meta["dtype"])
+            dim = rows["values"].shape[1] if rows.dtype.names else rows.shape[1]
+            if meta["dim"] == 0: # first sample of an empty store fixes the size
+                meta["dim"] = dim
+                self._write_meta(meta)
+            if meta["dim"] != dim:
+                raise ValueError(f"Embedding size {dim} does not match the store ({meta['dim']})")
+            with open(self._file("samples", meta["generation"]), "ab") as f:
+                row = f.tell() // rows.nbytes
+                f.truncate(row * rows.nbytes) # drops a row torn by a crash
+                f.write(rows.tobytes())
+            self._journal({"op": "add", "key": key, "owner": owner, "stamp": stamp, "row": row})
+
+    def remove(self, key):
+        with self._locked():
+            self._current_meta()
+            self._journal({"op": "remove", "key": key})
+
+    def _current_meta(self):
+        """
+        meta.json as it is on disk now, provided it is still the generation
+        this process opened. Raises StaleStoreError otherwise (reopen first).
+        """
+        meta = self._read_meta()
+        if self.meta is None or meta["generation"] != self.meta["generation"]:
+            raise StaleStoreError(f"Embedding store {self.path} was rewritten by another process")
+        self.meta = meta # e.g. 'dim' set by another writer's first sample
+        return meta
+
+    def _journal(self, op):
+        with open(self._file("journal", self.meta["generation"]), "a") as f:
+            f.write(json.dumps(op) + "\n")
+        self.journal_entries += 1
+
+    def needs_compaction(self):
+        rows = self.meta["rows"] if self.meta else 0
+        return self.journal_entries > max(self.compact_min, self.compact_ratio * rows)
+
+    # --- Compaction ---
+    def compact(self, gallery, stamps):
+        """
+        Writes the whole gallery as a new generation (grouped by user, journal
+        empty, samples at self.precision) and makes it current. Also used to create the
+        store and to migrate it to another precision.
+        """
+        with self._locked():
+            self._compact(gallery, stamps)
+
+    def _compact(self, gallery, stamps):
+        try:
+            generation = self._read_meta()["generation"] + 1
+        except (OSError, ValueError, KeyError):
+            generation = 1 # new (or unreadable) store
+        dim = gallery.matrix.shape[1] if len(gallery) else ((self.meta and self.meta["dim"]) or self.dim or 0)
+
+        keys, offsets = [], [0]
+        with open(self._file("samples", generation), "wb") as f:
+            for name in gallery.names:
+                f.write(convert(gallery.samples[name], self.precision).tobytes())
+                keys.extend(gallery.sample_keys[name])
+                offsets.append(len(keys))
+        with open(self._file("templates", generation), "wb") as f:
+            if len(gallery):
+                f.write(np.asarray(gallery.matrix, dtype=np.float32).tobytes())
+        with open(self._file("table", generation), "w") as f:
+            json.dump({"names": gallery.names, "offsets": offsets, "keys": keys,
+                       "stamps": [stamps.get(k, 0.0) for k in keys]}, f)
+        open(self._file("journal", generation), "w").close()
+
+        meta = {"version": self.VERSION, "generation": generation, "dtype": self.precision, "templates": "float32",
+                "dim": int(dim), "rows": len(keys), "users": len(gallery)}
+        self._write_meta(meta) # the switch to the new generation
+        self.journal_entries = 0
+        self._cleanup(generation)
+
+    def _write_meta(self, meta):
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.meta_path)
+        self.meta = meta
+
+    def _cleanup(self, current):
+        """Deletes older generations (skipped while another process still maps them on Windows)."""
+        for path in glob.glob(os.path.join(self.path, "*.*.*")):
+            try:
+                if int(os.path.basename(path).split(".")[1]) < current:
+                    os.remove(path)
+            except (ValueError, IndexError, OSError):
+                pass
@@ -1,23 +1,156 @@
 import sqlite3
 import csv
+import gzip
+import sys
+import argparse
+from contextlib import closing
 from datetime import datetime
 
+HEADER = ['ID', 'Name', 'Action', 'Timestamp', 'Date']
+SUMMARY_HEADER = ['Name', 'Date', 'First In', 'Last Out', 'Worked Seconds', 'Punches']
+FORMATS = ("csv", "csv.gz", "parquet", "arrow")
+
+def _build_query(start=None, end=None, name=None, summary=False):
+    """
+    SELECT + COUNT for the requested filters.
+    Rows come back in an order the date and (name, date) indexes already
+    provide, so SQLite streams them without a sort step.
+    summary=True reads the precomputed daily summaries (for payroll) instead
+    of the raw events.
+    """
+    clauses, params = [], []
+    if name:
+        clauses.append("name = ?")
+        params.append(name)
+    if start:
+        clauses.append("date_str >= ?")
+        params.append(start)
+    if end:
+        clauses.append("date_str <= ?")
+        params.append(end)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    if summary:
+        select = f"SELECT name, date_str, first_in, last_out, worked_seconds, punch_count FROM attendance_daily{where} ORDER BY date_str, name"
+        count = f"SELECT COUNT(*) FROM attendance_daily{where}"
+    else:
+        select = f"SELECT id, name, action, timestamp, date_str FROM attendance_logs{where} ORDER BY date_str, id"
+        count = f"SELECT COUNT(*) FROM attendance_logs{where}"
+    return select, count, params
+
+def _infer_format(output):
+    for fmt in ("csv.gz", "parquet", "arrow", "csv"):
+        if output.endswith("." + fmt):
+            return fmt
+    return "csv"
+
+class _CsvWriter:
+    def __init__(self, path, header, compress=False):
+        self.file = gzip.open(path, "wt", newline="") if compress else open(path, "w", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(header)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+class _ArrowWriter:
+    """Parquet / Arrow IPC output, one record batch per chunk (needs pyarrow)."""
+    def __init__(self, path, fmt, summary=False):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise RuntimeError(f"Exporting to {fmt} requires pyarrow (pip install pyarrow)")
+        self.pa = pa
+        if summary:
+            self.schema = pa.schema([
+                ("Name", pa.string()), ("Date", pa.string()), ("First In", pa.string()),
+                ("Last Out", pa.string()), ("Worked Seconds", pa.int64()), ("Punches", pa.int64()),
+            ])
+        else:
+            self.schema = pa.schema([
+                ("ID", pa.int64()), ("Name", pa.string()), ("Action", pa.string()),
+                ("Timestamp", pa.string()), ("Date", pa.string()),
+            ])
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(path, self.schema)
+        else:
+            self.writer = pa.ipc.new_file(path, self.schema)
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        batch = self.pa.record_batch([self.pa.array(col, type=field.type) for col, field in zip(columns, self.schema)], schema=self.schema)
+        self.writer.write_batch(batch)
+
+    def close(self):
+        self.writer.close()
+
+def export_logs(db_name="attendance.db", output=None, fmt=None, start=None, end=None, name=None, chunk_size=5000, progress=True, summary=False):
+    """
+    Streams attendance_logs to a file in constant memory.
+    start / end: inclusive 'YYYY-MM-DD' bounds; name: only this person.
+    fmt: csv, csv.gz, parquet or arrow (inferred from 'output' if omitted).
+    summary: export the daily summaries (first in / last out / worked time) instead.
+    Returns: (output path, rows written)
+    """
+    if output is None:
+        fmt = fmt or "csv"
+        prefix = "exported_summary" if summary else "exported_logs"
+        output = f"{prefix}_{datetime.now().strftime('%Y-%m-%d')}.{fmt}"
+    fmt = fmt or _infer_format(output)
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}', expected one of {', '.join(FORMATS)}")
+
+    # Read-only connection: safe to run next to live kiosks writing the DB
+    conn = sqlite3.connect(f"file:{db_name}?mode=ro", uri=True)
+    written = 0
+    with closing(conn): # also closed when the writer cannot be created (e.g. pyarrow missing)
+        select, count, params = _build_query(start, end, name, summary)
+        total = conn.execute(count, params).fetchone()[0] if progress else None
+
+        if fmt.startswith("csv"):
+            writer = _CsvWriter(output, SUMMARY_HEADER if summary else HEADER, compress=(fmt == "csv.gz"))
+        else:
+            writer = _ArrowWriter(output, fmt, summary)
+        try:
+            cursor = conn.execute(select, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                writer.write(rows)
+                written += len(rows)
+                if progress:
+                    percent = 100.0 * written / total if total else 100.0
+                    print(f"\rExported {written}/{total} rows ({percent:.1f}%)", end="", file=sys.stderr, flush=True)
+        finally:
+            writer.close()
+    if progress:
+        print(file=sys.stderr)
+    return output, written
+
 def export_to_csv(db_name="attendance.db"):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT * FROM attendance_logs")
-    rows = cursor.fetchall()
-    
-    filename = f"exported_logs_{datetime.now().strftime('%Y-%m-%d')}.csv"
-    
-    with open(filename, 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(['ID', 'Name', 'Action', 'Timestamp', 'Date'])
-        writer.writerows(rows)
-    
-    print(f"Successfully exported {len(rows)} records to {filename}")
-    conn.close()
+    filename, count = export_logs(db_name, fmt="csv", progress=False)
+    print(f"Successfully exported {count} records to {filename}")
+    return filename
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export attendance logs (streaming, constant memory).")
+    parser.add_argument("--db", default="attendance.db", help="SQLite database (default: attendance.db)")
+    parser.add_argument("-o", "--output", help="Output file (default: exported_logs_<today>.<format>)")
+    parser.add_argument("-f", "--format", choices=FORMATS, help="Output format (default: from --output extension, else csv)")
+    parser.add_argument("--from", dest="start", help="First day to include (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="end", help="Last day to include (YYYY-MM-DD)")
+    parser.add_argument("--name", help="Only export this person")
+    parser.add_argument("--summary", action="store_true", help="Export daily summaries (first in, last out, worked time) for payroll")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Rows fetched per batch")
+    parser.add_argument("-q", "--quiet", action="store_true", help="No progress output")
+    args = parser.parse_args(argv)
+
+    filename, count = export_logs(args.db, args.output, args.format, args.start, args.end, args.name, args.chunk_size, progress=not args.quiet, summary=args.summary)
+    print(f"Successfully exported {count} records to {filename}")
 
 if __name__ == "__main__":
-    export_to_csv()
+    main()
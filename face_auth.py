@@ -1,129 +1,782 @@
-from deepface import DeepFace
 import cv2
 import os
+import shutil
 import numpy as np
-import pickle
+import threading
+import time
+from functools import partial
+from gallery import EmbeddingGallery, PRECISIONS
+from embedding_store import EmbeddingStore, StaleStoreError
+from search_index import make_index
+import metrics
+
+MODEL_NAME = "VGG-Face" # default; FaceManager(model_name=...) or ATTENDANCE_FACE_MODEL picks another
+# Embedding size (sizes the store, checked at warm-up) and DeepFace's cosine
+# threshold (fallback for old releases) of the models worth considering; any
+# other DeepFace model name works too.
+MODELS = {
+    "VGG-Face": (4096, 0.68),
+    "Facenet512": (512, 0.30),
+    "ArcFace": (512, 0.68),
+    "Facenet": (128, 0.40),
+    "SFace": (128, 0.593),
+}
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+SAMPLE_SEPARATOR = "__"
+MAX_SAMPLES_PER_USER = 10
+# check_existing_face() is a little more lenient than recognition ("same person,
+# different lighting") but never looser than the model's own threshold
+DUPLICATE_THRESHOLD = 0.50
+
+def _deepface():
+    """
+    Imports DeepFace (and with it TensorFlow) on first use only.
+    That import alone takes seconds, so it is kept off the startup path.
+    """
+    from deepface import DeepFace
+    return DeepFace
+
+def _default_threshold(model_name=MODEL_NAME):
+    """DeepFace's own cosine cut-off for the model (moved between releases)."""
+    try:
+        from deepface.modules.verification import find_threshold
+        return find_threshold(model_name, "cosine")
+    except ImportError:
+        pass
+    try:
+        from deepface.commons.distance import findThreshold
+        return findThreshold(model_name, "cosine")
+    except ImportError:
+        return MODELS.get(model_name, MODELS[MODEL_NAME])[1]
+
+def configured_model(model_name=None):
+    """The model FaceManager uses: 'model_name', else $ATTENDANCE_FACE_MODEL, else MODEL_NAME."""
+    return model_name or os.environ.get("ATTENDANCE_FACE_MODEL") or MODEL_NAME
+
+def embedding_size(model_name):
+    """Embedding size of a model listed in MODELS, else None (learnt from its first embedding)."""
+    return MODELS.get(model_name, (None, None))[0]
+
+def model_slug(model_name):
+    """'VGG-Face' -> 'vgg_face', used in file names."""
+    return model_name.lower().replace("-", "_")
+
+class _ForwardNetwork:
+    """
+    Models that are not Keras networks (SFace runs on OpenCV's DNN module)
+    only offer DeepFace's one-face forward(); this gives them the batch call
+    embed_faces() makes.
+    """
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, batch, training=False):
+        return np.stack([np.asarray(self.model.forward(batch[i:i + 1]), dtype=np.float32).reshape(-1) for i in range(len(batch))])
+
+def model_network(model):
+    """The network behind a DeepFace model and its (height, width) input size."""
+    # Newer DeepFace wraps the Keras model in a client object
+    network = getattr(model, "model", model)
+    if not callable(network):
+        network = _ForwardNetwork(model)
+    shape = tuple(model.input_shape)
+    size = shape[1:3] if len(shape) == 4 else shape[:2]
+    return network, size
+
+_EYE_CASCADES = threading.local() # cascades are not thread-safe: one per thread
+
+def _eye_cascade():
+    cascade = getattr(_EYE_CASCADES, "cascade", None)
+    if cascade is None:
+        cascade = _EYE_CASCADES.cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_eye.xml")
+    return cascade
+
+def align_face(face):
+    """
+    Levels the eyes of a BGR face crop, like DeepFace's opencv backend with
+    align=True: the two largest eyes found in the upper half give the roll
+    angle and the crop is rotated about its centre. Returned as-is when two
+    eyes are not found.
+    """
+    h, w = face.shape[:2]
+    gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
+    eyes = _eye_cascade().detectMultiScale(gray[:max(1, h // 2)], scaleFactor=1.1, minNeighbors=10)
+    if len(eyes) < 2:
+        return face
+    eyes = sorted(eyes, key=lambda e: e[2] * e[3], reverse=True)[:2]
+    (lx, ly), (rx, ry) = sorted((x + ew / 2, y + eh / 2) for x, y, ew, eh in eyes)
+    angle = np.degrees(np.arctan2(ry - ly, rx - lx))
+    if abs(angle) > 45: # not a plausible pair of eyes
+        return face
+    rotation = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    return cv2.warpAffine(face, rotation, (w, h))
+
+def preprocess_face(face, size):
+    """
+    Aligns the crop (align_face), then the preprocessing DeepFace applies with
+    detector_backend="skip": BGR in [0, 1], resized keeping aspect ratio and
+    zero-padded to 'size'. Enrolment photos and live probes both go through it.
+    """
+    face = align_face(face)
+    target_h, target_w = size
+    h, w = face.shape[:2]
+    factor = min(target_h / h, target_w / w)
+    resized = cv2.resize(face, (max(1, int(w * factor)), max(1, int(h * factor))))
+    pad_h, pad_w = target_h - resized.shape[0], target_w - resized.shape[1]
+    padded = np.pad(resized, ((pad_h // 2, pad_h - pad_h // 2), (pad_w // 2, pad_w - pad_w // 2), (0, 0)))
+    return padded.astype(np.float32) / 255.0
+
+def embed_faces(network, size, crops):
+    """L2-normalised embeddings of BGR face crops, run through 'network' as one batch."""
+    batch = np.stack([preprocess_face(crop, size) for crop in crops])
+    output = network(batch, training=False)
+    output = output.numpy() if hasattr(output, "numpy") else np.asarray(output)
+    return EmbeddingGallery.normalize(output)
+
+def _is_no_face_error(error):
+    """DeepFace raises a plain ValueError when enforce_detection finds no face."""
+    return isinstance(error, ValueError) and "face could not be detected" in str(error).lower()
+
+def _error_reason(error):
+    return "no_face" if _is_no_face_error(error) else type(error).__name__
 
 class FaceManager:
-    def __init__(self, db_path="data"):
+    # Readiness states
+    COLD = "cold"
+    LOADING = "loading"
+    READY = "ready"
+    FAILED = "failed"
+
+    def __init__(self, db_path="data", search_backend="exact", nprobe=8, lazy=False, warm_up=True, inference_workers=0,
+                 model_name=None, precision=None, scan_photos=True):
+        """
+        model_name: DeepFace model (default: $ATTENDANCE_FACE_MODEL, else VGG-Face).
+                    Lighter ones such as Facenet512 or SFace suit CPU-only kiosks.
+                    Each model keeps its own store; switching re-embeds the photos.
+        precision: how gallery samples are stored and held in memory, "float32",
+                   "float16" or "int8" (default: $ATTENDANCE_EMBEDDING_PRECISION,
+                   else float32). An existing store is converted on load.
+        search_backend: "exact" (brute force) or "ivf" (approximate, for very
+        large galleries). nprobe trades IVF recall for latency.
+        lazy: return immediately and load the model + gallery later (call
+              start_warmup() to do it in the background). Any call that needs
+              them waits until they are ready.
+        warm_up: run one dummy inference after loading so the first real
+                 punch does not pay for graph tracing / kernel setup.
+        inference_workers: > 0 embeds faces in that many worker processes
+                           (see inference_pool.py) instead of in this one.
+        scan_photos: on every load, stat() each enrolment photo to pick up
+                     photos added, edited or deleted by hand. False trusts the
+                     store (enrolments made through this class are always in
+                     it), so startup no longer grows with the number of photos.
+        """
         self.db_path = db_path
         if not os.path.exists(self.db_path):
             os.makedirs(self.db_path)
             
         print(f"[INFO] Face DB at {self.db_path}")
-        
-        # Pre-load the model to ensure weights are downloaded BEFORE the UI starts
+        self.threshold = None
+        self.warm_up = warm_up
+        self.inference_workers = inference_workers
+        self.scan_photos = scan_photos
+        self.model_name = configured_model(model_name)
+        self.precision = precision or os.environ.get("ATTENDANCE_EMBEDDING_PRECISION") or "float32"
+        self._model = None
+        self._pool = None
+
+        # Embeddings are memory-mapped from the store; lookups never read the disk
+        options = {"nprobe": nprobe} if search_backend == "ivf" else {}
+        self.gallery = EmbeddingGallery(index=make_index(search_backend, **options), precision=self.precision)
+        slug = model_slug(self.model_name)
+        # "_aligned": embedded through preprocess_face(); stores older versions wrote
+        # from DeepFace.represent's own crops are not comparable and get replaced
+        self.store = EmbeddingStore(os.path.join(self.db_path, f"store_{slug}_aligned"), precision=self.precision,
+                                    dim=embedding_size(self.model_name))
+        self.stale_store_paths = [os.path.join(self.db_path, f"store_{slug}"), os.path.join(self.db_path, f"embeddings_{slug}.npz")]
+        self.index_path = os.path.join(self.db_path, f"index_{search_backend}_{slug}.npz")
+        self._stamps = {} # sample key -> image mtime the stored embedding was computed from
+        self._store_version = None # store version this process last loaded or wrote
+        self.generation = 0 # bumped on every gallery change (invalidates identity caches)
+        # One FaceManager may be shared by many threads (Streamlit sessions, workers):
+        # gallery reads and writes are serialised, model inference is not.
+        self._lock = threading.RLock()
+        self._face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        self._detect_lock = threading.Lock()
+
+        self.state = self.COLD
+        self.error = None
+        self.load_seconds = None
+        self._ready = threading.Event()
+        self._state_lock = threading.Lock()
+        if not lazy:
+            self.wait_ready()
+
+    # --- Lifecycle ---
+    @property
+    def is_ready(self):
+        return self.state == self.READY
+
+    def start_warmup(self, on_ready=None):
+        """
+        Loads the model and gallery on a background thread.
+        on_ready: optional callback(manager), called from that thread when done
+                  (also on failure; check .state).
+        """
+        if not self._claim_load():
+            if on_ready is not None and self._ready.is_set():
+                on_ready(self)
+            return
+        def run():
+            self._load()
+            if on_ready is not None:
+                on_ready(self)
+        threading.Thread(target=run, name="face-model-warmup", daemon=True).start()
+
+    def wait_ready(self, timeout=None):
+        """
+        Blocks until the model and gallery are loaded (loading them on this
+        thread if nobody started yet). Returns True if ready.
+        """
+        if self._claim_load():
+            self._load()
+        self._ready.wait(timeout)
+        return self.is_ready
+
+    def _claim_load(self):
+        """True for the one caller that has to do the loading."""
+        with self._state_lock:
+            if self.state != self.COLD:
+                return False
+            self.state = self.LOADING
+            return True
+
+    def _load(self):
+        start = time.perf_counter()
+        # Pre-load the model to ensure weights are downloaded BEFORE the first punch
         # This prevents the "Not Responding" freeze on first Punch In
-        print("[INFO] Loading AI Model (VGG-Face)... Please wait...")
+        print(f"[INFO] Loading AI Model ({self.model_name})... Please wait...")
         try:
-            DeepFace.build_model("VGG-Face")
+            self.threshold = _default_threshold(self.model_name)
+            self._model = _deepface().build_model(self.model_name)
             print("[INFO] Model Loaded Successfully.")
+            if self.inference_workers > 0:
+                from inference_pool import InferencePool, load_face_model
+                self._pool = InferencePool(self.inference_workers, model_loader=partial(load_face_model, model_name=self.model_name))
+            with self._lock:
+                self._load_gallery()
+            if self.warm_up:
+                self._warm_up()
+            self.state = self.READY
+        except Exception as e:
+            print(f"[WARNING] Face model failed to load: {e}")
+            self.error = e
+            self.state = self.FAILED
+        self.load_seconds = time.perf_counter() - start
+        print(f"[INFO] Face model {self.state} in {self.load_seconds:.1f}s")
+        self._ready.set()
+
+    def _warm_up(self):
+        """One inference on a blank face so TensorFlow builds its graph now, not on the first punch."""
+        if self._pool is not None:
+            self._pool.warm_up() # every worker loads its own copy of the model
+            return
+        network, (height, width) = self._network()
+        embedding = embed_faces(network, (height, width), [np.zeros((height, width, 3), dtype=np.uint8)])[0]
+        expected = embedding_size(self.model_name)
+        if expected is not None and len(embedding) != expected:
+            raise ValueError(f"{self.model_name} returned {len(embedding)}-d embeddings, expected {expected}")
+
+    def close(self):
+        """Stops the inference worker processes, if any."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    # --- Gallery ---
+    # Each user has one or more sample images: "{name}.jpg" plus optional
+    # extras "{name}__2.jpg", "{name}__3.jpg", ... The file stem is the sample key.
+    def _sample_key(self, name, number=1):
+        return name if number == 1 else f"{name}{SAMPLE_SEPARATOR}{number}"
+
+    def _image_path(self, key):
+        return os.path.join(self.db_path, f"{key}.jpg")
+
+    @staticmethod
+    def _owner(key):
+        """User name a sample key belongs to."""
+        name, sep, number = key.rpartition(SAMPLE_SEPARATOR)
+        return name if sep and number.isdigit() else key
+
+    def _list_images(self):
+        """Returns {sample key: path} for every enrolment image in the DB folder."""
+        images = {}
+        for filename in sorted(os.listdir(self.db_path)):
+            stem, ext = os.path.splitext(filename)
+            if ext.lower() in IMAGE_EXTENSIONS:
+                images[stem] = os.path.join(self.db_path, filename)
+        return images
+
+    def _attach_store(self):
+        """Maps the embedding store into the gallery and replays its journal."""
+        snapshot = self.store.open()
+        self.gallery.attach(snapshot.names, snapshot.templates, snapshot.samples,
+                            snapshot.offsets, snapshot.keys, fit=False)
+        owners = {}
+        for i, name in enumerate(snapshot.names):
+            for key in snapshot.keys[snapshot.offsets[i]:snapshot.offsets[i + 1]]:
+                owners[key] = name
+        self._stamps = dict(zip(snapshot.keys, snapshot.stamps))
+        for op in snapshot.ops:
+            key = op["key"]
+            if op["op"] == "add":
+                self.gallery.add(op["owner"], key, snapshot.vector(op["row"]))
+                owners[key] = op["owner"]
+                self._stamps[key] = op["stamp"]
+            else:
+                self.gallery.remove_sample(owners.pop(key, self._owner(key)), key)
+                self._stamps.pop(key, None)
+
+    def _create_store(self):
+        """
+        First start (or unreadable store): an empty store, which _reconcile()
+        then fills by embedding every photo. Embeddings from older versions
+        were computed differently (see __init__) and are deleted, not imported.
+        """
+        self._stamps = {}
+        self.gallery.load([], fit=False)
+        self.store.compact(self.gallery, self._stamps)
+        for path in self.stale_store_paths:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+            else:
+                continue
+            print(f"[INFO] Removed outdated embeddings {path}; photos are re-embedded.")
+
+    def _migrate_precision(self):
+        """
+        Rewrites the store at the configured precision. Going down (e.g. float32
+        -> int8) converts the stored rows; going up re-embeds every photo, as
+        upcasting would keep the old rounding error forever.
+        """
+        stored = self.store.stored_precision
+        reembed = PRECISIONS.index(self.precision) < PRECISIONS.index(stored)
+        if reembed:
+            self._stamps = {} # every image now looks new to _reconcile()
+        self.store.compact(self.gallery, self._stamps)
+        print(f"[INFO] Embedding store converted from {stored} to {self.precision}" + (", re-embedding photos" if reembed else ""))
+
+    def _reconcile(self, images):
+        """
+        Brings the gallery in line with the images on disk: only new or edited
+        images are embedded, and samples whose image is gone are dropped.
+        Every change is appended to the store. Returns: True if anything changed.
+        """
+        removed = [(name, key) for name in self.gallery.names for key in self.gallery.sample_keys[name] if key not in images]
+        for name, key in removed:
+            self.gallery.remove_sample(name, key)
+            self._stamps.pop(key, None)
+            self.store.remove(key)
+
+        changed = bool(removed)
+        for key, path in images.items():
+            mtime = os.path.getmtime(path)
+            if self._stamps.get(key, -1.0) >= mtime:
+                continue
+            name = self._owner(key)
+            try:
+                embedding = self._represent(path, enforce_detection=False)
+            except Exception as e:
+                print(f"[WARNING] Skipping {path}: {e}")
+                if key in self._stamps and self.gallery.remove_sample(name, key):
+                    self._stamps.pop(key)
+                    self.store.remove(key)
+                    changed = True
+                continue
+            self.gallery.add(name, key, embedding)
+            self._stamps[key] = mtime
+            self.store.append(key, name, mtime, self._sample_vector(name, key))
+            changed = True
+        return changed
+
+    def _sample_vector(self, name, key):
+        """The stored row of one sample (as a one-row array, at the gallery's precision)."""
+        i = self.gallery.sample_keys[name].index(key)
+        return self.gallery.samples[name][i:i + 1]
+
+    def _load_gallery(self):
+        """
+        Maps the persisted embeddings (no copy, no unpickling) and reconciles
+        them with the images on disk.
+        """
+        self._stamps = {}
+        created = True
+        # Journal replay and reconciliation leave the index alone; it is
+        # restored or fitted once, below
+        self.gallery.index_updates = False
+        try:
+            if self.store.exists():
+                try:
+                    self._attach_store()
+                    created = False
+                except Exception as e:
+                    print(f"[WARNING] Embedding store unreadable, rebuilding: {e}")
+            if created:
+                self._create_store()
+            elif self.store.stored_precision != self.precision:
+                self._migrate_precision()
+            changed = created
+            if created or self.scan_photos: # a new store is always filled from the photos
+                changed = self._reconcile(self._list_images()) or created
+        finally:
+            self.gallery.index_updates = True
+        if self.store.needs_compaction():
+            self.store.compact(self.gallery, self._stamps)
+
+        # A trained ANN index is restored as-is when it matches this exact gallery
+        if changed or not self._load_index(self.gallery.names):
+            self.gallery.index.fit(self.gallery.matrix)
+            self._save_index()
+        self._store_version = self.store.version()
+        self.generation += 1
+        print(f"[INFO] Gallery loaded: {len(self.gallery)} user(s).")
+
+    def refresh_if_changed(self):
+        """
+        Reloads the gallery if another process (e.g. the desktop app) enrolled or
+        deleted someone since we last loaded it. Only costs a stat() otherwise.
+        Returns: True if the gallery was reloaded.
+        """
+        if not self.is_ready:
+            return False # the initial load will pick everything up
+        version = self.store.version()
+        if version is None or version == self._store_version:
+            return False
+        with self._lock:
+            if self.store.version() == self._store_version:
+                return False
+            self._load_gallery()
+        return True
+
+    def _load_index(self, names):
+        index = self.gallery.index
+        if not hasattr(index, "load"):
+            return True # Exact search has nothing to train or restore
+        return os.path.exists(self.index_path) and index.load(self.index_path, names)
+
+    def _save_index(self):
+        if hasattr(self.gallery.index, "save"):
+            self.gallery.index.save(self.index_path, self.gallery.names)
+
+    def _persist(self, removed=(), added=()):
+        """
+        Appends a gallery change to the store: one journal line per removed
+        sample key, one vector + journal line per added (name, key). The store
+        is only rewritten once its journal outgrows the compaction threshold.
+        """
+        self.generation += 1
+        try:
+            for key in removed:
+                self.store.remove(key)
+            for name, key in added:
+                self.store.append(key, name, self._stamps.get(key, 0.0), self._sample_vector(name, key))
+            if self.store.needs_compaction():
+                self.store.compact(self.gallery, self._stamps)
+            self._save_index()
+            self._store_version = self.store.version()
+        except StaleStoreError as e:
+            # The photos are already on disk: reloading the newer generation
+            # picks this change up through _reconcile() without losing theirs
+            print(f"[INFO] {e}; reloading it.")
+            try:
+                self._load_gallery()
+            except Exception as e:
+                print(f"[WARNING] Could not reload embeddings: {e}")
+        except Exception as e:
+            print(f"[WARNING] Could not persist embeddings: {e}")
+
+    def _face_crop(self, image, enforce_detection):
+        """
+        The largest face Haar finds in 'image' (BGR array or image path), cut
+        out exactly like live frames are. enforce_detection=False falls back to
+        the whole image when no face is found.
+        """
+        if isinstance(image, str):
+            path, image = image, cv2.imread(image)
+            if image is None:
+                raise ValueError(f"Could not read {path}")
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        with self._detect_lock:
+            faces = self._face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=10)
+        if len(faces) == 0:
+            if enforce_detection:
+                raise ValueError("Face could not be detected in the image.")
+            return image
+        x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+        return image[y:y + h, x:x + w]
+
+    def _represent(self, image, enforce_detection):
+        """
+        Embedding of the largest face in 'image', through the same crop ->
+        align -> batch path as live frames, so gallery and probe distances are
+        comparable (and DeepFace's per-model thresholds apply to both).
+        """
+        with metrics.timer("represent_seconds"):
+            return self._embed_crops([self._face_crop(image, enforce_detection)])[0]
+
+    # --- Batched embedding of pre-detected faces ---
+    def _network(self):
+        """The underlying Keras model and its (height, width) input size."""
+        if self._model is None:
+            self._model = _deepface().build_model(self.model_name)
+        return model_network(self._model)
+
+    def _embed_crops(self, crops):
+        """Embeds already-cropped BGR faces as a single model batch (or on the worker pool)."""
+        metrics.inc("embeddings_computed_total", len(crops), path="batch")
+        with metrics.timer("embed_batch_seconds"):
+            if self._pool is not None:
+                return self._pool.embed(crops)
+            network, size = self._network()
+            return embed_faces(network, size, crops)
+
+    @staticmethod
+    def _crop(frame, box):
+        (x, y, w, h) = [int(v) for v in box]
+        x, y = max(0, x), max(0, y)
+        return frame[y:y+h, x:x+w]
+
+    def identify_faces(self, frame, boxes):
+        """
+        Identifies every face in 'frame' in one pass.
+        boxes: (x, y, w, h) face boxes already found by the caller's detector.
+        Returns: [(name, distance)] in the same order as 'boxes'.
+        """
+        return self.identify_crops([self._crop(frame, box) for box in boxes])
+
+    def identify_analysis(self, analysis, cache=None, now=None, identify=None, return_cached=False):
+        """
+        Identifies the faces of a FrameAnalysis using its cached crops (no re-detection).
+        cache: optional IdentityCache; faces whose track already has a recent
+               confident identity are not embedded again.
+        now: clock for the cache (default: time.monotonic(); replays pass video time).
+        identify: what identifies the remaining crops (default: identify_crops),
+                  e.g. a batcher shared between cameras.
+        return_cached: also return, per face, whether it came from the cache.
+        Returns: [(name, distance)] per face (and the cached flags).
+        """
+        identify = identify or self.identify_crops
+        if cache is None:
+            results = identify(analysis.crops()) if analysis.faces else []
+            return (results, [False] * len(results)) if return_cached else results
+
+        cache.sync(self.generation)
+        # Tracker ids when the pipeline has a tracker, else the cache matches boxes itself
+        track_ids, results = cache.lookup(analysis.faces, now=now, track_ids=analysis.track_ids)
+        cached = [result is not None for result in results]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            fresh = identify([analysis.crop(i) for i in missing])
+            for i, result in zip(missing, fresh):
+                results[i] = result
+                cache.update(track_ids[i], result, now=now)
+        return (results, cached) if return_cached else results
+
+    def identify_crops(self, crops):
+        """
+        Identifies already-cropped BGR faces.
+        All crops are embedded as one batch (no second face detection) and
+        matched with a single matrix-matrix product against the gallery.
+        Returns: [(name, distance)] in the same order as 'crops'.
+        """
+        results = [("Unknown", 0.0)] * len(crops)
+        valid = [i for i, crop in enumerate(crops) if crop.size > 0]
+        if not valid or not self.wait_ready() or len(self.gallery) == 0:
+            return results
+        try:
+            embeddings = self._embed_crops([crops[i] for i in valid])
+            with self._lock:
+                matches = self.gallery.search_many(embeddings, k=1)
         except Exception as e:
-            print(f"[WARNING] Model load deferred: {e}")
+            print(f"[WARNING] Batch identification failed: {e}")
+            metrics.inc("identify_errors_total", stage="identify_crops")
+            return results
+
+        for i, match in zip(valid, matches):
+            if match:
+                metrics.observe("match_distance", match[0][1])
+            if match and match[0][1] <= self.threshold:
+                results[i] = match[0]
+            metrics.inc("identifications_total", result="known" if results[i][0] != "Unknown" else "unknown")
+        return results
+
+    def _match(self, image, threshold, enforce_detection):
+        """Returns (name, distance) of the closest user under 'threshold', else None."""
+        if not self.wait_ready() or len(self.gallery) == 0:
+            return None
+        embedding = self._represent(image, enforce_detection=enforce_detection)
+        with self._lock, metrics.timer("match_seconds"):
+            matches = self.gallery.search(embedding, k=1)
+        if matches:
+            metrics.observe("match_distance", matches[0][1])
+        if matches and matches[0][1] <= threshold:
+            return matches[0]
+        return None
 
     def check_existing_face(self, image):
         """
         Checks if the face in 'image' already exists in the DB under any name.
-        Returns: (Name, Distance) if found, else None
+        Returns: Name if found, else None
         """
         try:
-            if not os.listdir(self.db_path):
+            if not self.wait_ready():
                 return None
-
-            # Search for the face
-            # Threshold 0.50 is slightly more lenient to catch "Same person, different lighting"
-            dfs = DeepFace.find(img_path=image, db_path=self.db_path, model_name="VGG-Face", enforce_detection=True, silent=True, threshold=0.50)
-            
-            if len(dfs) > 0:
-                df = dfs[0]
-                if not df.empty:
-                    # Found a match
-                    full_path = df.iloc[0]["identity"]
-                    filename = os.path.basename(full_path)
-                    existing_name = os.path.splitext(filename)[0]
-                    # Clean up name (remove numbers if we handle multiple pics per user later)
-                    return existing_name
+            threshold = min(DUPLICATE_THRESHOLD, self.threshold)
+            match = self._match(image, threshold=threshold, enforce_detection=True)
+            if match:
+                return match[0]
             return None
         except Exception as e:
+            # Usually "no face detected" (enforce_detection); anything else is worth seeing
+            if not _is_no_face_error(e):
+                print(f"[WARNING] Duplicate-face check failed: {e}")
+            metrics.inc("identify_errors_total", stage="check_existing_face", reason=_error_reason(e))
             return None
 
+    def _remove_user_files(self, name):
+        """Deletes every sample image of 'name' and forgets their stamps."""
+        removed = 0
+        for key in list(self.gallery.sample_keys.get(name, [])) or [name]:
+            filepath = self._image_path(key)
+            self._stamps.pop(key, None)
+            if os.path.exists(filepath):
+                os.remove(filepath)
+                removed += 1
+        return removed
+
+    def _enrol_embedding(self, image, stage):
+        """
+        Embedding of the face in an enrolment photo.
+        Returns: (embedding, None), or (None, message) when there is no face or the model failed.
+        """
+        try:
+            return self._represent(image, enforce_detection=True), None
+        except Exception as e:
+            metrics.inc("identify_errors_total", stage=stage, reason=_error_reason(e))
+            if _is_no_face_error(e):
+                return None, "No face detected."
+            print(f"[WARNING] Enrolment embedding failed: {e}")
+            return None, f"Could not compute the face embedding: {e}"
+
     def register_face(self, image, name, old_name=None):
         """
         Registers a new face. 
-        If old_name is provided, it deletes the previous image (renaming the user).
+        If old_name is provided, it deletes the previous images (renaming the user).
+        Registering an existing name replaces all of that user's samples with this photo;
+        use add_face_sample() to keep the old ones.
         """
-        try:
-            DeepFace.extract_faces(img_path=image, enforce_detection=True)
-        except:
-             return False, "No face detected."
+        if not self.wait_ready():
+            return False, "Face model is not available."
+        embedding, error = self._enrol_embedding(image, "register_face")
+        if embedding is None:
+            return False, error
         
         # Validation: Don't allow same name overwrite if we passed it as old_name (edge case)
         if old_name and old_name.lower() == name.lower():
             old_name = None # Treat as update
 
-        # Delete old file if this is a rename operation
-        if old_name:
-            old_filename = f"{old_name}.jpg"
-            old_filepath = os.path.join(self.db_path, old_filename)
-            if os.path.exists(old_filepath):
+        with self._lock:
+            removed = list(self.gallery.sample_keys.get(name, []))
+            # Delete old files if this is a rename operation
+            if old_name:
+                removed += self.gallery.sample_keys.get(old_name, [])
                 try:
-                    os.remove(old_filepath)
-                    print(f"[INFO] Deleted old record: {old_filename}")
+                    if self._remove_user_files(old_name):
+                        print(f"[INFO] Deleted old record: {old_name}")
                 except Exception as e:
                     print(f"[WARNING] Could not delete old file: {e}")
+                self.gallery.remove(old_name)
 
-        # Save new image
-        filename = f"{name}.jpg"
-        filepath = os.path.join(self.db_path, filename)
-        
-        # If the file for THIS name exists, we are simply updating that user's photo.
-        cv2.imwrite(filepath, image)
-        
-        # Remove pickl to force refresh
-        pkl_path = os.path.join(self.db_path, "representations_vgg_face.pkl")
-        if os.path.exists(pkl_path):
-            os.remove(pkl_path)
+            # If THIS name exists, we are simply updating that user's photo.
+            try:
+                self._remove_user_files(name)
+            except Exception as e:
+                print(f"[WARNING] Could not delete old samples: {e}")
+            self.gallery.remove(name)
+
+            # Save new image
+            filepath = self._image_path(name)
+            cv2.imwrite(filepath, image)
+
+            # Only this user's rows change; everyone else keeps their embeddings
+            self.gallery.add(name, name, embedding)
+            self._stamps[name] = os.path.getmtime(filepath)
+            self._persist(removed=removed, added=[(name, name)])
             
-        return True, f"User {name} registered."
+            return True, f"User {name} registered."
+
+    def add_face_sample(self, image, name):
+        """
+        Adds another enrolment photo to an existing user (different lighting,
+        glasses on/off...). Their template is re-aggregated from all samples.
+        """
+        if not self.wait_ready():
+            return False, "Face model is not available."
+        if name not in self.gallery:
+            return self.register_face(image, name)
+
+        if len(self.gallery.sample_keys[name]) >= MAX_SAMPLES_PER_USER:
+            return False, f"{name} already has {MAX_SAMPLES_PER_USER} samples."
+        embedding, error = self._enrol_embedding(image, "add_face_sample")
+        if embedding is None:
+            return False, error
+
+        with self._lock:
+            if name not in self.gallery: # deleted meanwhile
+                return False, "User not found."
+            keys = self.gallery.sample_keys[name]
+            number = 2
+            while self._sample_key(name, number) in keys or os.path.exists(self._image_path(self._sample_key(name, number))):
+                number += 1
+            key = self._sample_key(name, number)
+            filepath = self._image_path(key)
+            cv2.imwrite(filepath, image)
+
+            self.gallery.add(name, key, embedding)
+            self._stamps[key] = os.path.getmtime(filepath)
+            self._persist(added=[(name, key)])
+            return True, f"Added sample {len(keys)} for {name}."
 
     def identify_face(self, image):
         """
         Identifies a face.
         """
         try:
-            if not os.listdir(self.db_path):
+            if not self.wait_ready():
                 return "Unknown", 0.0
-
-            dfs = DeepFace.find(img_path=image, db_path=self.db_path, model_name="VGG-Face", enforce_detection=False, silent=True)
-            
-            if len(dfs) > 0:
-                df = dfs[0]
-                if not df.empty:
-                    full_path = df.iloc[0]["identity"]
-                    filename = os.path.basename(full_path)
-                    name = os.path.splitext(filename)[0]
-                    distance = df.iloc[0]["distance"]
-                    return name, distance
-            
+            match = self._match(image, threshold=self.threshold, enforce_detection=False)
+            if match:
+                return match
             return "Unknown", 0.0
-        except:
+        except Exception as e:
+            print(f"[WARNING] Identification failed: {e}")
+            metrics.inc("identify_errors_total", stage="identify_face", reason=_error_reason(e))
             return "Unknown", 0.0
 
     def delete_user(self, name):
         """
-        Deletes a user's face record.
+        Deletes a user's face record (all of their samples).
         """
-        filename = f"{name}.jpg"
-        filepath = os.path.join(self.db_path, filename)
-        
-        if os.path.exists(filepath):
-            try:
-                os.remove(filepath)
-                # Force cache clear
-                pkl_path = os.path.join(self.db_path, "representations_vgg_face.pkl")
-                if os.path.exists(pkl_path):
-                    os.remove(pkl_path)
-                return True, f"Deleted {name}."
-            except Exception as e:
-                return False, str(e)
+        self.wait_ready()
+        with self._lock:
+            if name in self.gallery or os.path.exists(self._image_path(name)):
+                try:
+                    removed = list(self.gallery.sample_keys.get(name, []))
+                    self._remove_user_files(name)
+                    self.gallery.remove(name)
+                    self._persist(removed=removed)
+                    return True, f"Deleted {name}."
+                except Exception as e:
+                    return False, str(e)
         return False, "User not found."
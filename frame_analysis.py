@@ -0,0 +1,59 @@
+import cv2
+
+
+class FrameAnalysis:
+    """
+    Everything derived from one camera frame, computed once and shared by
+    drawing, liveness and identification instead of each redoing it:
+    - gray: the grayscale frame (Haar detection and eye checks both need it)
+    - faces: Haar face boxes (x, y, w, h), largest (closest) first
+    - crops: BGR face crops, cut lazily and cached, ready for the embedding model
+    - track_ids: stable per-person ids, parallel to faces (None without a tracker)
+    """
+    def __init__(self, frame, face_cascade, scale_factor=1.3, min_neighbors=5, faces=None, tracker=None):
+        """
+        faces: pass boxes from another source to skip detection.
+        tracker: a FaceTracker; it decides when to run the cascade and assigns track ids.
+        """
+        self.frame = frame
+        self.gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        track_ids = None
+        if faces is None and tracker is not None:
+            faces, track_ids = tracker.update(frame, self.gray)
+        elif faces is None:
+            faces = face_cascade.detectMultiScale(self.gray, scale_factor, min_neighbors)
+        faces = [tuple(int(v) for v in f) for f in faces]
+        order = sorted(range(len(faces)), key=lambda i: faces[i][2]*faces[i][3], reverse=True)
+        self.faces = [faces[i] for i in order]
+        self.track_ids = [track_ids[i] for i in order] if track_ids is not None else None
+        self._crops = {}
+        self._gray_crops = {}
+
+    def __len__(self):
+        return len(self.faces)
+
+    @property
+    def largest(self):
+        """Box of the closest face, or None if nobody is in frame."""
+        return self.faces[0] if self.faces else None
+
+    @staticmethod
+    def _cut(image, box):
+        (x, y, w, h) = box
+        x, y = max(0, x), max(0, y)
+        return image[y:y+h, x:x+w]
+
+    def crop(self, i):
+        """BGR crop of face i (a view into the frame, so copy before drawing on it)."""
+        if i not in self._crops:
+            self._crops[i] = self._cut(self.frame, self.faces[i])
+        return self._crops[i]
+
+    def gray_crop(self, i):
+        """Grayscale crop of face i, for eye/liveness checks."""
+        if i not in self._gray_crops:
+            self._gray_crops[i] = self._cut(self.gray, self.faces[i])
+        return self._gray_crops[i]
+
+    def crops(self):
+        return [self.crop(i) for i in range(len(self.faces))]
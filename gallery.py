@@ -0,0 +1,235 @@
+import numpy as np
+from search_index import ExactIndex
+
+PRECISIONS = ("float32", "float16", "int8") # most to least precise
+
+
+def int8_rows(dim):
+    """Record type of one int8 sample: its own scale, then the quantised values."""
+    return np.dtype([("scale", "<f4"), ("values", "i1", (dim,))])
+
+
+def precision_of(rows):
+    return "int8" if rows.dtype.names else rows.dtype.name
+
+
+def encode(vectors, precision="float32"):
+    """
+    Float rows -> rows kept at 'precision'.
+    int8 rows are scaled individually so each uses the full [-127, 127] range.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if precision != "int8":
+        return vectors.astype(precision, copy=False)
+    scale = np.abs(vectors).max(axis=1) / 127.0 if vectors.size else np.ones(len(vectors), np.float32)
+    scale[scale == 0] = 1.0
+    rows = np.empty(len(vectors), dtype=int8_rows(vectors.shape[1]))
+    rows["scale"] = scale
+    rows["values"] = np.rint(vectors / scale[:, None])
+    return rows
+
+
+def decode(rows):
+    """Rows from encode() back to float32 (no copy if they already are)."""
+    if rows.dtype.names:
+        return rows["values"].astype(np.float32) * rows["scale"][:, None]
+    return np.asarray(rows, dtype=np.float32)
+
+
+def convert(rows, precision):
+    return rows if precision_of(rows) == precision else encode(decode(rows), precision)
+
+
+class EmbeddingGallery:
+    """
+    In-memory face gallery.
+    Every user holds one or more enrolment samples (e.g. different lighting,
+    glasses on/off) plus one aggregate template computed from them.
+    The templates live in one contiguous float32 matrix (one row per user) so a
+    probe is matched against everyone with a single matrix-vector product; only
+    the closest few users are then re-ranked against their individual samples.
+    Rows are L2-normalised, so cosine distance is simply 1 - (matrix @ probe).
+    Samples, the bulk of the memory, can be kept at a reduced precision
+    (float16, or int8 with a per-row scale); templates stay float32.
+    The template search is delegated to a pluggable index (see search_index.py),
+    which is kept in sync with every add/remove.
+    """
+    def __init__(self, index=None, aggregate="mean", rerank_k=5, precision="float32"):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision {precision!r} (expected one of {', '.join(PRECISIONS)})")
+        self.names = []
+        self.matrix = np.empty((0, 0), dtype=np.float32) # templates
+        self._rows = {} # name -> row index
+        self.samples = {} # name -> n_samples rows, encoded at 'precision'
+        self.sample_keys = {} # name -> [key per sample row]
+        self.index = index or ExactIndex()
+        self.aggregate = aggregate
+        self.rerank_k = rerank_k
+        self.precision = precision
+        self.index_updates = True # False while replaying many changes; fit() the index afterwards
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._rows
+
+    @staticmethod
+    def normalize(vectors):
+        """L2-normalises each row of a 2D float array."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _template(self, samples):
+        """Aggregates a user's samples into the single vector used for the first pass."""
+        samples = decode(samples)
+        if len(samples) == 1 or self.aggregate == "mean":
+            return self.normalize(samples.mean(axis=0))[0]
+        # Medoid: the real sample closest to all the others (robust to one bad photo)
+        similarity = samples @ samples.T
+        return samples[int(np.argmax(similarity.sum(axis=1)))]
+
+    def load(self, entries, templates=None, fit=True):
+        """
+        Replaces the whole gallery in one go (used at startup).
+        entries: iterable of (name, sample key, embedding).
+        templates: optional {name: template} precomputed by a previous save();
+                   users missing from it get their template recomputed.
+        fit=False skips training the index, for when it was restored from disk.
+        """
+        grouped = {}
+        for name, key, embedding in entries:
+            keys, embeddings = grouped.setdefault(name, ([], []))
+            keys.append(key)
+            embeddings.append(embedding)
+
+        templates = templates or {}
+        self.names = list(grouped)
+        self.samples, self.sample_keys, rows = {}, {}, []
+        for name, (keys, embeddings) in grouped.items():
+            self.sample_keys[name] = keys
+            self.samples[name] = encode(self.normalize(embeddings), self.precision)
+            template = templates.get(name)
+            rows.append(template if template is not None else self._template(self.samples[name]))
+
+        if self.names:
+            self.matrix = np.ascontiguousarray(self.normalize(rows))
+        else:
+            self.matrix = np.empty((0, 0), dtype=np.float32)
+        self._rows = {name: i for i, name in enumerate(self.names)}
+        if fit:
+            self.index.fit(self.matrix)
+
+    def attach(self, names, templates, samples, offsets, keys, fit=True):
+        """
+        Adopts arrays laid out by EmbeddingStore without copying them (e.g.
+        memory-mapped): user i is names[i], template row i and sample rows
+        offsets[i]:offsets[i+1]. Rows must already be L2-normalised.
+        Samples stored at another precision are converted (i.e. copied).
+        """
+        self.names = list(names)
+        templates = np.asarray(templates, dtype=np.float32)
+        samples = convert(samples, self.precision)
+        self.matrix = templates if len(self.names) else np.empty((0, 0), dtype=np.float32)
+        self.samples, self.sample_keys = {}, {}
+        for i, name in enumerate(self.names):
+            start, end = offsets[i], offsets[i + 1]
+            self.samples[name] = samples[start:end]
+            self.sample_keys[name] = list(keys[start:end])
+        self._rows = {name: i for i, name in enumerate(self.names)}
+        if fit:
+            self.index.fit(self.matrix)
+
+    def add(self, name, key, embedding):
+        """
+        Adds one enrolment sample to 'name' (replacing the sample with the same
+        key, if any) and refreshes that user's template.
+        """
+        vector = encode(self.normalize(embedding), self.precision)
+        keys = self.sample_keys.setdefault(name, [])
+        if key in keys:
+            self.samples[name][keys.index(key)] = vector[0]
+        elif name in self.samples:
+            keys.append(key)
+            self.samples[name] = np.concatenate([self.samples[name], vector])
+        else:
+            keys.append(key)
+            self.samples[name] = vector
+        self._set_template(name)
+
+    def _set_template(self, name):
+        template = self._template(self.samples[name])
+        if name in self._rows:
+            row = self._rows[name]
+            self.matrix[row] = template
+        else:
+            if not self.names:
+                self.matrix = np.ascontiguousarray(template.reshape(1, -1))
+            else:
+                self.matrix = np.vstack([self.matrix, template])
+            row = len(self.names)
+            self._rows[name] = row
+            self.names.append(name)
+        if self.index_updates:
+            self.index.added(self.matrix, row)
+
+    def remove_sample(self, name, key):
+        """Drops a single sample; the user goes away with their last one."""
+        keys = self.sample_keys.get(name, [])
+        if key not in keys:
+            return False
+        if len(keys) == 1:
+            return self.remove(name)
+        i = keys.index(key)
+        del keys[i]
+        self.samples[name] = np.delete(self.samples[name], i, axis=0)
+        self._set_template(name)
+        return True
+
+    def remove(self, name):
+        """Drops a user and all their samples. Returns False if they were not enrolled."""
+        row = self._rows.get(name)
+        if row is None:
+            return False
+        self.matrix = np.delete(self.matrix, row, axis=0)
+        del self.names[row]
+        self._rows = {n: i for i, n in enumerate(self.names)}
+        del self.samples[name]
+        del self.sample_keys[name]
+        if self.index_updates:
+            self.index.removed(row)
+        return True
+
+    def search(self, embedding, k=1):
+        """
+        Nearest users to 'embedding' by cosine distance.
+        Templates narrow the gallery down to rerank_k candidates, which are then
+        scored by their closest individual sample.
+        Returns: list of (name, distance), closest first.
+        """
+        return self.search_many(embedding, k)[0]
+
+    def search_many(self, embeddings, k=1):
+        """
+        Batched search for several probes at once (e.g. every face in a frame).
+        The template pass is a single matrix-matrix product.
+        Returns: one list of (name, distance) per probe, closest first.
+        """
+        probes = self.normalize(embeddings)
+        if not self.names:
+            return [[] for _ in probes]
+        candidates = self.index.search_many(self.matrix, probes, max(k, self.rerank_k))
+
+        results = []
+        for probe, (rows, _) in zip(probes, candidates):
+            scored = []
+            for row in rows:
+                name = self.names[row]
+                scored.append((name, float(1.0 - np.max(decode(self.samples[name]) @ probe))))
+            scored.sort(key=lambda match: match[1])
+            results.append(scored[:k])
+        return results
@@ -0,0 +1,156 @@
+import time
+import threading
+from collections import OrderedDict
+import metrics
+
+
+def iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+class _Track:
+    __slots__ = ("box", "name", "distance", "identified_at", "seen_at")
+
+    def __init__(self, box, now):
+        self.box = box
+        self.name = None # confident identity, or None until one is known
+        self.distance = 0.0
+        self.identified_at = 0.0
+        self.seen_at = now
+
+
+class IdentityCache:
+    """
+    Short-lived, track-keyed identity cache for live video.
+    A face box that overlaps (IoU) a box from the previous frames continues
+    that track; once a track has a confident identity it is reused instead of
+    running the CNN again, until
+    - the track breaks (no overlapping box for 'ttl' seconds),
+    - 'reverify_interval' seconds pass (the face is embedded again to confirm), or
+    - the gallery changes (enrolment / deletion).
+    Unknown faces are never cached, so a newly registered person is picked up
+    on the next check. Least recently seen tracks are evicted past 'max_tracks'.
+    """
+    def __init__(self, iou_threshold=0.4, ttl=2.0, reverify_interval=5.0, max_tracks=64, max_distance=None):
+        """
+        max_distance: only cache matches at least this close (None = any match
+                      under the recognition threshold).
+        """
+        self.iou_threshold = iou_threshold
+        self.ttl = ttl
+        self.reverify_interval = reverify_interval
+        self.max_tracks = max_tracks
+        self.max_distance = max_distance
+
+        self.hits = 0
+        self.misses = 0
+        self._tracks = OrderedDict() # track id -> _Track, least recently seen first
+        self._next_id = 1
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def clear(self):
+        with self._lock:
+            self._tracks.clear()
+
+    def sync(self, generation):
+        """Drops every cached identity when the gallery 'generation' changed."""
+        with self._lock:
+            if generation != self._generation:
+                self._generation = generation
+                self._tracks.clear()
+
+    def lookup(self, boxes, now=None, track_ids=None):
+        """
+        Associates 'boxes' with tracks and returns (track ids, cached results):
+        one (name, distance) per box, or None where the face must be identified.
+        track_ids: ids from an external tracker; when given, boxes are not
+                   matched by IoU.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._expire(now)
+            if track_ids is None:
+                track_ids = self._associate(boxes, now)
+            results = []
+            for track_id, box in zip(track_ids, boxes):
+                track = self._tracks.get(track_id)
+                if track is None:
+                    track = self._tracks[track_id] = _Track(box, now)
+                track.box, track.seen_at = tuple(box), now
+                self._tracks.move_to_end(track_id)
+                if track.name is not None and now - track.identified_at < self.reverify_interval:
+                    self.hits += 1
+                    metrics.inc("identity_cache_hits_total")
+                    results.append((track.name, track.distance))
+                else:
+                    self.misses += 1
+                    metrics.inc("identity_cache_misses_total")
+                    results.append(None)
+            self._evict()
+            return track_ids, results
+
+    def update(self, track_id, result, now=None):
+        """Stores a fresh identification for a track (only confident ones are kept)."""
+        now = time.monotonic() if now is None else now
+        name, distance = result
+        with self._lock:
+            track = self._tracks.get(track_id)
+            if track is None:
+                return
+            if name == "Unknown" or (self.max_distance is not None and distance > self.max_distance):
+                track.name = None # re-check on the next frame
+                return
+            track.name, track.distance, track.identified_at = name, distance, now
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "tracks": len(self._tracks),
+        }
+
+    # --- Internals (lock held) ---
+    def _expire(self, now):
+        while self._tracks:
+            track_id, track = next(iter(self._tracks.items()))
+            if now - track.seen_at <= self.ttl:
+                break
+            del self._tracks[track_id]
+
+    def _associate(self, boxes, now):
+        """Greedy IoU matching: each track continues at most one box."""
+        pairs = []
+        for i, box in enumerate(boxes):
+            for track_id, track in self._tracks.items():
+                overlap = iou(box, track.box)
+                if overlap >= self.iou_threshold:
+                    pairs.append((overlap, i, track_id))
+        pairs.sort(reverse=True)
+
+        ids, used = [None] * len(boxes), set()
+        for _, i, track_id in pairs:
+            if ids[i] is None and track_id not in used:
+                ids[i] = track_id
+                used.add(track_id)
+        for i in range(len(ids)):
+            if ids[i] is None:
+                ids[i] = self._next_id
+                self._next_id += 1
+        return ids
+
+    def _evict(self):
+        while len(self._tracks) > self.max_tracks:
+            self._tracks.popitem(last=False)
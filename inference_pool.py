@@ -0,0 +1,163 @@
+import os
+import math
+import queue
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+# --- Worker process side ---
+# Set once per worker by _init_worker
+_NETWORK = None
+_SIZE = None
+_ATTACHED = {} # shared memory name -> SharedMemory, attached once per worker
+
+
+def load_face_model(threads, model_name=None):
+    """Default model loader: the DeepFace model, limited to 'threads' CPU threads."""
+    import cv2
+    cv2.setNumThreads(1) # parallelism comes from the processes
+    try:
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except Exception:
+        pass
+    from face_auth import _deepface, MODEL_NAME, model_network
+    return model_network(_deepface().build_model(model_name or MODEL_NAME))
+
+
+def _init_worker(model_loader, threads):
+    global _NETWORK, _SIZE
+    _NETWORK, _SIZE = model_loader(threads)
+
+
+def _attach(name):
+    shm = _ATTACHED.get(name)
+    if shm is None:
+        shm = _ATTACHED[name] = shared_memory.SharedMemory(name=name)
+    return shm
+
+
+def _embed_chunk(shm_name, layout, reused=True):
+    """
+    Embeds the crops stored in shared memory block 'shm_name' at 'layout' [(offset, shape)].
+    reused=False: one-off block, detached again right after use.
+    """
+    from face_auth import embed_faces
+    shm = _attach(shm_name) if reused else shared_memory.SharedMemory(name=shm_name)
+    crops = [np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset) for offset, shape in layout]
+    try:
+        return embed_faces(_NETWORK, _SIZE, crops)
+    finally:
+        del crops # release the views before the block can be closed
+        if not reused:
+            shm.close()
+
+
+def _ping():
+    return os.getpid()
+
+
+# --- Parent side ---
+class InferencePool:
+    """
+    Embeds face crops in a pool of worker processes, each holding its own copy
+    of the model, so pre/post-processing and inference are not serialised by
+    the GIL of the camera/UI process.
+    Crops are copied once into a reusable shared memory block and read there by
+    the worker (no pickling of image arrays); only the small embedding matrix
+    comes back. A batch larger than 'min_chunk' faces is split across workers.
+    """
+    def __init__(self, workers=None, slot_bytes=16 * 1024 * 1024, min_chunk=4, model_loader=load_face_model, threads_per_worker=None):
+        """
+        workers: number of processes (default: CPU cores // 2).
+        slot_bytes: size of each shared memory block; bigger requests get a one-off block.
+        model_loader: picklable callable(threads) -> (network, (height, width)), run once per worker.
+        """
+        cores = os.cpu_count() or 1
+        self.workers = workers or max(1, cores // 2)
+        self.min_chunk = min_chunk
+        self.slot_bytes = slot_bytes
+        threads = threads_per_worker or max(1, cores // self.workers)
+
+        # TensorFlow is not fork-safe: workers always start from a fresh interpreter
+        context = multiprocessing.get_context("spawn")
+        self._executor = ProcessPoolExecutor(self.workers, mp_context=context,
+                                             initializer=_init_worker, initargs=(model_loader, threads))
+        self._slots = queue.Queue()
+        self._owned = []
+        for _ in range(self.workers * 2):
+            shm = shared_memory.SharedMemory(create=True, size=slot_bytes)
+            self._owned.append(shm)
+            self._slots.put(shm)
+        self.tasks = 0
+        print(f"[INFO] Inference pool: {self.workers} worker process(es), {threads} thread(s) each")
+
+    def warm_up(self):
+        """Starts every worker (each loads the model) and waits until they answered."""
+        pids = {f.result() for f in [self._executor.submit(_ping) for _ in range(self.workers * 2)]}
+        print(f"[INFO] Inference pool ready ({len(pids)} process(es) warmed up)")
+
+    def embed(self, crops):
+        """L2-normalised embeddings of BGR face crops, in order."""
+        crops = [np.ascontiguousarray(crop, dtype=np.uint8) for crop in crops]
+        if not crops:
+            return np.empty((0, 0), dtype=np.float32)
+        chunks = max(1, min(self.workers, math.ceil(len(crops) / self.min_chunk)))
+        size = math.ceil(len(crops) / chunks)
+        # Every submitted chunk is waited for, so each slot goes back to the
+        # pool even when one chunk fails (a leaked slot would block _submit)
+        futures, results, error = [], [], None
+        try:
+            for i in range(0, len(crops), size):
+                futures.append(self._submit(crops[i:i + size]))
+        except Exception as e:
+            error = e
+        for future, shm, owned in futures:
+            try:
+                results.append(self._collect(future, shm, owned))
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+        return np.vstack(results)
+
+    def _submit(self, crops):
+        needed = sum(crop.nbytes for crop in crops)
+        owned = needed <= self.slot_bytes
+        shm = self._slots.get() if owned else shared_memory.SharedMemory(create=True, size=needed)
+        try:
+            layout, offset = [], 0
+            for crop in crops:
+                np.ndarray(crop.shape, dtype=np.uint8, buffer=shm.buf, offset=offset)[...] = crop
+                layout.append((offset, crop.shape))
+                offset += crop.nbytes
+            self.tasks += 1
+            return self._executor.submit(_embed_chunk, shm.name, layout, owned), shm, owned
+        except Exception:
+            self._release(shm, owned)
+            raise
+
+    def _collect(self, future, shm, owned):
+        try:
+            return future.result()
+        finally:
+            self._release(shm, owned)
+
+    def _release(self, shm, owned):
+        if owned:
+            self._slots.put(shm)
+        else:
+            shm.close()
+            shm.unlink()
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        for shm in self._owned:
+            shm.close()
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+        self._owned = []
@@ -1,5 +1,8 @@
 import cv2
+import time
+import threading
 import numpy as np
+import metrics
 
 class LivenessDetector:
     def __init__(self, ear_threshold=None, consecutive_frames=3):
@@ -16,24 +19,34 @@ class LivenessDetector:
              print("Error loading Haar Cascades.")
              self.eye_cascade = None
 
-    def check_liveness(self, frame, face_roi_coords=None):
+    @staticmethod
+    def _roi_gray(frame, face_roi_coords, gray=None, roi_gray=None):
+        """Grayscale face region, reusing whatever the caller already computed."""
+        if roi_gray is not None:
+            return roi_gray
+        (x, y, w, h) = face_roi_coords
+        if gray is None:
+            # Only convert the face region, not the whole frame
+            return cv2.cvtColor(frame[y:y+h, x:x+w], cv2.COLOR_BGR2GRAY)
+        return gray[y:y+h, x:x+w]
+
+    def check_liveness(self, frame, face_roi_coords=None, gray=None, roi_gray=None):
         """
         Checks for blinks using Haar Cascade Eye detection.
         If eyes are NOT detected in the face region, we assume closed (blink).
         frame: The full video frame.
         face_roi_coords: (x, y, w, h) of the face. If None, it tries to find one or skips.
+        gray / roi_gray: grayscale frame or face crop already computed by the
+        caller (see FrameAnalysis), so it is not converted again.
         """
         if self.eye_cascade is None:
             return 0.0, False, 0
-            
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
         
         # If no ROI provided, we can't reliably check eyes (might find random eyes in bg)
-        if face_roi_coords is None:
+        if face_roi_coords is None and roi_gray is None:
             return 0.0, False, self.total_blinks
             
-        (x, y, w, h) = face_roi_coords
-        roi_gray = gray[y:y+h, x:x+w]
+        roi_gray = self._roi_gray(frame, face_roi_coords, gray, roi_gray)
         
         # Detect eyes
         # scaleFactor=1.1, minNeighbors=5-10 implies reliable detection
@@ -63,17 +76,15 @@ class LivenessDetector:
         
         return fake_ear, is_blinking, self.total_blinks
 
-    def get_eye_status(self, frame, face_roi_coords):
+    def get_eye_status(self, frame, face_roi_coords, gray=None, roi_gray=None):
         """
         Stateless check for eye openness. Used for Web App snapshots.
         Returns: 'Open' or 'Closed'
         """
-        if self.eye_cascade is None or face_roi_coords is None:
+        if self.eye_cascade is None or (face_roi_coords is None and roi_gray is None):
              return "Unknown"
              
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        (x, y, w, h) = face_roi_coords
-        roi_gray = gray[y:y+h, x:x+w]
+        roi_gray = self._roi_gray(frame, face_roi_coords, gray, roi_gray)
         
         eyes = self.eye_cascade.detectMultiScale(roi_gray, scaleFactor=1.1, minNeighbors=10, minSize=(20, 20))
         
@@ -81,3 +92,176 @@ class LivenessDetector:
             return "Open" # Both eyes must be visible (Stricter)
         else:
             return "Closed" # 0 or 1 eye not enough (Could be blink or quirk)
+
+
+class LivenessEngine:
+    """
+    Blink-based liveness for every tracked face at once.
+    State lives per track id in compact NumPy arrays (one slot per face), so a
+    blink only ever counts for the face that blinked, and every frame's faces
+    are updated with a handful of vectorised operations.
+
+    Eye openness comes from the face's already-cropped grayscale ROI
+    (FrameAnalysis.gray_crop): by default, whether the Haar eye cascade finds
+    any eye in it (open) or none (closed), like LivenessDetector. The experimental "gradient" signal instead scores the edge
+    energy of the whole eye band, vectorised across faces; it is faster but
+    blur on a static photo can mimic blinks, so it is not the default.
+    A blink is a short dip below the track's own open-eye baseline followed
+    by recovery.
+    Blinks only count for 'window' seconds and are cleared by consume() once
+    a punch has used them.
+    """
+    PATCH = (48, 16) # (width, height) the eye band is resized to
+
+    def __init__(self, window=5.0, closed_ratio=0.7, open_ratio=0.85, max_closed=0.6, warmup_frames=5,
+                 baseline_rate=0.1, ttl=3.0, signal="haar"):
+        """
+        window: seconds a blink keeps a face "live".
+        closed_ratio / open_ratio: openness below / above these fractions of the
+                                   baseline mean eyes closed / open again.
+        max_closed: longest closure (s) still counted as a blink (looking down is not one).
+        warmup_frames: frames needed to learn a face's baseline before blinks count.
+        ttl: seconds a track's state survives without being seen.
+        signal: "haar" (eye cascade per face, default) or "gradient" (vectorised,
+                faster, weaker against spoofing: not validated on spoof sequences).
+        """
+        self.window = window
+        self.closed_ratio = closed_ratio
+        self.open_ratio = open_ratio
+        self.max_closed = max_closed
+        self.warmup_frames = warmup_frames
+        self.baseline_rate = baseline_rate
+        self.ttl = ttl
+        self.signal = signal
+        self.eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml') if signal == "haar" else None
+
+        self._slots = {} # track id -> slot index
+        self._free = []
+        self._capacity = 0
+        self._lock = threading.Lock()
+        self._allocate(16)
+
+    def _allocate(self, capacity):
+        """Grows the state arrays to 'capacity' slots, keeping existing ones."""
+        n = self._capacity
+        def grow(name, fill, dtype):
+            grown = np.full(capacity, fill, dtype=dtype)
+            if n:
+                grown[:n] = getattr(self, name)
+            setattr(self, name, grown)
+        grow("baseline", np.nan, np.float32) # open-eye openness
+        grow("closed_since", np.nan, np.float64) # when the current closure started
+        grow("last_blink", -np.inf, np.float64)
+        grow("blinks", 0, np.int32) # blinks since the last consume()
+        grow("frames", 0, np.int32)
+        grow("seen_at", -np.inf, np.float64)
+        self._free.extend(range(capacity - 1, n - 1, -1))
+        self._capacity = capacity
+
+    # --- Eye openness ---
+    def openness(self, roi_grays):
+        """Openness score per grayscale face ROI (higher = more open)."""
+        if self.signal == "haar":
+            scores = []
+            for roi in roi_grays:
+                eyes = self.eye_cascade.detectMultiScale(roi, scaleFactor=1.1, minNeighbors=10, minSize=(20, 20))
+                # Only "no eye at all" is closed: Haar often loses one of two eyes
+                # on a static photo, which must not read as a blink
+                scores.append(float(len(eyes) > 0))
+            return np.array(scores, dtype=np.float32)
+
+        width, height = self.PATCH
+        bands = np.empty((len(roi_grays), height, width), dtype=np.float32)
+        for i, roi in enumerate(roi_grays):
+            h = roi.shape[0]
+            bands[i] = cv2.resize(roi[int(h * 0.2):max(int(h * 0.55), int(h * 0.2) + 1)], (width, height), interpolation=cv2.INTER_AREA)
+        edges = np.abs(np.diff(bands, axis=1)).mean(axis=(1, 2)) + np.abs(np.diff(bands, axis=2)).mean(axis=(1, 2))
+        return edges / (bands.mean(axis=(1, 2)) + 1.0) * 100.0
+
+    # --- State ---
+    def _slot(self, track_id, now):
+        slot = self._slots.get(track_id)
+        if slot is None:
+            if not self._free:
+                self._expire(now)
+            if not self._free:
+                self._allocate(2 * self._capacity)
+            slot = self._free.pop()
+            self._slots[track_id] = slot
+            self.baseline[slot] = np.nan
+            self.closed_since[slot] = np.nan
+            self.last_blink[slot] = -np.inf
+            self.blinks[slot] = 0
+            self.frames[slot] = 0
+        return slot
+
+    def _expire(self, now):
+        for track_id, slot in list(self._slots.items()):
+            if now - self.seen_at[slot] > self.ttl:
+                del self._slots[track_id]
+                self._free.append(slot)
+
+    def update(self, analysis, now=None):
+        """
+        Feeds one frame's faces. Faces are keyed by analysis.track_ids (by
+        position when there is no tracker).
+        Returns: [(openness, blinked this frame, live)] aligned with analysis.faces.
+        """
+        if not analysis.faces:
+            return []
+        now = time.monotonic() if now is None else now
+        ids = analysis.track_ids if analysis.track_ids is not None else list(range(len(analysis.faces)))
+        scores = self.openness([analysis.gray_crop(i) for i in range(len(analysis.faces))])
+
+        with self._lock:
+            slots = np.array([self._slot(track_id, now) for track_id in ids])
+            self.seen_at[slots] = now
+            self.frames[slots] += 1
+
+            baseline = self.baseline[slots]
+            fresh = np.isnan(baseline)
+            baseline[fresh] = scores[fresh]
+            ready = self.frames[slots] > self.warmup_frames
+
+            was_closed = ~np.isnan(self.closed_since[slots])
+            closed = scores < baseline * self.closed_ratio
+            reopened = was_closed & (scores > baseline * self.open_ratio)
+            duration = now - self.closed_since[slots]
+            blinked = reopened & ready & (duration <= self.max_closed)
+
+            self.closed_since[slots[closed & ~was_closed]] = now
+            self.closed_since[slots[reopened]] = np.nan
+            self.last_blink[slots[blinked]] = now
+            self.blinks[slots[blinked]] += 1
+
+            # The baseline follows the open-eye level (lighting, distance) but not closures
+            is_open = (~closed & ~was_closed) | reopened
+            baseline[is_open] += self.baseline_rate * (scores[is_open] - baseline[is_open])
+            self.baseline[slots] = baseline
+
+            live = (now - self.last_blink[slots]) <= self.window
+        if blinked.any():
+            metrics.inc("blinks_total", int(blinked.sum()))
+        return [(float(s), bool(b), bool(l)) for s, b, l in zip(scores, blinked, live)]
+
+    def is_live(self, track_id, now=None):
+        """True if this track blinked within the last 'window' seconds."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            slot = self._slots.get(track_id)
+            return slot is not None and now - self.last_blink[slot] <= self.window
+
+    def consume(self, track_id):
+        """Spends a track's blink (after a punch), so the next punch needs a new one."""
+        with self._lock:
+            slot = self._slots.get(track_id)
+            if slot is not None:
+                self.last_blink[slot] = -np.inf
+                self.blinks[slot] = 0
+
+    def reset(self):
+        with self._lock:
+            self._slots = {}
+            self._free = []
+            self._capacity = 0
+            self._allocate(16)
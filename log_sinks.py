@@ -0,0 +1,98 @@
+import os
+import csv
+import time
+import queue
+import threading
+
+
+class CsvMirrorSink:
+    """
+    Mirrors attendance events to logs/attendance_{date}.csv off the punch path.
+    write() only enqueues; a background thread keeps the day's file open,
+    rotates it when the date changes and flushes every 'flush_rows' rows or
+    'flush_interval' seconds, whichever comes first. close() drains the
+    queue, so a clean shutdown never loses rows.
+    """
+    label = "CSV"
+    HEADER = ["Name", "Action", "Time", "Date"]
+
+    def __init__(self, log_dir="logs", flush_interval=1.0, flush_rows=50):
+        self.log_dir = log_dir
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+
+        self._queue = queue.Queue()
+        self._file = None
+        self._writer = None
+        self._date = None
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="csv-mirror", daemon=True)
+        self._thread.start()
+
+    def write(self, name, action, time_str, date_str):
+        """Queues one row; never touches the disk on the caller's thread."""
+        if not self._closed:
+            self._queue.put((name, action, time_str, date_str))
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    # --- Writer thread ---
+    def _run(self):
+        while True:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - self._last_flush))
+            try:
+                row = self._queue.get(timeout=timeout if self._pending else None)
+            except queue.Empty:
+                self._flush()
+                continue
+            if row is None:
+                self._flush()
+                if self._file is not None:
+                    self._file.close()
+                return
+            try:
+                self._append(row)
+            except OSError as e:
+                print(f"[WARNING] CSV mirror write failed: {e}")
+            if self._pending >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def _append(self, row):
+        date_str = row[3]
+        if date_str != self._date:
+            self._rotate(date_str)
+        self._writer.writerow(row)
+        self._pending += 1
+
+    def _rotate(self, date_str):
+        """Closes the previous day's file and opens (or continues) today's."""
+        if self._file is not None:
+            self._flush()
+            self._file.close()
+            self._file = None
+        if not os.path.exists(self.log_dir):
+            os.makedirs(self.log_dir)
+        csv_path = os.path.join(self.log_dir, f"attendance_{date_str}.csv")
+        # Check if header needed
+        needs_header = not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0
+        self._file = open(csv_path, "a", newline="")
+        self._writer = csv.writer(self._file)
+        self._date = date_str
+        if needs_header:
+            self._writer.writerow(self.HEADER)
+
+    def _flush(self):
+        if self._file is not None and self._pending:
+            try:
+                self._file.flush()
+            except OSError as e:
+                print(f"[WARNING] CSV mirror flush failed: {e}")
+        self._pending = 0
+        self._last_flush = time.monotonic()
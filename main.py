@@ -1,13 +1,19 @@
+from startup import StartupTimer # first: starts the startup clock
 import customtkinter as ctk
 from PIL import Image, ImageTk
 import cv2
 import threading
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
 # from tkinter import messagebox # Deprecated
 from CTkMessagebox import CTkMessagebox # Modern MessageBox
 from face_auth import FaceManager
-from attendance import AttendanceLogger
-from liveness import LivenessDetector
+from attendance import AttendanceLogger, DUPLICATE
+from liveness import LivenessEngine
+from capture import CapturePipeline
+from identity_cache import IdentityCache
+from tracking import FaceTracker
+import metrics
     # import mediapipe as mp # Removed due to incompatibility
     
 # Theme Settings
@@ -21,10 +27,17 @@ class AttendanceApp(ctk.CTk):
         self.title("Face Auth Attendance System")
         self.geometry("1100x700")
         
+        self.startup = StartupTimer("desktop")
+        metrics.enable_from_env() # ATTENDANCE_METRICS_PORT / ATTENDANCE_METRICS_LOG
+
         # Logic Modules
-        self.face_manager = FaceManager()
+        # The face model loads in the background (started below) so the window
+        # and camera come up immediately
+        self.face_manager = FaceManager(lazy=True)
         self.logger = AttendanceLogger()
-        self.liveness_detector = LivenessDetector()
+        self.liveness_detector = LivenessEngine() # blink state per tracked face
+        # Someone standing at the kiosk keeps their identity between checks instead of being re-embedded
+        self.identity_cache = IdentityCache()
         
         # --- SWITCH: Use OpenCV Haar Cascade ---
         # self.mp_face_detection = mp.solutions.face_detection # Removed
@@ -33,55 +46,82 @@ class AttendanceApp(ctk.CTk):
         
         # State
         self.video_capture = None
+        self.pipeline = None # CapturePipeline: capture thread -> queue -> detection/liveness worker
+        self._shown_result = None
+        self.punch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="punch")
+        self._punches = {} # token -> (action, track ids, future) of punches not finished yet
+        self._punch_token = 0 # bumped per punch; superseded ones leave _punches and are dropped
         self.is_running = True
-        self.current_frame = None
         self.detected_name = "Unknown"
         self.liveness_status = "Waiting..."
         
         self._setup_ui()
         self._start_camera()
+        self.after(0, self.startup.mark, "window")
+        self.face_manager.start_warmup(on_ready=lambda manager: self.after(0, self._on_model_ready))
         
         # Start Background Identification Thread
         threading.Thread(target=self._auto_identify_loop, daemon=True).start()
         
+    @property
+    def current_frame(self):
+        """Latest clean camera frame (published by the processing worker)."""
+        latest = self.pipeline.latest() if self.pipeline else None
+        return latest.frame if latest else None
+
+    @property
+    def current_analysis(self):
+        """FrameAnalysis of current_frame (gray, face boxes, crops)."""
+        latest = self.pipeline.latest() if self.pipeline else None
+        return latest.analysis if latest else None
+
+    def _on_model_ready(self):
+        """UI thread: the face model finished loading (or failed to)."""
+        if self.face_manager.is_ready:
+            self.lbl_model.configure(text=f"Face model: ready ({self.face_manager.load_seconds:.1f}s)", text_color="gray")
+            self.startup.mark("model_ready")
+            self._record_startup()
+        else:
+            self.lbl_model.configure(text=f"Face model: failed ({self.face_manager.error})", text_color="red")
+
+    def _record_startup(self):
+        """Logs this run's startup times once both the camera and the model are up."""
+        if "first_frame" in self.startup.marks and "model_ready" in self.startup.marks:
+            self.startup.save()
+
+    def _model_loading(self):
+        """Tells the user to wait if the face model is not ready. Returns True if so."""
+        if self.face_manager.is_ready:
+            return False
+        if self.face_manager.state == self.face_manager.FAILED:
+            CTkMessagebox(title="Model Error", message=f"The face model could not be loaded:\n{self.face_manager.error}", icon="cancel")
+        else:
+            CTkMessagebox(title="Please Wait", message="The face model is still loading. Try again in a few seconds.", icon="info")
+        return True
+
     def _auto_identify_loop(self):
         """Runs heavy AI identification in background to keep UI smooth."""
         import time
         while self.is_running:
-            # We need a copy of the frame safely
-            if self.current_frame is not None:
-                # Reuse MediaPipe result if possible, or just re-run identification on the whole frame
-                # DeepFace has its own detection, but we can pass the cropped face if we want.
-                # For simplicity in this thread, let DeepFace handle it but use a faster backend like ssd if possible,
-                # OR just rely on the main thread's detection signal.
-                
-                # To avoid lag, we only Identify. Detection is done in UI thread for visuals.
+            # Reuse the analysis the camera loop already produced for this frame:
+            # its Haar boxes and crops, so nothing is detected a second (or third) time
+            analysis = self.current_analysis
+            if not self.face_manager.is_ready:
+                pass # camera is live before the model; identify once it has loaded
+            elif analysis is not None and analysis.faces:
+                # Face(s) Present -> Identify everyone in frame with one batched inference
+                results = self.face_manager.identify_analysis(analysis, cache=self.identity_cache)
+                name, dist = results[0] # largest face drives the punch buttons
+                self.detected_name = name
+                known = [n for n, _ in results if n != "Unknown"]
                 
-                # Double check presence (Fast check)
-                try:
-                    small_frame = cv2.resize(self.current_frame, (0,0), fx=0.25, fy=0.25)
-                    gray_small = cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY)
-                    
-                    if gray_small.shape[0] < 30 or gray_small.shape[1] < 30:
-                        continue
-                        
-                    faces = self.face_cascade.detectMultiScale(gray_small, 1.1, 4)
-                except Exception as e:
-                    print(f"Background Detection Error: {e}")
-                    continue
-                
-                if len(faces) > 0:
-                    # Face Present -> Identify
-                    name, dist = self.face_manager.identify_face(self.current_frame)
-                    self.detected_name = name
-                    
-                    # Update UI from main thread
-                    if name != "Unknown":
-                        self.lbl_name.configure(text=f"Name: {name}", text_color="green")
-                    else:
-                        self.lbl_name.configure(text=f"Name: Unknown", text_color="white")
+                # Update UI from main thread
+                if known:
+                    self.after(0, lambda text=f"Name: {', '.join(known)}": self.lbl_name.configure(text=text, text_color="green"))
                 else:
-                    self.detected_name = "Unknown"
+                    self.after(0, lambda: self.lbl_name.configure(text=f"Name: Unknown", text_color="white"))
+            else:
+                self.detected_name = "Unknown"
             
             # Check every 0.5 seconds
             time.sleep(0.5)
@@ -117,6 +157,13 @@ class AttendanceApp(ctk.CTk):
         self.lbl_liveness = ctk.CTkLabel(self.status_frame, text="Liveness: Waiting", font=("Arial", 14), text_color="orange")
         self.lbl_liveness.pack(pady=5)
         
+        # Pipeline throughput (for sizing kiosk hardware)
+        self.lbl_perf = ctk.CTkLabel(self.status_frame, text="Capture: - FPS | Processing: - FPS | Dropped: 0", font=("Arial", 11), text_color="gray")
+        self.lbl_perf.pack(pady=(0, 5))
+
+        self.lbl_model = ctk.CTkLabel(self.status_frame, text="Face model: loading...", font=("Arial", 11), text_color="orange")
+        self.lbl_model.pack(pady=(0, 5))
+        
         # Actions
         self.btn_punch_in = ctk.CTkButton(self.controls_frame, text="PUNCH IN", height=50, fg_color="green", hover_color="darkgreen", command=self.action_punch_in)
         self.btn_punch_in.pack(pady=10, padx=20, fill="x")
@@ -143,51 +190,52 @@ class AttendanceApp(ctk.CTk):
 
     def _start_camera(self):
         self.video_capture = cv2.VideoCapture(0, cv2.CAP_DSHOW)
+        # Capture, detection and liveness run on their own threads; the Tk loop only blits
+        # Haar runs every few frames; faces are followed by optical flow in between
+        self.tracker = FaceTracker(self.face_cascade, detect_every=5)
+        self.pipeline = CapturePipeline(self.video_capture, self.face_cascade, self.liveness_detector, annotate=self._annotate, tracker=self.tracker)
+        self.pipeline.start()
         self._update_camera()
 
+    def _annotate(self, frame, analysis):
+        """Draws face boxes (worker thread). The largest face drives the name and liveness labels."""
+        if analysis.largest is None:
+            return
+        for (fx, fy, fw, fh) in analysis.faces[1:]:
+            cv2.rectangle(frame, (fx, fy), (fx+fw, fy+fh), (255, 255, 0), 1)
+        (x, y, w, h) = analysis.largest
+        color = (0, 255, 0) if self.detected_name != "Unknown" else (0, 0, 255)
+        cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
+        if analysis.track_ids is not None:
+            cv2.putText(frame, f"#{analysis.track_ids[0]}", (x, max(0, y - 8)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+
     def _update_camera(self):
         if not self.is_running:
             return
 
-        ret, frame = self.video_capture.read()
-        if ret:
-            frame = cv2.flip(frame, 1) # Mirror effect
-            self.current_frame = frame.copy()
-            
-            # --- OpenCV Haar Detection ---
-            # rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) # Not needed for Haar
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            
-            # results = self.face_detection.process(rgb_frame) # Removed
-            faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
-            
-            face_coords = None
-            
-            if len(faces) > 0:
-                # Get the largest face (closest)
-                # faces returns (x, y, w, h)
-                faces = sorted(faces, key=lambda f: f[2]*f[3], reverse=True)
-                (x, y, w, h) = faces[0]
-                
-                face_coords = (x, y, w, h)
-                
-                # Draw
-                color = (0, 255, 0) if self.detected_name != "Unknown" else (0, 0, 255)
-                cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
-                
-                # Check Liveness (using new coords)
-                fake_ear, is_blinking, total_blinks = self.liveness_detector.check_liveness(frame, face_coords)
-                self.lbl_liveness.configure(text=f"Blinks: {total_blinks}", text_color="green" if total_blinks > 0 else "orange")
+        result = self.pipeline.latest()
+        if result is not None and result is not self._shown_result:
+            self._shown_result = result
+            if "first_frame" not in self.startup.marks:
+                self.startup.mark("first_frame")
+                self._record_startup()
+
+            if result.liveness:
+                openness, blinked, live = result.liveness[0] # largest face
+                self.lbl_liveness.configure(text="Liveness: Blink OK" if live else "Liveness: Please blink", text_color="green" if live else "orange")
             else:
                  self.lbl_liveness.configure(text="No Face", text_color="red")
                  self.detected_name = "Unknown"
 
-            # Convert to ImageTk
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) # Needed for Display
-            img = Image.fromarray(rgb_frame)
+            # Convert to ImageTk (RGB conversion already done by the worker)
+            img = Image.fromarray(result.display)
             
             ctk_img = ctk.CTkImage(light_image=img, dark_image=img, size=(800, 600))
             self.video_label.configure(image=ctk_img, text="")
+
+        stats = self.pipeline.stats()
+        cache = self.identity_cache.stats()
+        self.lbl_perf.configure(text=f"Capture: {stats['capture_fps']:.0f} FPS | Processing: {stats['process_fps']:.0f} FPS | Dropped: {stats['dropped']} | Detect: {stats.get('detect_ratio', 1.0):.0%} of frames | ID cache: {cache['hit_rate']:.0%}")
         
         # Schedule next update in 10ms (100 FPS cap)
         self.after(10, self._update_camera)
@@ -198,41 +246,56 @@ class AttendanceApp(ctk.CTk):
              CTkMessagebox(title="Input Error", message="Please enter a name first.", icon="warning")
              return
              
-        if self.current_frame is None:
+        # Snapshot one frame: the worker keeps publishing new ones while dialogs are open
+        frame = self.current_frame
+        if frame is None:
              CTkMessagebox(title="Camera Error", message="No camera availability.", icon="cancel")
              return
+        if self._model_loading():
+             return
         
         # Need coordinates for registration to be accurate?
         # FaceManager extracts internally via DeepFace, so raw frame is fine.
 
         # Smart Duplicate Check
-        existing_name = self.face_manager.check_existing_face(self.current_frame)
+        existing_name = self.face_manager.check_existing_face(frame)
         registration_type = "Registration (New)"
         old_name_to_delete = None
+        add_sample = False
         
         if existing_name:
             # Found a match!
             if existing_name.lower() == name.lower():
-                 # Same name
-                 registration_type = "Registration (Update Photo)"
-                 msg = CTkMessagebox(title="Update Photo", message=f"User '{existing_name}' already exists.\nUpdate their photo?", icon="question", option_1="Yes", option_2="No")
+                 # Same name: keep the old photos as extra samples unless asked to replace them
+                 msg = CTkMessagebox(title="Update Photo", message=f"User '{existing_name}' already exists.\nAdd this photo as an extra sample, or replace their photos?", icon="question", option_1="Add Sample", option_2="Replace", option_3="Cancel")
+                 answer = msg.get()
+                 if answer == "Add Sample":
+                     registration_type = "Registration (Add Sample)"
+                     add_sample = True
+                 elif answer == "Replace":
+                     registration_type = "Registration (Update Photo)"
+                 else:
+                     return
             else:
                  # Duplicate Face
                  registration_type = f"Registration (Overwrite {existing_name})"
                  old_name_to_delete = existing_name # Mark for deletion
                  msg = CTkMessagebox(title="Duplicate Face", message=f"This face currently belongs to '{existing_name}'.\nAre you sure you want to register as '{name}'?\nThis will overwrite the name.", icon="question", option_1="Yes", option_2="No")
             
-            if msg.get() != "Yes":
-                return
+                 if msg.get() != "Yes":
+                     return
 
         # Proceed
-        success, msg = self.face_manager.register_face(self.current_frame, name, old_name=old_name_to_delete)
+        if add_sample:
+            success, msg = self.face_manager.add_face_sample(frame, existing_name)
+        else:
+            success, msg = self.face_manager.register_face(frame, name, old_name=old_name_to_delete)
         if success:
              # SUCCESS ICON (Checkmark) 
              CTkMessagebox(title="Success", message=msg, icon="check")
              
              # LOGGING THE REGISTRATION
-             log_msg = self.logger.mark_attendance(name, registration_type)
+             _, log_msg = self.logger.mark_attendance(name, registration_type)
              
              self.log_textbox.insert("0.0", f"{log_msg}\n")
         else:
@@ -245,30 +308,100 @@ class AttendanceApp(ctk.CTk):
         self._handle_attendance("Punch Out")
 
     def _handle_attendance(self, action):
-        if self.current_frame is None: return
+        latest = self.pipeline.latest() if self.pipeline else None
+        if latest is None: return
+        if self._model_loading(): return
         
-        # Check Liveness First
-        if self.liveness_detector.total_blinks == 0:
+        # Check Liveness First: only faces that blinked themselves (recently) may punch
+        analysis = latest.analysis
+        live = [i for i, track_id in enumerate(analysis.track_ids or []) if self.liveness_detector.is_live(track_id)]
+        if not live:
              CTkMessagebox(title="Security Alert", message="Please blink your eyes to prove you are human!", icon="warning", option_1="OK")
              return
         
+        # Punches in flight for the same faces: a repeat click of the same button is
+        # coalesced, the other button supersedes them (cancelled if not started yet,
+        # otherwise they stop before logging). Other faces (the next employee) queue up.
+        tracks = frozenset(analysis.track_ids[i] for i in live)
+        for other, (other_action, other_tracks, other_future) in list(self._punches.items()):
+            if not tracks & other_tracks:
+                continue
+            if other_action == action and tracks <= other_tracks:
+                self.log_textbox.insert("0.0", f"{action}: still identifying...\n")
+                return
+            if other_action != action:
+                del self._punches[other]
+                other_future.cancel()
+        
         # Identify
-        self.log_textbox.insert("0.0", "Identifying...\n")
+        queued = len(self._punches)
+        self.log_textbox.insert("0.0", f"Identifying... ({queued} ahead)\n" if queued else "Identifying...\n")
         
-        # Run identification in main thread (might freeze slightly, better in thread ideally)
-        name, dist = self.face_manager.identify_face(self.current_frame)
+        # Identification and logging run on the punch worker; the UI keeps rendering video
+        self._punch_token += 1
+        token = self._punch_token
+        self._punches[token] = (action, tracks, None) # registered before the job can look for it
+        future = self.punch_executor.submit(self._punch_job, latest, live, action, token)
+        self._punches[token] = (action, tracks, future)
+        future.add_done_callback(lambda f: self.after(0, self._finish_punch, token, action, f))
+
+    def _punch_job(self, latest, live, action, token):
+        """
+        Worker thread: identify the live faces in the snapshot and log them.
+        Returns None, without logging, if a newer punch superseded this one.
+        """
+        # Everyone who blinked is identified in one batch and marked together
+        analysis = latest.analysis
+        results = self.face_manager.identify_crops([analysis.crop(i) for i in live])
+        if token not in self._punches:
+            return None
+        names = []
+        for i, (name, _) in zip(live, results):
+            if name != "Unknown":
+                names.append(name)
+                self.liveness_detector.consume(analysis.track_ids[i]) # the next punch needs a new blink
+        names = list(dict.fromkeys(names))
+        return [(name,) + self.logger.mark_attendance(name, action) for name in names]
+
+    def _finish_punch(self, token, action, future):
+        """
+        UI thread: show the outcome of a punch. A superseded punch shows nothing
+        unless it had already logged rows (those are always shown).
+        """
+        stale = self._punches.pop(token, None) is None
+        if future.cancelled() or not self.is_running:
+            return
+        try:
+            logged = future.result()
+        except Exception as e:
+            if not stale:
+                self.log_textbox.insert("0.0", f"Identification error: {e}\n")
+            return
+        if logged is None or (not logged and stale): # superseded, nothing logged
+            return
         
-        if name != "Unknown":
-            res = self.logger.mark_attendance(name, action)
-            self.lbl_name.configure(text=f"Name: {name}")
-            self.log_textbox.insert("0.0", f"{res}\n")
-            # SUCCESS ICON (Checkmark)
-            CTkMessagebox(title=f"Welcome {name}", message=f"{action} Successful", icon="check", option_1="OK")
+        if logged:
+            names = [name for name, _, _ in logged]
+            for name, status, res in logged:
+                self.log_textbox.insert("0.0", f"{name}: {res}\n")
+            self.lbl_name.configure(text=f"Name: {', '.join(names)}")
+            
+            if all(status == DUPLICATE for _, status, _ in logged):
+                CTkMessagebox(title="Already Recorded", message="\n".join(f"{name}: {res}" for name, _, res in logged), icon="info", option_1="OK")
+            else:
+                # SUCCESS ICON (Checkmark)
+                CTkMessagebox(title=f"Welcome {', '.join(names)}", message=f"{action} Successful", icon="check", option_1="OK")
         else:
             CTkMessagebox(title="Access Denied", message="Face not recognized. Please Register.", icon="cancel")
 
     def on_closing(self):
         self.is_running = False
+        self.startup.save()
+        self.punch_executor.shutdown(wait=False, cancel_futures=True)
+        if self.pipeline is not None:
+            self.pipeline.stop()
+        if self.video_capture is not None:
+            self.video_capture.release()
         self.destroy()
 
 if __name__ == "__main__":
@@ -0,0 +1,273 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+
+class NullMetrics:
+    """Default backend: every call is a no-op, so instrumented code costs ~one call."""
+    enabled = False
+
+    def inc(self, name, value=1, **labels):
+        pass
+
+    def set(self, name, value, **labels):
+        pass
+
+    def observe(self, name, value, **labels):
+        pass
+
+    def timer(self, name, **labels):
+        return _NULL_TIMER
+
+    def snapshot(self):
+        return {}
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics, self.name, self.labels = metrics, name, labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _Summary:
+    """Count / sum plus a window of recent values for quantiles."""
+    __slots__ = ("count", "total", "recent")
+
+    def __init__(self, window):
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=window)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.recent.append(value)
+
+    def quantile(self, q):
+        if not self.recent:
+            return 0.0
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Metrics:
+    """
+    In-process metrics registry: counters, gauges and summaries (timings,
+    distances...), optionally labelled. Thread-safe.
+    Timings are in seconds; names follow Prometheus conventions
+    (*_total for counters, *_seconds for durations).
+    """
+    enabled = True
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, window=1024):
+        self.window = window
+        self.started = time.time()
+        self._counters = {}
+        self._gauges = {}
+        self._summaries = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted(labels.items()))) if labels else (name, ())
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = _Summary(self.window)
+            summary.add(value)
+
+    def timer(self, name, **labels):
+        """Context manager observing the elapsed seconds under 'name'."""
+        return _Timer(self, name, labels)
+
+    # --- Export ---
+    @staticmethod
+    def _series(key):
+        name, labels = key
+        if not labels:
+            return name
+        return name + "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+    def snapshot(self):
+        """Plain dict of every series (what the JSON endpoint serves)."""
+        with self._lock:
+            counters = {self._series(k): v for k, v in self._counters.items()}
+            gauges = {self._series(k): v for k, v in self._gauges.items()}
+            summaries = {}
+            for key, s in self._summaries.items():
+                entry = {"count": s.count, "sum": s.total, "mean": s.total / s.count if s.count else 0.0}
+                entry.update({f"p{int(q * 100)}": s.quantile(q) for q in self.QUANTILES})
+                summaries[self._series(key)] = entry
+        return {"uptime_seconds": time.time() - self.started, "counters": counters, "gauges": gauges, "summaries": summaries}
+
+    def prometheus(self):
+        """Prometheus text exposition format."""
+        lines, typed = [], set()
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+        with self._lock:
+            for key, value in sorted(self._counters.items()):
+                declare(key[0], "counter")
+                lines.append(f"{self._series(key)} {value}")
+            for key, value in sorted(self._gauges.items()):
+                declare(key[0], "gauge")
+                lines.append(f"{self._series(key)} {value}")
+            for key, s in sorted(self._summaries.items()):
+                name, labels = key
+                declare(name, "summary")
+                for q in self.QUANTILES:
+                    lines.append(f"{self._series((name, labels + (('quantile', q),)))} {s.quantile(q)}")
+                lines.append(f"{self._series((name + '_sum', labels))} {s.total}")
+                lines.append(f"{self._series((name + '_count', labels))} {s.count}")
+        return "\n".join(lines) + "\n"
+
+    def log_line(self):
+        """One-line digest for the periodic log."""
+        snap = self.snapshot()
+        parts = [f"{k}={v:g}" for k, v in sorted(snap["counters"].items())]
+        parts += [f"{k}={v:g}" for k, v in sorted(snap["gauges"].items())]
+        for name, s in sorted(snap["summaries"].items()):
+            scale, unit = (1000.0, "ms") if "_seconds" in name else (1.0, "")
+            parts.append(f"{name} p50={s['p50'] * scale:.3g}{unit} p95={s['p95'] * scale:.3g}{unit}")
+        return " | ".join(parts)
+
+
+# --- Process-wide backend ---
+# Instrumented modules call metrics.inc(...) / metrics.timer(...); these forward to
+# whichever backend is installed, NullMetrics unless enable() was called.
+_backend = NullMetrics()
+
+
+def get_metrics():
+    return _backend
+
+
+def set_metrics(backend):
+    """Installs a backend (Metrics, NullMetrics or anything with the same methods)."""
+    global _backend
+    _backend = backend
+
+
+def inc(name, value=1, **labels):
+    _backend.inc(name, value, **labels)
+
+
+def set_gauge(name, value, **labels):
+    _backend.set(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    _backend.observe(name, value, **labels)
+
+
+def timer(name, **labels):
+    return _backend.timer(name, **labels)
+
+
+def enabled():
+    return _backend.enabled
+
+
+# --- Surfaces ---
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        backend = get_metrics()
+        if self.path.startswith("/metrics.json"):
+            body, kind = json.dumps(backend.snapshot(), indent=2).encode(), "application/json"
+        elif self.path.startswith("/metrics"):
+            text = backend.prometheus() if hasattr(backend, "prometheus") else ""
+            body, kind = text.encode(), "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", kind)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # scrapes every few seconds would flood the console
+
+
+def start_http_server(port, host="127.0.0.1"):
+    """Serves /metrics (Prometheus text) and /metrics.json on a background thread."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"[INFO] Metrics on http://{host}:{server.server_address[1]}/metrics (and /metrics.json)")
+    return server
+
+
+def start_log_reporter(interval=60.0):
+    """Prints a [METRICS] digest line every 'interval' seconds."""
+    def run():
+        while True:
+            time.sleep(interval)
+            line = get_metrics().log_line() if hasattr(get_metrics(), "log_line") else ""
+            if line:
+                print(f"[METRICS] {line}")
+    thread = threading.Thread(target=run, name="metrics-log", daemon=True)
+    thread.start()
+    return thread
+
+
+def enable(http_port=None, log_interval=None, host="127.0.0.1"):
+    """Switches to the in-memory registry and starts the requested surfaces."""
+    if not enabled():
+        set_metrics(Metrics())
+    if http_port is not None:
+        start_http_server(http_port, host)
+    if log_interval:
+        start_log_reporter(log_interval)
+    return get_metrics()
+
+
+def enable_from_env():
+    """
+    Enables metrics when configured through the environment:
+    ATTENDANCE_METRICS_PORT (HTTP endpoint) and/or
+    ATTENDANCE_METRICS_LOG (seconds between log lines).
+    """
+    port = os.environ.get("ATTENDANCE_METRICS_PORT")
+    interval = os.environ.get("ATTENDANCE_METRICS_LOG")
+    if port or interval:
+        enable(int(port) if port else None, float(interval) if interval else None)
@@ -0,0 +1,218 @@
+import os
+import sys
+import json
+import glob
+import time
+import shutil
+import argparse
+import tempfile
+import cv2
+import numpy as np
+from face_auth import FaceManager
+from gallery import PRECISIONS
+from attendance import AttendanceLogger, PUNCH_IN
+from frame_analysis import FrameAnalysis
+from liveness import LivenessEngine
+from tracking import FaceTracker
+from identity_cache import IdentityCache
+from server import PresenceMarker
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def read_frames(source, image_fps=10.0):
+    """
+    Yields (frame index, video time in seconds, BGR frame) from a video file or
+    a folder of images (sorted by name, 'image_fps' apart).
+    Video time, not the wall clock, drives liveness and the identity cache, so
+    a replay makes the same decisions however fast it runs.
+    """
+    if os.path.isdir(source):
+        paths = sorted(p for p in glob.glob(os.path.join(source, "*")) if p.lower().endswith(IMAGE_EXTENSIONS))
+        for i, path in enumerate(paths):
+            frame = cv2.imread(path)
+            if frame is not None:
+                yield i, i / image_fps, frame
+        return
+
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise RuntimeError(f"Could not open {source!r}")
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    fps = fps if fps and fps > 0 else 30.0
+    try:
+        i = 0
+        while True:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            yield i, i / fps, frame
+            i += 1
+    finally:
+        capture.release()
+
+
+class Replay:
+    """
+    One recording through the live pipeline, synchronously and frame by frame:
+    detection / tracking -> liveness -> identification (identity cache, then
+    one model batch for the misses) -> presence marking -> attendance log.
+    Every frame is processed (nothing is dropped), so runs are comparable.
+    """
+    STAGES = ("detect", "liveness", "identify", "log")
+
+    def __init__(self, face_manager, face_cascade, logger=None, action=PUNCH_IN, require_blink=True,
+                 detect_every=5, use_cache=True):
+        self.face_manager = face_manager
+        self.face_cascade = face_cascade
+        self.tracker = FaceTracker(face_cascade, detect_every=detect_every)
+        self.liveness = LivenessEngine()
+        self.identity_cache = IdentityCache() if use_cache else None
+        self.marker = PresenceMarker(logger, action, self.liveness, require_blink)
+
+        self.frames = 0
+        self.faces = 0
+        self.embedded = 0
+        self.punches = {}
+        self.stage_ms = {stage: [] for stage in self.STAGES}
+
+    def process(self, index, now, frame):
+        """Runs one frame. Returns its decision record (JSON-serialisable)."""
+        t0 = time.perf_counter()
+        analysis = FrameAnalysis(frame, self.face_cascade, tracker=self.tracker)
+        t1 = time.perf_counter()
+        liveness = self.liveness.update(analysis, now)
+        t2 = time.perf_counter()
+        results, cached = self._identify(analysis, now)
+        t3 = time.perf_counter()
+        _, punches = self.marker.update(results, analysis.track_ids, now)
+        t4 = time.perf_counter()
+
+        for stage, ms in zip(self.STAGES, np.diff([t0, t1, t2, t3, t4]) * 1000):
+            self.stage_ms[stage].append(ms)
+        self.frames += 1
+        self.faces += len(analysis.faces)
+        for _, status, _ in punches:
+            self.punches[status] = self.punches.get(status, 0) + 1
+
+        faces = []
+        for i, box in enumerate(analysis.faces):
+            (name, distance), (openness, blinked, live) = results[i], liveness[i]
+            faces.append({"track": analysis.track_ids[i], "box": list(box), "name": name,
+                          "distance": round(float(distance), 4), "cached": cached[i],
+                          "openness": round(openness, 3), "blinked": blinked, "live": live})
+        # Punch messages carry the wall-clock time; only the outcome is recorded
+        return {"frame": index, "time": round(now, 3), "faces": faces,
+                "punches": [{"name": name, "status": status} for name, status, _ in punches]}
+
+    def _identify(self, analysis, now):
+        """[(name, distance)] per face and whether each came from the identity cache."""
+        results, cached = self.face_manager.identify_analysis(analysis, cache=self.identity_cache, now=now,
+                                                              return_cached=True)
+        self.embedded += cached.count(False)
+        return results, cached
+
+    def summary(self, wall_seconds):
+        stages = {}
+        for stage, values in self.stage_ms.items():
+            values = np.asarray(values) if values else np.zeros(1)
+            stages[stage] = {"mean_ms": float(values.mean()), "p95_ms": float(np.percentile(values, 95))}
+        return {
+            "frames": self.frames,
+            "faces": self.faces,
+            "embedded": self.embedded,
+            "punches": self.punches,
+            "wall_seconds": wall_seconds,
+            "fps": self.frames / wall_seconds if wall_seconds > 0 else 0.0,
+            "detect_ratio": self.tracker.stats()["detect_ratio"],
+            "stages": stages,
+        }
+
+
+def copy_face_db(face_db, workdir):
+    """
+    Private copy of the enrolment folder (photos + embedding store), so the
+    replay never writes to the real one yet does not have to re-embed it.
+    """
+    target = os.path.join(workdir, "faces")
+    if os.path.isdir(face_db):
+        shutil.copytree(face_db, target)
+    else:
+        print(f"[WARNING] Face DB {face_db} not found; every face will be Unknown.")
+        os.makedirs(target)
+    return target
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded video files / image folders through the attendance "
+                                                 "pipeline as fast as possible, against a throwaway database.")
+    parser.add_argument("sources", nargs="+", help="Video files or folders of images (each replayed on its own)")
+    parser.add_argument("-o", "--output", default="replay.jsonl", help='Per-frame decisions, one JSON line per frame ("-" = stdout)')
+    parser.add_argument("--summary", help="Also write the aggregate stats (FPS, stage timings) to this JSON file")
+    parser.add_argument("--action", default=PUNCH_IN, help=f'Action marked for recognised people (default: "{PUNCH_IN}")')
+    parser.add_argument("--no-liveness", action="store_true", help="Do not require a blink before marking")
+    parser.add_argument("--no-cache", action="store_true", help="Embed every face on every frame (model load test)")
+    parser.add_argument("--face-db", default="data", help="Enrolment folder, copied before use (default: data)")
+    parser.add_argument("--db", help="Keep the attendance database at this path (default: temporary, deleted)")
+    parser.add_argument("--dedup-window", type=float, default=0.0,
+                        help="Seconds of wall-clock duplicate suppression (default 0: a fast replay squeezes minutes into seconds)")
+    parser.add_argument("--model", help="DeepFace model (default: $ATTENDANCE_FACE_MODEL or VGG-Face)")
+    parser.add_argument("--precision", choices=PRECISIONS, help="Gallery storage precision (default: float32)")
+    parser.add_argument("--search-backend", choices=("exact", "ivf"), default="exact")
+    parser.add_argument("--detect-every", type=int, default=5, help="Full face detection every N frames")
+    parser.add_argument("--image-fps", type=float, default=10.0, help="Frame rate assumed for image folders")
+    parser.add_argument("--max-frames", type=int, help="Stop each source after this many frames")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="replay_")
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    face_manager = logger = None
+    try:
+        face_manager = FaceManager(db_path=copy_face_db(args.face_db, workdir), search_backend=args.search_backend,
+                                   model_name=args.model, precision=args.precision)
+        if not face_manager.is_ready:
+            print(f"[WARNING] Face model unavailable ({face_manager.error}); identification will return Unknown.")
+        logger = AttendanceLogger(args.db or os.path.join(workdir, "replay.db"), sinks=[], dedup_window=args.dedup_window)
+        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+        summaries = {}
+        for source in args.sources:
+            replay = Replay(face_manager, face_cascade, logger, args.action, require_blink=not args.no_liveness,
+                            detect_every=args.detect_every, use_cache=not args.no_cache)
+            started = time.perf_counter()
+            try:
+                for index, now, frame in read_frames(source, args.image_fps):
+                    if args.max_frames is not None and index >= args.max_frames:
+                        break
+                    record = replay.process(index, now, frame)
+                    record["source"] = source
+                    out.write(json.dumps(record) + "\n")
+            except RuntimeError as e:
+                print(f"[WARNING] {e}")
+                continue
+            summary = summaries[source] = replay.summary(time.perf_counter() - started)
+            stages = ", ".join(f"{stage} {s['mean_ms']:.1f}" for stage, s in summary["stages"].items())
+            print(f"[INFO] {source}: {summary['frames']} frames in {summary['wall_seconds']:.1f}s "
+                  f"({summary['fps']:.1f} FPS), {summary['faces']} faces, {summary['embedded']} embedded, "
+                  f"punches {summary['punches'] or 0}; mean ms: {stages}")
+
+        frames = sum(s["frames"] for s in summaries.values())
+        seconds = sum(s["wall_seconds"] for s in summaries.values())
+        print(f"[INFO] Total: {frames} frames in {seconds:.1f}s ({frames / seconds if seconds > 0 else 0.0:.1f} FPS)")
+        if args.summary:
+            with open(args.summary, "w") as f:
+                json.dump({"sources": summaries, "frames": frames, "wall_seconds": seconds,
+                           "fps": frames / seconds if seconds > 0 else 0.0}, f, indent=2)
+        return 0 if summaries else 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if logger is not None:
+            logger.close()
+        if face_manager is not None:
+            face_manager.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,214 @@
+import os
+import hashlib
+import numpy as np
+
+
+def top_k(distances, k):
+    """Indices of the k smallest distances, closest first."""
+    k = min(k, len(distances))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k == 1:
+        return np.array([int(np.argmin(distances))])
+    top = np.argpartition(distances, k - 1)[:k]
+    return top[np.argsort(distances[top])]
+
+
+class ExactIndex:
+    """
+    Brute-force search: compares the probe against every gallery row.
+    Always returns the true nearest neighbour; cost grows linearly with the gallery.
+    """
+    name = "exact"
+
+    def fit(self, matrix):
+        pass
+
+    def added(self, matrix, row):
+        pass
+
+    def removed(self, row):
+        pass
+
+    def search(self, matrix, probe, k=1):
+        """Returns: (row indices, cosine distances), closest first."""
+        distances = 1.0 - matrix @ probe
+        rows = top_k(distances, k)
+        return rows, distances[rows]
+
+    def search_many(self, matrix, probes, k=1):
+        """
+        Batched search: one matrix-matrix product for all probes.
+        Returns: list of (row indices, cosine distances), one per probe.
+        """
+        distances = 1.0 - probes @ matrix.T
+        results = []
+        for row_distances in distances:
+            rows = top_k(row_distances, k)
+            results.append((rows, row_distances[rows]))
+        return results
+
+
+class IVFIndex:
+    """
+    Approximate search with an inverted file (IVF) over spherical k-means cells.
+    The gallery is split into 'nlist' clusters; a query only scans the rows of
+    its 'nprobe' closest clusters. nprobe is the recall/latency knob:
+    higher = closer to exact, slower.
+    Small galleries (< min_rows) are searched exactly.
+    """
+    name = "ivf"
+
+    def __init__(self, nlist=None, nprobe=8, iterations=10, min_rows=2000, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.min_rows = min_rows
+        self.seed = seed
+
+        self.centroids = None # (nlist, dim), L2-normalised
+        self.assignments = np.empty(0, dtype=np.int32) # cluster id per gallery row
+        self.trained_rows = 0
+        self.fitted = False # assignments describe the gallery (set by fit() / load())
+        self._lists = None # cluster id -> row indices, rebuilt lazily
+
+    # --- Training ---
+    def fit(self, matrix):
+        """Trains the coarse quantiser on 'matrix' and assigns every row."""
+        n = len(matrix)
+        self._lists = None
+        self.fitted = True
+        if n < self.min_rows:
+            self.centroids = None
+            self.assignments = np.zeros(n, dtype=np.int32)
+            self.trained_rows = n
+            return
+
+        nlist = self.nlist or max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(self.seed)
+
+        # k-means on a sample is plenty for a coarse quantiser and keeps
+        # training time bounded on 100k-row galleries
+        sample_size = min(n, nlist * 40)
+        sample = matrix[rng.choice(n, sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(self.iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[labels == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+                else:
+                    # Re-seed empty cells so no centroid is wasted
+                    centroids[c] = sample[rng.integers(sample_size)]
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids /= norms
+
+        self.centroids = centroids.astype(np.float32)
+        self.assignments = self._assign(matrix)
+        self.trained_rows = n
+
+    def _assign(self, vectors, batch=4096):
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), batch):
+            chunk = vectors[start:start + batch]
+            labels[start:start + batch] = np.argmax(chunk @ self.centroids.T, axis=1)
+        return labels
+
+    # --- Incremental updates (kept in sync with EmbeddingGallery rows) ---
+    def added(self, matrix, row):
+        if not self.fitted:
+            return # the gallery's first fit() assigns every row
+        n = len(matrix)
+        # Retrain when the gallery outgrew the quantiser (or crossed min_rows)
+        if (self.centroids is None and n >= self.min_rows) or n > 2 * max(self.trained_rows, 1):
+            self.fit(matrix)
+            return
+        label = 0 if self.centroids is None else self._assign(matrix[row:row + 1])[0]
+        if row < len(self.assignments):
+            self.assignments[row] = label # replaced embedding
+        else:
+            self.assignments = np.append(self.assignments, np.int32(label))
+        self._lists = None
+
+    def removed(self, row):
+        if not self.fitted:
+            return
+        self.assignments = np.delete(self.assignments, row)
+        self._lists = None
+
+    def _inverted_lists(self):
+        if self._lists is None:
+            order = np.argsort(self.assignments, kind="stable")
+            bounds = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+            self._lists = [order[bounds[c]:bounds[c + 1]] for c in range(len(self.centroids))]
+        return self._lists
+
+    # --- Query ---
+    def search(self, matrix, probe, k=1):
+        """Returns: (row indices, cosine distances), closest first."""
+        if self.centroids is None:
+            return ExactIndex().search(matrix, probe, k)
+
+        nprobe = min(self.nprobe, len(self.centroids))
+        cells = top_k(1.0 - self.centroids @ probe, nprobe)
+        lists = self._inverted_lists()
+        candidates = np.concatenate([lists[c] for c in cells])
+        if len(candidates) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        distances = 1.0 - matrix[candidates] @ probe
+        best = top_k(distances, k)
+        return candidates[best], distances[best]
+
+    def search_many(self, matrix, probes, k=1):
+        """Batched search; each probe scans its own cells."""
+        if self.centroids is None:
+            return ExactIndex().search_many(matrix, probes, k)
+        return [self.search(matrix, probe, k) for probe in probes]
+
+    # --- Persistence ---
+    @staticmethod
+    def fingerprint(names):
+        """Identifies the exact gallery (row order included) an index was built for."""
+        return hashlib.sha1("\n".join(names).encode("utf-8")).hexdigest()
+
+    def save(self, path, names):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f,
+                     centroids=self.centroids if self.centroids is not None else np.empty((0, 0), np.float32),
+                     assignments=self.assignments,
+                     trained_rows=np.int64(self.trained_rows),
+                     fingerprint=np.str_(self.fingerprint(names)))
+        os.replace(tmp_path, path)
+
+    def load(self, path, names):
+        """
+        Loads a saved index if it was built for exactly this gallery.
+        Returns: True on success, False if the caller must fit() instead.
+        """
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data["fingerprint"]) != self.fingerprint(names):
+                    return False
+                centroids = data["centroids"]
+                self.centroids = centroids.astype(np.float32) if centroids.size else None
+                self.assignments = data["assignments"].astype(np.int32)
+                self.trained_rows = int(data["trained_rows"])
+        except (OSError, KeyError, ValueError):
+            return False
+        self.fitted = True
+        self._lists = None
+        return True
+
+
+def make_index(backend="exact", **options):
+    """Factory for the search backends FaceManager understands."""
+    if backend == "exact":
+        return ExactIndex()
+    if backend == "ivf":
+        return IVFIndex(**options)
+    raise ValueError(f"Unknown search backend: {backend}")
@@ -0,0 +1,320 @@
+import os
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import Future
+import cv2
+from face_auth import FaceManager
+from gallery import PRECISIONS
+from attendance import AttendanceLogger, LOGGED
+from liveness import LivenessEngine
+from capture import CapturePipeline
+from tracking import FaceTracker
+from identity_cache import IdentityCache
+import metrics
+
+
+class BatchIdentifier:
+    """
+    Collects identification requests from every camera and runs them through
+    the shared FaceManager as one model batch.
+    A batch is closed after 'window' seconds or 'max_batch' faces, whichever
+    comes first, so a lone camera pays at most 'window' of extra latency.
+    """
+    def __init__(self, face_manager, window=0.03, max_batch=32):
+        self.face_manager = face_manager
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.faces = 0
+        self._requests = queue.Queue()
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="batch-identify", daemon=True)
+        self._thread.start()
+
+    def submit(self, crops):
+        """Returns a Future resolving to [(name, distance)] for 'crops'."""
+        future = Future()
+        if not crops:
+            future.set_result([])
+        else:
+            self._requests.put((crops, future))
+        return future
+
+    def stop(self):
+        self._running = False
+        self._requests.put(None)
+        self._thread.join(timeout=2.0)
+
+    def mean_batch(self):
+        return self.faces / self.batches if self.batches else 0.0
+
+    def _loop(self):
+        while self._running:
+            first = self._requests.get()
+            if first is None:
+                break
+            batch, size = [first], len(first[0])
+            deadline = time.monotonic() + self.window
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._running = False
+                    break
+                batch.append(request)
+                size += len(request[0])
+            self._run(batch)
+
+    def _run(self, batch):
+        crops = [crop for request_crops, _ in batch for crop in request_crops]
+        try:
+            results = self.face_manager.identify_crops(crops)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.faces += len(crops)
+        start = 0
+        for request_crops, future in batch:
+            future.set_result(results[start:start + len(request_crops)])
+            start += len(request_crops)
+
+
+class _PacedCapture:
+    """Wraps a video file capture so frames come out at the file's own frame rate."""
+    def __init__(self, capture):
+        self.capture = capture
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        self.interval = 1.0 / fps if fps and fps > 0 else 0.0
+        self._next = None
+
+    def read(self):
+        now = time.monotonic()
+        if self._next is not None and now < self._next:
+            time.sleep(self._next - now)
+        self._next = max(now, self._next or now) + self.interval
+        return self.capture.read()
+
+    def release(self):
+        self.capture.release()
+
+
+class PresenceMarker:
+    """
+    Turns identifications into punches: everyone is marked once per
+    appearance (leaving the view and coming back marks again) and, when
+    liveness is required, only after their own tracked face blinked.
+    """
+    def __init__(self, logger=None, action=None, liveness=None, require_blink=True):
+        self.logger = logger
+        self.action = action
+        self.liveness = liveness
+        self.require_blink = require_blink and liveness is not None
+        self.present = set() # names currently in view
+        self.waiting = set() # in view and not marked yet (e.g. no blink so far)
+
+    def update(self, results, track_ids, now=None):
+        """
+        results: [(name, distance)] for one frame, parallel to track_ids.
+        Returns: (names that came into view, [(name, status, message)] punches made).
+        """
+        arrived, punches, names = [], [], set()
+        for i, (name, _) in enumerate(results):
+            if name == "Unknown" or name in names:
+                continue
+            names.add(name)
+            if name not in self.present:
+                arrived.append(name)
+                self.waiting.add(name)
+            if name in self.waiting and self._punch(name, track_ids[i], now, punches):
+                self.waiting.discard(name)
+        self.present = names
+        self.waiting &= names # leaving and coming back marks again
+        return arrived, punches
+
+    def _punch(self, name, track_id, now, punches):
+        """Marks 'name' if their own face blinked. Returns False to retry on a later frame."""
+        if self.logger is None or self.action is None:
+            return True
+        if self.require_blink and not self.liveness.is_live(track_id, now):
+            return False
+        if self.liveness is not None:
+            self.liveness.consume(track_id)
+        status, msg = self.logger.mark_attendance(name, self.action)
+        punches.append((name, status, msg))
+        return True
+
+
+class Camera:
+    """
+    One source: its own capture + detection/tracking/liveness worker
+    (CapturePipeline) and an identification loop feeding the shared batcher.
+    """
+    def __init__(self, name, source, face_cascade, batcher, logger=None, action=None, require_blink=True,
+                 detect_every=5, identify_interval=0.5, realtime=True):
+        self.name = name
+        self.source = source
+        self.batcher = batcher
+        self.identify_interval = identify_interval
+        self.is_file = isinstance(source, str) and os.path.isfile(source)
+
+        self.video_capture = cv2.VideoCapture(source)
+        if not self.video_capture.isOpened():
+            raise RuntimeError(f"Could not open source {source!r}")
+        capture = _PacedCapture(self.video_capture) if self.is_file and realtime else self.video_capture
+
+        self.liveness = LivenessEngine() # blink state per tracked face
+        self.identity_cache = IdentityCache()
+        self.pipeline = CapturePipeline(capture, face_cascade, self.liveness, mirror=False,
+                                        tracker=FaceTracker(face_cascade, detect_every=detect_every),
+                                        render=False, stop_at_end=self.is_file)
+        self.marker = PresenceMarker(logger, action, self.liveness, require_blink)
+        self.identified = 0
+        self._running = False
+        self._thread = None
+
+    @property
+    def finished(self):
+        return self.pipeline.finished.is_set()
+
+    def start(self):
+        self._running = True
+        self.pipeline.start()
+        self._thread = threading.Thread(target=self._identify_loop, name=f"identify-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self.pipeline.stop()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        self.video_capture.release()
+
+    def _identify_loop(self):
+        last = None
+        while self._running:
+            latest = self.pipeline.latest()
+            if latest is None or latest is last:
+                if self.finished and latest is last:
+                    break
+                time.sleep(0.01)
+                continue
+            last = latest
+            started = time.monotonic()
+            try:
+                results = self._identify(latest.analysis)
+            except Exception as e:
+                print(f"[WARNING] [{self.name}] Identification failed: {e}")
+                results = []
+            self._report(latest, results)
+            time.sleep(max(0.0, self.identify_interval - (time.monotonic() - started)))
+
+    def _identify(self, analysis):
+        """Cached identities per track; only the misses go to the shared batch."""
+        results, cached = self.batcher.face_manager.identify_analysis(
+            analysis, cache=self.identity_cache, return_cached=True,
+            identify=lambda crops: self.batcher.submit(crops).result())
+        self.identified += cached.count(False)
+        return results
+
+    def _report(self, latest, results):
+        arrived, punches = self.marker.update(results, latest.analysis.track_ids)
+        for name in arrived:
+            print(f"[INFO] [{self.name}] {name} in view")
+        for name, status, msg in punches:
+            print(f"[INFO] [{self.name}] {msg}" if status == LOGGED else f"[INFO] [{self.name}] {name}: {msg}")
+
+
+def parse_source(source):
+    """Device indices are given as plain numbers; anything else is a path or URL."""
+    return int(source) if source.isdigit() else source
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless multi-camera attendance server (one shared face model).")
+    parser.add_argument("sources", nargs="+", help="Camera indices (0, 1...), video files or RTSP/HTTP URLs")
+    parser.add_argument("--action", help='Mark this action for recognised people (e.g. "Punch In"); default: only report')
+    parser.add_argument("--no-liveness", action="store_true", help="Do not require a blink before marking")
+    parser.add_argument("--db", default="attendance.db", help="SQLite database (default: attendance.db)")
+    parser.add_argument("--face-db", default="data", help="Enrolment folder (default: data)")
+    parser.add_argument("--search-backend", choices=("exact", "ivf"), default="exact")
+    parser.add_argument("--model", help="DeepFace model, e.g. Facenet512 or SFace (default: $ATTENDANCE_FACE_MODEL or VGG-Face)")
+    parser.add_argument("--precision", choices=PRECISIONS, help="Gallery storage precision (default: float32)")
+    parser.add_argument("--no-photo-scan", action="store_true",
+                        help="Trust the embedding store at startup instead of checking every enrolment photo")
+    parser.add_argument("--inference-workers", type=int, default=0, help="Embed faces in N worker processes (0 = in this process)")
+    parser.add_argument("--detect-every", type=int, default=5, help="Full face detection every N frames")
+    parser.add_argument("--identify-interval", type=float, default=0.5, help="Seconds between identifications per camera")
+    parser.add_argument("--batch-window", type=float, default=0.03, help="Seconds to wait for other cameras' faces")
+    parser.add_argument("--max-batch", type=int, default=32, help="Max faces per model batch")
+    parser.add_argument("--fast", action="store_true", help="Read video files as fast as possible instead of at their frame rate")
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds")
+    parser.add_argument("--metrics-port", type=int, help="Serve /metrics (Prometheus) and /metrics.json on this port")
+    parser.add_argument("--metrics-log", type=float, help="Seconds between [METRICS] log lines")
+    parser.add_argument("--stats-every", type=float, default=10.0, help="Seconds between stats lines (0 = off)")
+    args = parser.parse_args(argv)
+
+    if args.metrics_port is not None or args.metrics_log:
+        metrics.enable(args.metrics_port, args.metrics_log)
+    else:
+        metrics.enable_from_env()
+    face_manager = FaceManager(db_path=args.face_db, search_backend=args.search_backend, lazy=True,
+                               inference_workers=args.inference_workers, model_name=args.model, precision=args.precision,
+                               scan_photos=not args.no_photo_scan)
+    face_manager.start_warmup()
+    logger = AttendanceLogger(args.db) if args.action else None
+    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    batcher = BatchIdentifier(face_manager, window=args.batch_window, max_batch=args.max_batch)
+
+    cameras = []
+    for i, source in enumerate(args.sources):
+        try:
+            cameras.append(Camera(f"cam{i}", parse_source(source), face_cascade, batcher, logger, args.action,
+                                  require_blink=not args.no_liveness, detect_every=args.detect_every,
+                                  identify_interval=args.identify_interval, realtime=not args.fast))
+        except RuntimeError as e:
+            print(f"[WARNING] {e}")
+    if not cameras:
+        print("[WARNING] No source could be opened.")
+        return 1
+    for camera in cameras:
+        camera.start()
+        print(f"[INFO] [{camera.name}] Started on {camera.source!r}")
+
+    started = last_stats = time.monotonic()
+    try:
+        while not all(camera.finished for camera in cameras):
+            time.sleep(0.2)
+            now = time.monotonic()
+            if args.duration and now - started >= args.duration:
+                break
+            if args.stats_every and now - last_stats >= args.stats_every:
+                last_stats = now
+                for camera in cameras:
+                    stats = camera.pipeline.stats()
+                    print(f"[INFO] [{camera.name}] {stats['process_fps']:.1f} FPS, {stats['dropped']} dropped, "
+                          f"detect {stats.get('detect_ratio', 1.0):.0%} of frames, cache hit {camera.identity_cache.stats()['hit_rate']:.0%}")
+                print(f"[INFO] Model batches: {batcher.batches}, {batcher.mean_batch():.1f} faces/batch")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for camera in cameras:
+            camera.stop()
+        batcher.stop()
+        face_manager.close()
+        if logger is not None:
+            logger.close()
+    print(f"[INFO] Done: {sum(c.identified for c in cameras)} face(s) embedded in {batcher.batches} batch(es).")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,67 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime
+
+# Import this module first: the clock starts when it is imported
+_PROCESS_START = time.perf_counter()
+
+
+class StartupTimer:
+    """
+    Records how long each startup milestone (window shown, first camera frame,
+    face model ready...) took since the process started, and appends one JSON
+    line per run to logs/startup_times.jsonl so cold start can be compared
+    between releases.
+    """
+    def __init__(self, app, log_path=os.path.join("logs", "startup_times.jsonl")):
+        self.app = app
+        self.log_path = log_path
+        self.marks = {} # milestone -> seconds since process start
+        self._lock = threading.Lock()
+        self._saved = False
+
+    def mark(self, milestone):
+        """Records 'milestone' once (later calls are ignored). Thread-safe."""
+        with self._lock:
+            if milestone in self.marks:
+                return
+            self.marks[milestone] = time.perf_counter() - _PROCESS_START
+        print(f"[INFO] Startup: {milestone} after {self.marks[milestone]:.2f}s")
+
+    def save(self):
+        """Appends this run's marks to the log (once per run)."""
+        with self._lock:
+            if self._saved or not self.marks:
+                return
+            self._saved = True
+            record = {"app": self.app, "started": datetime.now().isoformat(timespec="seconds")}
+            record.update({k: round(v, 3) for k, v in self.marks.items()})
+        try:
+            os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            print(f"[WARNING] Could not record startup times: {e}")
+
+
+def summarize(log_path=os.path.join("logs", "startup_times.jsonl")):
+    """Prints the median of every milestone per app, e.g. to compare two releases."""
+    runs = {}
+    with open(log_path) as f:
+        for line in f:
+            record = json.loads(line)
+            app = runs.setdefault(record.pop("app", "?"), {})
+            record.pop("started", None)
+            for milestone, seconds in record.items():
+                app.setdefault(milestone, []).append(seconds)
+    for app, milestones in runs.items():
+        print(app)
+        for milestone, values in milestones.items():
+            values.sort()
+            print(f"  {milestone:<16} median {values[len(values) // 2]:.2f}s over {len(values)} run(s)")
+
+
+if __name__ == "__main__":
+    summarize()
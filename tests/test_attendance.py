@@ -0,0 +1,111 @@
+import pytest
+from attendance import AttendanceLogger, PUNCH_IN, PUNCH_OUT, LOGGED, DUPLICATE
+
+
+@pytest.fixture
+def logger(tmp_path):
+    logger = AttendanceLogger(str(tmp_path / "attendance.db"), sinks=[])
+    yield logger
+    logger.close()
+
+
+def punch(logger, name, action, ts):
+    logger._write((name, action, ts, ts[:10]))
+
+
+def summaries(logger, start, end):
+    return {(name, day): (first_in, last_out, worked, count)
+            for name, day, first_in, last_out, worked, count in logger.get_daily_summaries(start, end)}
+
+
+def test_summary_pairs_ins_and_outs(logger):
+    punch(logger, "alice", PUNCH_IN, "2026-03-02 09:00:00")
+    punch(logger, "alice", PUNCH_OUT, "2026-03-02 12:00:00")
+    punch(logger, "alice", PUNCH_IN, "2026-03-02 13:00:00")
+    punch(logger, "alice", PUNCH_OUT, "2026-03-02 17:30:00")
+    expected = {("alice", "2026-03-02"): ("2026-03-02 09:00:00", "2026-03-02 17:30:00", 7.5 * 3600, 4)}
+    assert summaries(logger, "2026-03-02", "2026-03-02") == expected
+    assert logger.rebuild_summaries() == 1
+    assert summaries(logger, "2026-03-02", "2026-03-02") == expected
+
+
+def overnight(logger):
+    punch(logger, "bob", PUNCH_IN, "2026-03-02 22:00:00")
+    punch(logger, "bob", PUNCH_OUT, "2026-03-03 06:00:00")
+    punch(logger, "bob", PUNCH_IN, "2026-03-03 22:00:00")
+    punch(logger, "bob", PUNCH_OUT, "2026-03-04 06:30:00")
+    return {
+        ("bob", "2026-03-02"): ("2026-03-02 22:00:00", "2026-03-03 06:00:00", 8 * 3600, 1),
+        ("bob", "2026-03-03"): ("2026-03-03 22:00:00", "2026-03-04 06:30:00", 8.5 * 3600, 2),
+        ("bob", "2026-03-04"): (None, None, 0, 1),
+    }
+
+
+def open_ins(logger):
+    return logger._query("SELECT date_str, open_in FROM attendance_daily ORDER BY date_str")
+
+
+def test_overnight_shift_belongs_to_the_day_it_started(logger):
+    expected = overnight(logger)
+    assert summaries(logger, "2026-03-02", "2026-03-04") == expected
+    assert all(open_in is None for _, open_in in open_ins(logger))
+    logger.rebuild_summaries()
+    assert summaries(logger, "2026-03-02", "2026-03-04") == expected
+
+
+def test_out_only_closes_yesterday_when_first_and_close_enough(logger):
+    # Forgot to punch out yesterday: today's Outs must not reach back 32 h
+    punch(logger, "eve", PUNCH_IN, "2026-03-02 09:00:00")
+    punch(logger, "eve", PUNCH_IN, "2026-03-03 09:00:00")
+    punch(logger, "eve", PUNCH_OUT, "2026-03-03 12:00:00")
+    punch(logger, "eve", PUNCH_OUT, "2026-03-03 17:00:00")
+    # First punch of the day, but 17 h after the open In
+    punch(logger, "eve", PUNCH_IN, "2026-03-04 07:00:00")
+    punch(logger, "eve", PUNCH_OUT, "2026-03-05 00:00:01")
+    assert summaries(logger, "2026-03-02", "2026-03-05") == {
+        ("eve", "2026-03-02"): ("2026-03-02 09:00:00", None, 0, 1),
+        ("eve", "2026-03-03"): ("2026-03-03 09:00:00", "2026-03-03 17:00:00", 3 * 3600, 3),
+        ("eve", "2026-03-04"): ("2026-03-04 07:00:00", None, 0, 1),
+        ("eve", "2026-03-05"): (None, "2026-03-05 00:00:01", 0, 1),
+    }
+
+
+def test_range_rebuild_ending_on_an_overnight_in_day(logger):
+    expected = overnight(logger)
+    logger.rebuild_summaries("2026-03-02", "2026-03-02")
+    assert summaries(logger, "2026-03-02", "2026-03-04") == expected
+    assert open_ins(logger)[0] == ("2026-03-02", None) # not reopened: a later Out can't credit it twice
+    punch(logger, "bob", PUNCH_OUT, "2026-03-04 07:00:00")
+    assert summaries(logger, "2026-03-02", "2026-03-02") == {("bob", "2026-03-02"): expected[("bob", "2026-03-02")]}
+
+
+def test_range_rebuild_starting_on_an_overnight_out_day(logger):
+    expected = overnight(logger)
+    assert logger.rebuild_summaries("2026-03-03") == 2
+    assert summaries(logger, "2026-03-02", "2026-03-04") == expected
+    assert logger.rebuild_summaries("2026-03-04", "2026-03-04") == 1
+    assert summaries(logger, "2026-03-02", "2026-03-04") == expected
+
+
+def test_dedup_window_survives_restart(tmp_path):
+    db = str(tmp_path / "attendance.db")
+    first = AttendanceLogger(db, sinks=[], dedup_window=60.0)
+    assert first.mark_attendance("carol", PUNCH_IN)[0] == LOGGED
+    assert first.mark_attendance("carol", PUNCH_IN)[0] == DUPLICATE
+    first.close()
+
+    restarted = AttendanceLogger(db, sinks=[], dedup_window=60.0)
+    try:
+        assert restarted.mark_attendance("carol", PUNCH_IN)[0] == DUPLICATE
+        assert restarted.mark_attendance("carol", PUNCH_OUT)[0] == LOGGED
+        assert len(restarted.get_todays_logs()) == 2
+    finally:
+        restarted.close()
+
+
+def test_no_dedup_window_logs_every_punch(tmp_path):
+    logger = AttendanceLogger(str(tmp_path / "attendance.db"), sinks=[], dedup_window=0)
+    try:
+        assert [logger.mark_attendance("dave", PUNCH_IN)[0] for _ in range(2)] == [LOGGED, LOGGED]
+    finally:
+        logger.close()
@@ -0,0 +1,30 @@
+import threading
+from capture import FrameQueue
+
+
+def test_drops_the_oldest_frame_when_full():
+    frames = FrameQueue(maxsize=2)
+    assert [frames.put(i) for i in range(5)] == [False, False, True, True, True]
+    assert frames.dropped == 3 and len(frames) == 2
+    assert [frames.get(timeout=0), frames.get(timeout=0)] == [3, 4]
+
+
+def test_get_times_out_when_empty():
+    assert FrameQueue().get(timeout=0.01) is None
+
+
+def test_close_wakes_a_waiting_consumer():
+    frames = FrameQueue()
+    got = []
+    consumer = threading.Thread(target=lambda: got.append(frames.get()))
+    consumer.start()
+    frames.close()
+    consumer.join(timeout=2)
+    assert not consumer.is_alive() and got == [None]
+
+
+def test_close_still_hands_out_queued_frames():
+    frames = FrameQueue()
+    frames.put("last")
+    frames.close()
+    assert frames.get() == "last" and frames.get() is None
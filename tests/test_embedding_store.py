@@ -0,0 +1,159 @@
+import multiprocessing
+import numpy as np
+import pytest
+from gallery import EmbeddingGallery, encode, decode
+from embedding_store import EmbeddingStore, StaleStoreError
+
+DIM = 64
+
+
+def vectors(n, seed=0):
+    return EmbeddingGallery.normalize(np.random.default_rng(seed).standard_normal((n, DIM)))
+
+
+def make_gallery(precision="float32"):
+    gallery = EmbeddingGallery(precision=precision)
+    rows = vectors(3)
+    gallery.load([("alice", "alice", rows[0]), ("alice", "alice__2", rows[1]), ("bob", "bob", rows[2])])
+    return gallery
+
+
+def reload(path, precision="float32"):
+    """A fresh store on 'path', as another process would open it: (store, snapshot, samples by key)."""
+    store = EmbeddingStore(path, precision=precision)
+    snapshot = store.open()
+    samples = {key: snapshot.vector(row) for row, key in enumerate(snapshot.keys)}
+    for op in snapshot.ops:
+        if op["op"] == "add":
+            samples[op["key"]] = snapshot.vector(op["row"])
+        else:
+            samples.pop(op["key"], None)
+    return store, snapshot, samples
+
+
+def test_compact_then_reload(tmp_path):
+    gallery = make_gallery()
+    store = EmbeddingStore(str(tmp_path))
+    store.compact(gallery, {"alice": 1.0, "alice__2": 2.0, "bob": 3.0})
+
+    _, snapshot, samples = reload(str(tmp_path))
+    assert snapshot.names == ["alice", "bob"]
+    assert snapshot.offsets == [0, 2, 3]
+    assert snapshot.stamps == [1.0, 2.0, 3.0]
+    assert snapshot.ops == []
+    np.testing.assert_array_equal(snapshot.templates, gallery.matrix)
+    np.testing.assert_array_equal(samples["alice__2"], gallery.samples["alice"][1])
+
+
+def test_append_then_reload(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.compact(make_gallery(), {})
+    carol = vectors(1, seed=1)
+    store.append("carol", "carol", 4.0, carol[0])
+    store.remove("bob")
+
+    _, snapshot, samples = reload(str(tmp_path))
+    assert [op["op"] for op in snapshot.ops] == ["add", "remove"]
+    assert snapshot.ops[0]["owner"] == "carol" and snapshot.ops[0]["stamp"] == 4.0
+    assert sorted(samples) == ["alice", "alice__2", "carol"]
+    np.testing.assert_array_equal(samples["carol"], carol[0])
+
+
+def test_truncated_last_journal_line_is_ignored(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.compact(make_gallery(), {})
+    store.append("carol", "carol", 4.0, vectors(1, seed=1)[0])
+    store.append("dave", "dave", 5.0, vectors(1, seed=2)[0])
+    journal = store._file("journal", store.meta["generation"])
+    with open(journal, "rb+") as f: # crash half-way through the last line
+        f.truncate(f.seek(0, 2) - 10)
+
+    store, snapshot, samples = reload(str(tmp_path))
+    assert [op["key"] for op in snapshot.ops] == ["carol"]
+    assert "dave" not in samples
+    assert store.journal_entries == 1
+
+
+def test_append_after_another_process_compacted(tmp_path):
+    stale = EmbeddingStore(str(tmp_path))
+    stale.compact(make_gallery(), {})
+    other, _, _ = reload(str(tmp_path))
+    other.compact(make_gallery(), {})
+    old_generation = stale.meta["generation"]
+
+    with pytest.raises(StaleStoreError):
+        stale.append("carol", "carol", 4.0, vectors(1, seed=1)[0])
+    with pytest.raises(StaleStoreError):
+        stale.remove("bob")
+    assert not (tmp_path / f"samples.{old_generation}.bin").exists()
+    assert not (tmp_path / f"journal.{old_generation}.log").exists()
+
+    stale.open()
+    stale.append("carol", "carol", 4.0, vectors(1, seed=1)[0])
+    assert "carol" in reload(str(tmp_path))[2]
+
+
+def _append_many(path, writer, count):
+    store = EmbeddingStore(path)
+    store.open()
+    for i in range(count):
+        store.append(f"{writer}_{i}", writer, float(i), np.full(DIM, writer * 1000 + i, dtype=np.float32))
+
+
+def test_concurrent_writers_keep_rows_and_journal_in_step(tmp_path):
+    EmbeddingStore(str(tmp_path)).compact(make_gallery(), {})
+    workers = [multiprocessing.Process(target=_append_many, args=(str(tmp_path), writer, 400)) for writer in (1, 2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+        assert worker.exitcode == 0
+
+    _, snapshot, samples = reload(str(tmp_path))
+    assert len(snapshot.ops) == 800
+    for op in snapshot.ops:
+        writer, i = op["key"].split("_")
+        assert samples[op["key"]][0] == int(writer) * 1000 + int(i)
+
+
+@pytest.mark.parametrize("precision, tolerance", [("float16", 1e-3), ("int8", 1e-2)])
+def test_reduced_precision_round_trip(tmp_path, precision, tolerance):
+    reference = make_gallery()
+    gallery = make_gallery(precision)
+    store = EmbeddingStore(str(tmp_path), precision=precision)
+    store.compact(gallery, {})
+    carol = vectors(1, seed=1)
+    store.append("carol", "carol", 4.0, encode(carol, precision))
+
+    store, snapshot, samples = reload(str(tmp_path), precision)
+    assert store.stored_precision == precision
+    np.testing.assert_allclose(samples["alice__2"], reference.samples["alice"][1], atol=tolerance)
+    np.testing.assert_allclose(samples["carol"], carol[0], atol=tolerance)
+    np.testing.assert_allclose(snapshot.templates, reference.matrix, atol=tolerance)
+    assert snapshot.templates.dtype == np.float32
+    np.testing.assert_array_equal(snapshot.templates, gallery.matrix) # written float32, not quantised
+    stored = np.concatenate([decode(gallery.samples["alice"]), decode(gallery.samples["bob"])])
+    np.testing.assert_array_equal(decode(snapshot.samples[:3]), stored) # no second rounding on disk
+
+
+def test_reads_templates_quantised_by_older_stores(tmp_path):
+    gallery = make_gallery("int8")
+    store = EmbeddingStore(str(tmp_path), precision="int8")
+    store.compact(gallery, {})
+    meta = dict(store.meta)
+    del meta["templates"]
+    store._write_meta(meta)
+    with open(store._file("templates", meta["generation"]), "wb") as f:
+        f.write(encode(gallery.matrix, "int8").tobytes())
+
+    _, snapshot, _ = reload(str(tmp_path), "int8")
+    np.testing.assert_allclose(snapshot.templates, gallery.matrix, atol=1e-2)
+
+
+def test_known_model_size_is_enforced_from_the_first_sample(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=DIM)
+    store.compact(EmbeddingGallery(), {})
+    assert store.meta["dim"] == DIM
+    with pytest.raises(ValueError):
+        store.append("alice", "alice", 1.0, np.ones(DIM // 2, dtype=np.float32))
+    store.append("alice", "alice", 1.0, vectors(1)[0])
@@ -0,0 +1,71 @@
+import csv
+import sys
+import gzip
+import pytest
+from attendance import AttendanceLogger, PUNCH_IN, PUNCH_OUT
+from export_logs import export_logs, HEADER, SUMMARY_HEADER
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "attendance.db")
+    logger = AttendanceLogger(path, sinks=[])
+    for day in ("2026-03-02", "2026-03-03"):
+        for name in ("alice", "bob"):
+            logger._write((name, PUNCH_IN, f"{day} 09:00:00", day))
+            logger._write((name, PUNCH_OUT, f"{day} 17:00:00", day))
+    logger.close()
+    return path
+
+
+def read(path, opener=open):
+    with opener(path, "rt", newline="") as f:
+        return list(csv.reader(f))
+
+
+@pytest.mark.parametrize("fmt, opener", [("csv", open), ("csv.gz", gzip.open)])
+def test_round_trip_in_chunks(db, tmp_path, fmt, opener):
+    output = str(tmp_path / f"out.{fmt}")
+    assert export_logs(db, output, chunk_size=3, progress=False) == (output, 8)
+    rows = read(output, opener)
+    assert rows[0] == HEADER and len(rows) == 9
+    assert rows[1][1:] == ["alice", PUNCH_IN, "2026-03-02 09:00:00", "2026-03-02"]
+
+
+def test_filters_by_date_and_name(db, tmp_path):
+    output = str(tmp_path / "out.csv")
+    _, count = export_logs(db, output, start="2026-03-03", end="2026-03-03", name="bob", progress=False)
+    rows = read(output)[1:]
+    assert count == 2 and {(row[1], row[4]) for row in rows} == {("bob", "2026-03-03")}
+
+
+def test_summary_export(db, tmp_path):
+    output = str(tmp_path / "summary.csv")
+    assert export_logs(db, output, summary=True, progress=False)[1] == 4
+    rows = read(output)
+    assert rows[0] == SUMMARY_HEADER
+    assert rows[1] == ["alice", "2026-03-02", "2026-03-02 09:00:00", "2026-03-02 17:00:00", str(8 * 3600), "2"]
+
+
+def test_unknown_format_raises(db, tmp_path):
+    with pytest.raises(ValueError):
+        export_logs(db, str(tmp_path / "out.xlsx"), fmt="xlsx", progress=False)
+
+
+def test_parquet_without_pyarrow_raises(db, tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    with pytest.raises(RuntimeError):
+        export_logs(db, str(tmp_path / "out.parquet"), progress=False)
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_arrow_round_trip(db, tmp_path, fmt):
+    pa = pytest.importorskip("pyarrow")
+    output = str(tmp_path / f"out.{fmt}")
+    assert export_logs(db, output, chunk_size=3, progress=False)[1] == 8
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        table = pq.read_table(output)
+    else:
+        table = pa.ipc.open_file(output).read_all()
+    assert table.column_names == HEADER and table.num_rows == 8
@@ -0,0 +1,165 @@
+import numpy as np
+import pytest
+from face_auth import FaceManager, _default_threshold
+from gallery import EmbeddingGallery
+
+
+def unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def pair_at_distance(distance, dim=512, seed=0):
+    """Two unit vectors whose cosine distance is exactly 'distance'."""
+    rng = np.random.default_rng(seed)
+    a = unit(rng.standard_normal(dim))
+    b = rng.standard_normal(dim)
+    b = unit(b - (b @ a) * a)
+    similarity = 1.0 - distance
+    return a, unit(similarity * a + np.sqrt(1 - similarity ** 2) * b)
+
+
+def represent(image):
+    if "error" in image:
+        raise image["error"]
+    return image["embedding"]
+
+
+@pytest.fixture
+def make_manager(tmp_path, monkeypatch):
+    """FaceManager with a stubbed model: each image is a dict {"embedding": vector} or {"error": exception}."""
+    def make(model_name, **options):
+        monkeypatch.setattr(FaceManager, "_represent", lambda self, image, enforce_detection: represent(image))
+        monkeypatch.setattr("cv2.imwrite", lambda path, image: open(path, "wb").close() or True)
+        manager = FaceManager(db_path=str(tmp_path / "faces"), lazy=True, model_name=model_name, **options)
+        manager.threshold = _default_threshold(model_name)
+        manager._load_gallery()
+        manager.state = manager.READY
+        manager._ready.set()
+        return manager
+    return make
+
+
+def test_duplicate_check_never_looser_than_model_threshold(make_manager):
+    manager = make_manager("Facenet512")
+    assert manager.threshold < 0.50
+    # Different people: further apart than Facenet512's threshold, closer than 0.50
+    alice, bob = pair_at_distance((manager.threshold + 0.50) / 2)
+    assert manager.register_face({"embedding": alice}, "alice")[0]
+
+    assert manager.check_existing_face({"embedding": bob}) is None
+    assert manager.register_face({"embedding": bob}, "bob")[0]
+    assert sorted(manager.gallery.names) == ["alice", "bob"]
+
+
+def test_duplicate_check_still_catches_the_same_person(make_manager):
+    manager = make_manager("Facenet512")
+    alice, alice_again = pair_at_distance(manager.threshold / 2)
+    manager.register_face({"embedding": alice}, "alice")
+    assert manager.check_existing_face({"embedding": alice_again}) == "alice"
+
+
+def test_ivf_manager_restarts_after_journalled_delete(make_manager, capsys):
+    manager = make_manager("Facenet512", search_backend="ivf")
+    people = EmbeddingGallery.normalize(np.random.default_rng(3).standard_normal((3, 512)))
+    for name, vector in zip(("alice", "bob", "carol"), people):
+        assert manager.register_face({"embedding": vector}, name)[0]
+    manager.store.compact(manager.gallery, manager._stamps)
+    assert manager.delete_user("bob")[0]
+    generation = manager.store.meta["generation"]
+
+    restarted = make_manager("Facenet512", search_backend="ivf")
+    assert "unreadable" not in capsys.readouterr().out
+    assert restarted.store.meta["generation"] == generation # replayed, not rebuilt
+    assert sorted(restarted.gallery.names) == ["alice", "carol"]
+    assert len(restarted.gallery.index.assignments) == 2
+    assert restarted.identify_face({"embedding": people[2]})[0] == "carol"
+
+
+def test_photo_scan_can_be_skipped(make_manager, monkeypatch):
+    manager = make_manager("Facenet512")
+    manager.register_face({"embedding": unit(np.ones(512))}, "alice")
+    scans = []
+    monkeypatch.setattr(FaceManager, "_list_images", lambda self: scans.append(1) or {})
+
+    restarted = make_manager("Facenet512", scan_photos=False)
+    assert restarted.gallery.names == ["alice"] and scans == []
+    make_manager("Facenet512") # the default still drops samples whose photo is gone
+    assert scans == [1]
+
+
+def test_enrolment_reports_model_failures(make_manager, monkeypatch):
+    import metrics
+    backend = metrics.Metrics()
+    monkeypatch.setattr(metrics, "_backend", backend)
+    manager = make_manager("Facenet512")
+    ok, msg = manager.register_face({"error": RuntimeError("model crashed")}, "alice")
+    assert not ok and "model crashed" in msg
+    ok, msg = manager.register_face({"error": ValueError("Face could not be detected in the image.")}, "alice")
+    assert (ok, msg) == (False, "No face detected.")
+    manager.register_face({"embedding": unit(np.ones(512))}, "alice")
+    ok, msg = manager.add_face_sample({"error": OSError("weights missing")}, "alice")
+    assert not ok and "weights missing" in msg
+
+    counters = backend.snapshot()["counters"]
+    assert counters['identify_errors_total{reason="RuntimeError",stage="register_face"}'] == 1
+    assert counters['identify_errors_total{reason="no_face",stage="register_face"}'] == 1
+    assert counters['identify_errors_total{reason="OSError",stage="add_face_sample"}'] == 1
+
+
+def test_enrolment_without_a_face_is_a_no_face_error(tmp_path):
+    from face_auth import _is_no_face_error
+    manager = FaceManager(db_path=str(tmp_path / "faces"), lazy=True)
+    with pytest.raises(ValueError) as error:
+        manager._face_crop(np.zeros((120, 120, 3), dtype=np.uint8), enforce_detection=True)
+    assert _is_no_face_error(error.value)
+    blank = np.zeros((120, 160, 3), dtype=np.uint8)
+    assert manager._face_crop(blank, enforce_detection=False) is blank
+
+
+def test_align_face_leaves_crops_without_two_eyes_alone():
+    from face_auth import align_face, preprocess_face
+    crop = np.full((90, 80, 3), 128, dtype=np.uint8)
+    assert align_face(crop) is crop
+    assert preprocess_face(crop, (224, 224)).shape == (224, 224, 3)
+
+
+class FakeAnalysis:
+    def __init__(self, track_ids):
+        self.faces = [(10 * i, 0, 50, 50) for i in range(len(track_ids))]
+        self.track_ids = track_ids
+
+    def crop(self, i):
+        return np.full((8, 8, 3), self.track_ids[i], dtype=np.uint8)
+
+    def crops(self):
+        return [self.crop(i) for i in range(len(self.faces))]
+
+
+def test_identify_analysis_reuses_cached_tracks_on_the_given_clock(tmp_path):
+    from identity_cache import IdentityCache
+    manager = FaceManager(db_path=str(tmp_path / "faces"), lazy=True)
+    cache = IdentityCache(reverify_interval=5.0)
+    batches = []
+    def identify(crops):
+        batches.append([int(crop[0, 0, 0]) for crop in crops])
+        return [(f"user{int(crop[0, 0, 0])}", 0.1) for crop in crops]
+
+    results, cached = manager.identify_analysis(FakeAnalysis([1, 2]), cache, now=100.0, identify=identify, return_cached=True)
+    assert results == [("user1", 0.1), ("user2", 0.1)] and cached == [False, False]
+    results, cached = manager.identify_analysis(FakeAnalysis([1, 3]), cache, now=101.0, identify=identify, return_cached=True)
+    assert results == [("user1", 0.1), ("user3", 0.1)] and cached == [True, False]
+    assert manager.identify_analysis(FakeAnalysis([1]), cache, now=106.0, identify=identify) == [("user1", 0.1)]
+    assert batches == [[1, 2], [3], [1]] # re-verified once reverify_interval passed on the replay clock
+
+    results, cached = manager.identify_analysis(FakeAnalysis([1, 2]), identify=identify, return_cached=True)
+    assert cached == [False, False] and batches[-1] == [1, 2]
+
+
+def test_warm_up_checks_the_model_embedding_size(tmp_path, monkeypatch):
+    manager = FaceManager(db_path=str(tmp_path / "faces"), lazy=True, model_name="Facenet512")
+    monkeypatch.setattr(manager, "_network", lambda: (lambda batch, training=False: np.ones((len(batch), 128)), (8, 8)))
+    with pytest.raises(ValueError, match="128-d"):
+        manager._warm_up()
+    monkeypatch.setattr(manager, "_network", lambda: (lambda batch, training=False: np.ones((len(batch), 512)), (8, 8)))
+    manager._warm_up()
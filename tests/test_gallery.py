@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+from gallery import EmbeddingGallery, encode, decode, convert, precision_of
+
+
+def axis(i, dim=8):
+    vector = np.zeros(dim, dtype=np.float32)
+    vector[i] = 1.0
+    return vector
+
+
+def rerank_gallery(rerank_k):
+    """alice's mean template is further from axis(0) than bob's, but one of her samples is exact."""
+    gallery = EmbeddingGallery(rerank_k=rerank_k)
+    gallery.add("alice", "a1.jpg", axis(0))
+    gallery.add("alice", "a2.jpg", axis(1))
+    gallery.add("bob", "b1.jpg", axis(0) + 0.5 * axis(2))
+    return gallery
+
+
+def test_rerank_scores_candidates_by_their_closest_sample():
+    matches = rerank_gallery(rerank_k=5).search(axis(0), k=2)
+    assert [name for name, _ in matches] == ["alice", "bob"]
+    assert matches[0][1] == pytest.approx(0.0, abs=1e-6)
+    assert matches[1][1] == pytest.approx(1 - 1 / np.sqrt(1.25), abs=1e-6)
+
+
+def test_rerank_only_sees_the_template_shortlist():
+    assert rerank_gallery(rerank_k=2).search(axis(0))[0][0] == "alice"
+    assert rerank_gallery(rerank_k=1).search(axis(0))[0][0] == "bob"
+
+
+def test_same_key_replaces_the_sample():
+    gallery = EmbeddingGallery()
+    gallery.add("alice", "a1.jpg", axis(0))
+    gallery.add("alice", "a1.jpg", axis(1))
+    assert gallery.sample_keys["alice"] == ["a1.jpg"]
+    assert gallery.search(axis(1))[0][1] == pytest.approx(0.0, abs=1e-6)
+
+
+def test_remove_sample_refreshes_template_and_drops_last():
+    gallery = EmbeddingGallery()
+    gallery.add("alice", "a1.jpg", axis(0))
+    gallery.add("alice", "a2.jpg", axis(1))
+    gallery.add("bob", "b1.jpg", axis(2))
+    assert gallery.remove_sample("alice", "a2.jpg")
+    np.testing.assert_allclose(gallery.matrix[gallery.names.index("alice")], axis(0))
+    assert gallery.remove_sample("alice", "a1.jpg") and "alice" not in gallery
+    assert not gallery.remove_sample("alice", "a1.jpg")
+    assert gallery.names == ["bob"] and gallery.search(axis(2))[0][0] == "bob"
+
+
+def test_medoid_template_ignores_an_outlier():
+    gallery = EmbeddingGallery(aggregate="medoid")
+    gallery.add("alice", "a1.jpg", axis(0) + 0.1 * axis(1))
+    gallery.add("alice", "a2.jpg", axis(0) + 0.1 * axis(2))
+    gallery.add("alice", "a3.jpg", axis(0))
+    gallery.add("alice", "bad.jpg", axis(7))
+    np.testing.assert_allclose(gallery.matrix[0], axis(0))
+
+
+def test_load_matches_incremental_adds():
+    entries = [("alice", "a1.jpg", axis(0)), ("alice", "a2.jpg", axis(1)), ("bob", "b1.jpg", axis(2))]
+    loaded, added = EmbeddingGallery(), EmbeddingGallery()
+    loaded.load(entries)
+    for entry in entries:
+        added.add(*entry)
+    assert loaded.names == added.names
+    np.testing.assert_allclose(loaded.matrix, added.matrix)
+    probes = np.stack([axis(0), axis(2), axis(1) + axis(2)])
+    assert loaded.search_many(probes, k=2) == added.search_many(probes, k=2)
+
+
+@pytest.mark.parametrize("precision, tolerance", [("float32", 0), ("float16", 1e-3), ("int8", 1e-2)])
+def test_encode_decode_round_trip(precision, tolerance):
+    vectors = EmbeddingGallery.normalize(np.random.default_rng(0).normal(size=(10, 128)))
+    rows = encode(vectors, precision)
+    assert precision_of(rows) == precision
+    np.testing.assert_allclose(decode(rows), vectors, atol=tolerance)
+    assert convert(rows, precision) is rows
+
+
+def test_int8_scales_each_row_and_keeps_zero_rows():
+    vectors = np.stack([axis(0) * 0.01, axis(1) * 10, np.zeros(8, dtype=np.float32)])
+    rows = encode(vectors, "int8")
+    assert rows["values"][0, 0] == 127 and rows["values"][1, 1] == 127
+    np.testing.assert_allclose(decode(rows), vectors, rtol=1e-6)
+
+
+def test_reduced_precision_gallery_ranks_like_float32():
+    rng = np.random.default_rng(1)
+    entries = [(f"user{i}", f"{i}-{j}.jpg", rng.normal(size=128)) for i in range(20) for j in range(3)]
+    probes = np.stack([entries[i][2] for i in range(0, 60, 6)]) + 0.5 * rng.normal(size=(10, 128))
+    exact = EmbeddingGallery()
+    exact.load(entries)
+    for precision in ("float16", "int8"):
+        reduced = EmbeddingGallery(precision=precision)
+        reduced.load(entries)
+        assert precision_of(reduced.samples["user0"]) == precision
+        for want, got in zip(exact.search_many(probes, k=3), reduced.search_many(probes, k=3)):
+            assert got[0][0] == want[0][0]
+            np.testing.assert_allclose([d for _, d in got], [d for _, d in want], atol=2e-2)
+
+
+def test_attach_converts_samples_to_the_gallery_precision():
+    samples = EmbeddingGallery.normalize(np.stack([axis(0), axis(1), axis(2)]))
+    gallery = EmbeddingGallery(precision="int8")
+    gallery.attach(["alice", "bob"], samples[[0, 2]], samples, [0, 2, 3], ["a1", "a2", "b1"])
+    assert precision_of(gallery.samples["alice"]) == "int8" and gallery.sample_keys["alice"] == ["a1", "a2"]
+    assert gallery.search(axis(1))[0] == ("alice", pytest.approx(0.0, abs=1e-6))
+
+
+def test_unknown_precision_raises():
+    with pytest.raises(ValueError):
+        EmbeddingGallery(precision="int4")
@@ -0,0 +1,73 @@
+from identity_cache import IdentityCache, iou
+
+BOX = (100, 100, 80, 80)
+
+
+def shifted(box, dx):
+    x, y, w, h = box
+    return (x + dx, y, w, h)
+
+
+def test_iou():
+    assert iou(BOX, BOX) == 1.0
+    assert iou(BOX, shifted(BOX, 200)) == 0.0
+    assert abs(iou(BOX, shifted(BOX, 40)) - 1 / 3) < 1e-9
+
+
+def test_confident_identity_is_reused_until_reverified():
+    cache = IdentityCache(reverify_interval=5.0, ttl=2.0)
+    ids, results = cache.lookup([BOX], now=0.0)
+    assert results == [None]
+    cache.update(ids[0], ("alice", 0.2), now=0.0)
+
+    for now, dx in ((1.0, 5), (2.5, 10), (4.0, 15), (4.9, 15)): # the face drifts a little: same track
+        track_ids, results = cache.lookup([shifted(BOX, dx)], now=now)
+        assert track_ids == ids and results == [("alice", 0.2)]
+    assert cache.lookup([shifted(BOX, 15)], now=5.1)[1] == [None] # time to embed again
+    assert cache.stats()["hits"] == 4 and cache.stats()["misses"] == 2
+
+
+def test_unknown_and_distant_matches_are_not_cached():
+    cache = IdentityCache(max_distance=0.3)
+    (track,), _ = cache.lookup([BOX], now=0.0)
+    cache.update(track, ("Unknown", 0.0), now=0.0)
+    assert cache.lookup([BOX], now=0.1)[1] == [None]
+    cache.update(track, ("bob", 0.35), now=0.1)
+    assert cache.lookup([BOX], now=0.2)[1] == [None]
+
+
+def test_track_expires_after_ttl():
+    cache = IdentityCache(ttl=2.0)
+    (first,), _ = cache.lookup([BOX], now=0.0)
+    cache.update(first, ("alice", 0.2), now=0.0)
+    (second,), results = cache.lookup([BOX], now=2.5) # nobody seen for longer than ttl
+    assert second != first and results == [None]
+    assert len(cache) == 1
+
+
+def test_gallery_change_drops_identities():
+    cache = IdentityCache()
+    cache.sync(1)
+    (track,), _ = cache.lookup([BOX], now=0.0)
+    cache.update(track, ("alice", 0.2), now=0.0)
+    cache.sync(1)
+    assert cache.lookup([BOX], now=0.1)[1] == [("alice", 0.2)]
+    cache.sync(2) # someone enrolled or was deleted
+    assert cache.lookup([BOX], now=0.2)[1] == [None]
+
+
+def test_least_recently_seen_tracks_are_evicted():
+    cache = IdentityCache(max_tracks=2, ttl=100.0)
+    for i, track_id in enumerate((1, 2, 3)):
+        cache.lookup([shifted(BOX, 300 * i)], now=float(i), track_ids=[track_id])
+        cache.update(track_id, (f"user{track_id}", 0.1), now=float(i))
+    assert len(cache) == 2
+    assert cache.lookup([BOX], now=3.0, track_ids=[1])[1] == [None] # evicted
+    assert cache.lookup([shifted(BOX, 600)], now=3.0, track_ids=[3])[1] == [("user3", 0.1)]
+
+
+def test_each_track_continues_at_most_one_box():
+    cache = IdentityCache()
+    (track,), _ = cache.lookup([BOX], now=0.0)
+    ids, _ = cache.lookup([BOX, shifted(BOX, 10)], now=0.1)
+    assert ids[0] == track and ids[1] != track
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from inference_pool import InferencePool
+from face_auth import embed_faces
+
+
+def _network(batch, training=False):
+    if (batch > 0.9).any(): # a white crop stands in for a model failure
+        raise RuntimeError("model failure")
+    return batch.reshape(len(batch), -1)[:, :8] + 1.0
+
+
+def fake_model_loader(threads):
+    return _network, (4, 4)
+
+
+@pytest.fixture
+def pool():
+    pool = InferencePool(workers=2, slot_bytes=4096, min_chunk=1, model_loader=fake_model_loader)
+    yield pool
+    pool.close()
+
+
+def crops(*values):
+    return [np.full((4, 4, 3), value, dtype=np.uint8) for value in values]
+
+
+def gradients(count):
+    """Crops with a different gradient each, so every crop has its own embedding."""
+    ramp = np.arange(48, dtype=np.float64).reshape(4, 4, 3)
+    return [np.uint8((ramp * (i + 1) + 7 * i) % 200) for i in range(count)]
+
+
+def test_embed_splits_across_workers_in_order(pool):
+    images = gradients(7)
+    embeddings = pool.embed(images)
+    expected = embed_faces(_network, (4, 4), images) # what one process computes
+    assert embeddings.shape == (7, 8)
+    assert len({row.tobytes() for row in expected}) == 7
+    for got, want in zip(embeddings, expected):
+        np.testing.assert_allclose(got, want, rtol=1e-5)
+
+
+def test_failed_chunk_returns_every_slot(pool):
+    slots = pool._slots.qsize()
+    for _ in range(slots + 1): # would block forever if slots leaked
+        with pytest.raises(RuntimeError):
+            pool.embed(crops(255, 255, 10, 10))
+        assert pool._slots.qsize() == slots
+    assert pool.embed(crops(10, 20)).shape == (2, 8)
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from liveness import LivenessEngine
+
+
+class FakeEyeCascade:
+    """Finds as many eyes as the next number in 'counts'."""
+    def __init__(self, counts):
+        self.counts = iter(counts)
+
+    def detectMultiScale(self, roi, **kwargs):
+        return [(0, 0, 20, 20)] * next(self.counts)
+
+
+class FakeAnalysis:
+    def __init__(self, track_ids):
+        self.faces = [(0, 0, 64, 64)] * len(track_ids)
+        self.track_ids = track_ids
+
+    def gray_crop(self, i):
+        return np.zeros((64, 64), dtype=np.uint8)
+
+
+def run(engine, counts, track_id=1, step=0.1):
+    """Feeds one face through 'counts' eye detections; returns (blinks, live at the end)."""
+    engine.eye_cascade = FakeEyeCascade(counts)
+    blinks = 0
+    for frame in range(len(counts)):
+        (_, blinked, live), = engine.update(FakeAnalysis([track_id]), now=frame * step)
+        blinks += blinked
+    return blinks, live
+
+
+@pytest.fixture
+def engine():
+    return LivenessEngine(signal="haar")
+
+
+def test_losing_one_eye_is_not_a_blink(engine):
+    assert run(engine, [2] * 8 + [1, 1] + [2] * 3 + [1] + [2] * 3) == (0, False)
+
+
+def test_both_eyes_disappearing_briefly_is_a_blink(engine):
+    assert run(engine, [2] * 8 + [0, 0] + [2] * 3) == (1, True)
+
+
+def test_long_closure_is_not_a_blink(engine):
+    assert run(engine, [2] * 8 + [0] * 10 + [2] * 3) == (0, False)
+
+
+def test_no_blinks_during_warmup(engine):
+    assert run(engine, [2, 0, 2, 2]) == (0, False)
+
+
+def test_consume_spends_the_blink(engine):
+    run(engine, [2] * 8 + [0] + [2] * 2)
+    assert engine.is_live(1, now=1.5)
+    assert not engine.is_live(1, now=1.0 + engine.window + 1)
+    engine.consume(1)
+    assert not engine.is_live(1, now=1.5)
+
+
+def test_blinks_only_count_for_the_face_that_blinked(engine):
+    counts = []
+    for frame in range(12): # two faces per frame: track 1 blinks at frames 8-9, track 2 never
+        counts += [0 if frame in (8, 9) else 2, 2]
+    engine.eye_cascade = FakeEyeCascade(counts)
+    for frame in range(12):
+        results = engine.update(FakeAnalysis([1, 2]), now=frame * 0.1)
+    assert [live for _, _, live in results] == [True, False]
+    assert engine.is_live(1, now=1.2) and not engine.is_live(2, now=1.2)
@@ -0,0 +1,36 @@
+import csv
+from log_sinks import CsvMirrorSink
+
+
+def read(path):
+    with open(path, newline="") as f:
+        return list(csv.reader(f))
+
+
+def test_close_drains_queue_and_rotates_by_date(tmp_path):
+    sink = CsvMirrorSink(str(tmp_path), flush_interval=60, flush_rows=1000)
+    for i in range(100):
+        sink.write(f"p{i}", "Punch In", "2026-03-02 09:00:00", "2026-03-02")
+    sink.write("alice", "Punch Out", "2026-03-03 00:00:01", "2026-03-03")
+    sink.close()
+    day1 = read(tmp_path / "attendance_2026-03-02.csv")
+    assert day1[0] == CsvMirrorSink.HEADER and len(day1) == 101
+    assert read(tmp_path / "attendance_2026-03-03.csv") == [
+        CsvMirrorSink.HEADER, ["alice", "Punch Out", "2026-03-03 00:00:01", "2026-03-03"]]
+
+
+def test_reopening_a_day_appends_without_a_second_header(tmp_path):
+    for name in ("alice", "bob"):
+        sink = CsvMirrorSink(str(tmp_path))
+        sink.write(name, "Punch In", "2026-03-02 09:00:00", "2026-03-02")
+        sink.close()
+    rows = read(tmp_path / "attendance_2026-03-02.csv")
+    assert [row[0] for row in rows] == ["Name", "alice", "bob"]
+
+
+def test_writes_after_close_are_ignored(tmp_path):
+    sink = CsvMirrorSink(str(tmp_path))
+    sink.close()
+    sink.write("alice", "Punch In", "2026-03-02 09:00:00", "2026-03-02")
+    sink.close()
+    assert not (tmp_path / "attendance_2026-03-02.csv").exists()
@@ -0,0 +1,76 @@
+import json
+import urllib.request
+import metrics
+from metrics import Metrics, NullMetrics
+
+
+def test_counters_gauges_and_summaries():
+    m = Metrics(window=100)
+    m.inc("punches_total", action="in")
+    m.inc("punches_total", 2, action="in")
+    m.set("gallery_size", 5)
+    for value in range(1, 101):
+        m.observe("match_distance", value / 100)
+    snap = m.snapshot()
+    assert snap["counters"] == {'punches_total{action="in"}': 3}
+    assert snap["gauges"] == {"gallery_size": 5}
+    summary = snap["summaries"]["match_distance"]
+    assert summary["count"] == 100 and abs(summary["mean"] - 0.505) < 1e-9
+    assert (summary["p50"], summary["p95"], summary["p99"]) == (0.51, 0.96, 1.0)
+
+
+def test_quantiles_only_cover_the_recent_window():
+    m = Metrics(window=10)
+    for value in [100.0] * 10 + [1.0] * 10:
+        m.observe("latency_seconds", value)
+    summary = m.snapshot()["summaries"]["latency_seconds"]
+    assert summary["count"] == 20 and summary["p99"] == 1.0
+
+
+def test_timer_observes_elapsed_seconds():
+    m = Metrics()
+    with m.timer("detect_seconds", stage="haar"):
+        pass
+    summary = m.snapshot()["summaries"]['detect_seconds{stage="haar"}']
+    assert summary["count"] == 1 and summary["sum"] >= 0
+
+
+def test_prometheus_text():
+    m = Metrics()
+    m.inc("punches_total", action="out")
+    m.observe("embed_seconds", 0.5)
+    lines = m.prometheus().splitlines()
+    assert "# TYPE punches_total counter" in lines
+    assert 'punches_total{action="out"} 1' in lines
+    assert 'embed_seconds{quantile="0.5"} 0.5' in lines
+    assert "embed_seconds_count 1" in lines and "embed_seconds_sum 0.5" in lines
+
+
+def test_module_functions_forward_to_the_backend(monkeypatch):
+    monkeypatch.setattr(metrics, "_backend", NullMetrics())
+    metrics.inc("ignored_total")
+    with metrics.timer("ignored_seconds"):
+        pass
+    assert not metrics.enabled() and metrics.get_metrics().snapshot() == {}
+    backend = Metrics()
+    monkeypatch.setattr(metrics, "_backend", backend)
+    metrics.inc("frames_total")
+    metrics.set_gauge("queue_depth", 2)
+    assert backend.snapshot()["counters"] == {"frames_total": 1}
+    assert backend.snapshot()["gauges"] == {"queue_depth": 2}
+
+
+def test_http_endpoints(monkeypatch):
+    backend = Metrics()
+    backend.inc("frames_total")
+    monkeypatch.setattr(metrics, "_backend", backend)
+    server = metrics.start_http_server(0)
+    try:
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(base + "/metrics") as response:
+            assert "frames_total 1" in response.read().decode()
+        with urllib.request.urlopen(base + "/metrics.json") as response:
+            assert json.load(response)["counters"] == {"frames_total": 1}
+    finally:
+        server.shutdown()
+        server.server_close()
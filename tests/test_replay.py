@@ -0,0 +1,79 @@
+import json
+import cv2
+import numpy as np
+import pytest
+from attendance import AttendanceLogger, LOGGED
+from replay import Replay, read_frames
+
+FACE = (100, 80, 60, 60)
+
+
+class FixedCascade:
+    def detectMultiScale(self, gray, *args, **kwargs):
+        return [FACE]
+
+
+class FakeManager:
+    """Names every face 'alice'; the first call per track is a miss, later ones cache hits."""
+    def __init__(self):
+        self.seen = set()
+
+    def identify_analysis(self, analysis, cache=None, now=None, return_cached=False):
+        cached = [track_id in self.seen for track_id in analysis.track_ids]
+        self.seen.update(analysis.track_ids)
+        return [("alice", 0.2)] * len(analysis.faces), cached
+
+
+def frame():
+    image = np.zeros((240, 320, 3), dtype=np.uint8)
+    image[80:140, 100:160] = np.random.default_rng(0).integers(0, 255, (60, 60, 3), dtype=np.uint8)
+    return image
+
+
+@pytest.fixture
+def logger(tmp_path):
+    logger = AttendanceLogger(str(tmp_path / "replay.db"), sinks=[])
+    yield logger
+    logger.close()
+
+
+def test_records_and_summary(logger):
+    replay = Replay(FakeManager(), FixedCascade(), logger, require_blink=False, detect_every=3)
+    records = [json.loads(json.dumps(replay.process(i, i / 10, frame()))) for i in range(6)]
+
+    assert [r["frame"] for r in records] == list(range(6))
+    assert records[2]["time"] == 0.2
+    first = records[0]["faces"][0]
+    assert (first["track"], first["box"], first["name"], first["cached"]) == (1, list(FACE), "alice", False)
+    assert all(r["faces"][0]["cached"] for r in records[1:])
+    # Marked once per appearance, not once per frame
+    assert records[0]["punches"] == [{"name": "alice", "status": LOGGED}]
+    assert all(r["punches"] == [] for r in records[1:])
+
+    summary = replay.summary(wall_seconds=0.5)
+    assert (summary["frames"], summary["faces"], summary["embedded"]) == (6, 6, 1)
+    assert summary["punches"] == {LOGGED: 1} and summary["fps"] == 12.0
+    assert summary["detect_ratio"] == pytest.approx(2 / 6)
+    assert set(summary["stages"]) == set(Replay.STAGES)
+
+
+def test_blink_required_before_marking(logger):
+    replay = Replay(FakeManager(), FixedCascade(), logger, require_blink=True)
+    records = [replay.process(i, i / 10, frame()) for i in range(3)]
+    assert all(r["punches"] == [] for r in records)
+    assert not any(face["live"] for r in records for face in r["faces"])
+
+
+def test_read_frames_from_an_image_folder(tmp_path):
+    for name, value in (("b.png", 2), ("a.png", 1), ("notes.txt", None)):
+        if value is None:
+            (tmp_path / name).write_text("not a frame")
+        else:
+            cv2.imwrite(str(tmp_path / name), np.full((8, 8, 3), value, dtype=np.uint8))
+    frames = list(read_frames(str(tmp_path), image_fps=4.0))
+    assert [(i, t, int(f[0, 0, 0])) for i, t, f in frames] == [(0, 0.0, 1), (1, 0.25, 2)]
+
+
+def test_read_frames_missing_video_raises(tmp_path):
+    with pytest.raises(RuntimeError):
+        list(read_frames(str(tmp_path / "missing.mp4")))
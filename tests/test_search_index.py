@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+from gallery import EmbeddingGallery
+from search_index import ExactIndex, IVFIndex, make_index
+
+
+def clustered(n_clusters=20, per_cluster=20, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(n_clusters, dim))
+    rows = np.repeat(centres, per_cluster, axis=0) + 0.1 * rng.normal(size=(n_clusters * per_cluster, dim))
+    return EmbeddingGallery.normalize(rows)
+
+
+def fitted(matrix, **options):
+    index = IVFIndex(nlist=20, nprobe=2, min_rows=100, **options)
+    index.fit(matrix)
+    return index
+
+
+def test_finds_every_stored_row():
+    matrix = clustered()
+    index = fitted(matrix)
+    assert index.centroids.shape == (20, 32) and len(index.assignments) == len(matrix)
+    for row in range(0, len(matrix), 7):
+        rows, distances = index.search(matrix, matrix[row])
+        assert rows[0] == row and distances[0] == pytest.approx(0.0, abs=1e-5)
+
+
+def test_agrees_with_exact_search_on_nearby_probes():
+    matrix = clustered()
+    index = fitted(matrix)
+    probes = EmbeddingGallery.normalize(matrix[::10] + 0.05 * np.random.default_rng(1).normal(size=matrix[::10].shape))
+    approx = [rows[0] for rows, _ in index.search_many(matrix, probes)]
+    exact = [rows[0] for rows, _ in ExactIndex().search_many(matrix, probes)]
+    assert approx == exact
+
+
+def test_small_galleries_are_searched_exactly():
+    matrix = clustered(n_clusters=5, per_cluster=2)
+    index = IVFIndex(min_rows=100)
+    index.fit(matrix)
+    assert index.centroids is None and index.fitted
+    rows, _ = index.search(matrix, matrix[3], k=3)
+    assert list(rows) == list(ExactIndex().search(matrix, matrix[3], k=3)[0])
+
+
+def test_updates_before_the_first_fit_are_ignored():
+    index = IVFIndex(min_rows=100)
+    index.added(clustered()[:1], 0)
+    index.removed(0)
+    assert not index.fitted and len(index.assignments) == 0
+
+
+def test_gallery_adds_and_removes_stay_in_step():
+    matrix = clustered()
+    gallery = EmbeddingGallery(index=IVFIndex(nlist=20, nprobe=2, min_rows=100))
+    gallery.load((f"user{i}", "0.jpg", row) for i, row in enumerate(matrix))
+    gallery.add("newcomer", "0.jpg", matrix[5] + 0.01)
+    assert len(gallery.index.assignments) == len(gallery)
+    assert gallery.search(matrix[5] + 0.01)[0][0] == "newcomer"
+
+    for name in ("user5", "user0", "user399"):
+        assert gallery.remove(name)
+    assert len(gallery.index.assignments) == len(gallery)
+    assert gallery.search(matrix[5])[0][0] == "newcomer"
+    assert gallery.search(matrix[200])[0][0] == "user200"
+
+
+def test_retrains_when_the_gallery_doubles():
+    matrix = clustered()
+    index = fitted(matrix[:150])
+    for row in range(150, 301):
+        index.added(matrix[:row + 1], row)
+    assert index.trained_rows == 301 and len(index.assignments) == 301
+
+
+def test_save_load_round_trip(tmp_path):
+    matrix = clustered()
+    names = [f"user{i}" for i in range(len(matrix))]
+    path = str(tmp_path / "ivf.npz")
+    index = fitted(matrix)
+    index.save(path, names)
+
+    restored = IVFIndex(nprobe=2)
+    assert restored.load(path, names) and restored.fitted
+    np.testing.assert_array_equal(restored.centroids, index.centroids)
+    np.testing.assert_array_equal(restored.assignments, index.assignments)
+    assert restored.trained_rows == len(matrix)
+    assert restored.search(matrix, matrix[42])[0][0] == 42
+
+
+def test_load_rejects_another_gallery_or_a_bad_file(tmp_path):
+    matrix = clustered()
+    names = [f"user{i}" for i in range(len(matrix))]
+    path = str(tmp_path / "ivf.npz")
+    fitted(matrix).save(path, names)
+    assert not IVFIndex().load(path, names[::-1])
+    assert not IVFIndex().load(str(tmp_path / "missing.npz"), names)
+    (tmp_path / "bad.npz").write_bytes(b"not an index")
+    assert not IVFIndex().load(str(tmp_path / "bad.npz"), names)
+
+
+def test_make_index():
+    assert isinstance(make_index("exact"), ExactIndex)
+    assert make_index("ivf", nprobe=3).nprobe == 3
+    with pytest.raises(ValueError):
+        make_index("hnsw")
@@ -0,0 +1,58 @@
+import pytest
+from server import BatchIdentifier
+
+
+class FakeManager:
+    """identify_crops() echoes each crop back so results can be traced to requests."""
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    def identify_crops(self, crops):
+        self.calls.append(list(crops))
+        if self.fail:
+            raise RuntimeError("model failed")
+        return [(crop, 0.1) for crop in crops]
+
+
+@pytest.fixture
+def make_batcher():
+    batchers = []
+    def make(manager, **options):
+        batchers.append(BatchIdentifier(manager, **options))
+        return batchers[-1]
+    yield make
+    for batcher in batchers:
+        batcher.stop()
+
+
+def test_requests_within_the_window_share_one_batch(make_batcher):
+    manager = FakeManager()
+    batcher = make_batcher(manager, window=0.5, max_batch=4)
+    first, second = batcher.submit(["a", "b"]), batcher.submit(["c", "d"])
+    assert first.result(2) == [("a", 0.1), ("b", 0.1)]
+    assert second.result(2) == [("c", 0.1), ("d", 0.1)]
+    assert manager.calls == [["a", "b", "c", "d"]] and batcher.mean_batch() == 4
+
+
+def test_max_batch_closes_the_batch_early(make_batcher):
+    manager = FakeManager()
+    batcher = make_batcher(manager, window=5.0, max_batch=2)
+    futures = [batcher.submit([name]) for name in "abcd"]
+    assert [f.result(2) for f in futures] == [[("a", 0.1)], [("b", 0.1)], [("c", 0.1)], [("d", 0.1)]]
+    assert manager.calls == [["a", "b"], ["c", "d"]]
+
+
+def test_empty_request_resolves_immediately(make_batcher):
+    manager = FakeManager()
+    assert make_batcher(manager).submit([]).result(0) == []
+    assert manager.calls == []
+
+
+def test_model_error_fails_every_future_in_the_batch(make_batcher):
+    batcher = make_batcher(FakeManager(fail=True), window=0.5, max_batch=2)
+    futures = [batcher.submit(["a"]), batcher.submit(["b"])]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(2)
+    assert batcher.batches == 0
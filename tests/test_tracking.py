@@ -0,0 +1,58 @@
+import numpy as np
+from tracking import FaceTracker
+
+PATCH = np.random.default_rng(0).integers(0, 255, (60, 60), dtype=np.uint8)
+
+
+class ScriptedCascade:
+    """Returns the next scripted list of boxes on every detection."""
+    def __init__(self, detections):
+        self.detections = list(detections)
+        self.calls = 0
+
+    def detectMultiScale(self, gray, *args):
+        self.calls += 1
+        return self.detections.pop(0) if self.detections else []
+
+
+def frame_with_face(x, y=80):
+    gray = np.zeros((240, 320), dtype=np.uint8)
+    gray[y:y + 60, x:x + 60] = PATCH
+    return np.dstack([gray] * 3), gray
+
+
+def test_detects_every_n_frames_and_keeps_ids():
+    cascade = ScriptedCascade([[(100, 80, 60, 60)]] * 10)
+    tracker = FaceTracker(cascade, detect_every=5)
+    ids = set()
+    for _ in range(10):
+        boxes, track_ids = tracker.update(*frame_with_face(100))
+        ids.update(track_ids)
+    assert ids == {1}
+    assert cascade.calls == 2 and tracker.stats()["detect_ratio"] == 0.2
+
+
+def test_follows_a_moving_face_between_detections():
+    cascade = ScriptedCascade([[(100, 80, 60, 60)]])
+    tracker = FaceTracker(cascade, detect_every=100)
+    for x in range(100, 130, 3):
+        boxes, track_ids = tracker.update(*frame_with_face(x))
+    assert track_ids == [1] and cascade.calls == 1
+    assert abs(boxes[0][0] - 127) <= 6 and abs(boxes[0][1] - 80) <= 6
+
+
+def test_track_survives_one_missed_detection_only():
+    cascade = ScriptedCascade([[(100, 80, 60, 60)], [], [(100, 80, 60, 60)], [], []])
+    tracker = FaceTracker(cascade, detect_every=1, max_misses=1)
+    seen = [tracker.update(*frame_with_face(100))[1] for _ in range(5)]
+    assert seen == [[1], [1], [1], [1], []]
+
+
+def test_new_face_gets_a_new_id():
+    cascade = ScriptedCascade([[(100, 80, 60, 60)], [(100, 80, 60, 60), (200, 150, 60, 60)]])
+    tracker = FaceTracker(cascade, detect_every=1)
+    tracker.update(*frame_with_face(100))
+    frame, gray = frame_with_face(100)
+    gray[150:210, 200:260] = PATCH.T
+    boxes, track_ids = tracker.update(np.dstack([gray] * 3), gray)
+    assert sorted(track_ids) == [1, 2]
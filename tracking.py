@@ -0,0 +1,208 @@
+import cv2
+import numpy as np
+from identity_cache import iou
+import metrics
+
+
+class _FlowTrack:
+    """Follows one face with sparse Lucas-Kanade optical flow on corner points."""
+    def __init__(self, gray, box):
+        self.box = box
+        self.points = self._features(gray, box)
+
+    @staticmethod
+    def _features(gray, box):
+        (x, y, w, h) = box
+        mask = np.zeros_like(gray)
+        mask[max(0, y):y+h, max(0, x):x+w] = 255
+        return cv2.goodFeaturesToTrack(gray, maxCorners=40, qualityLevel=0.01, minDistance=5, mask=mask)
+
+    def update(self, prev_gray, gray):
+        """Moves the box with the median point motion. Returns False when the track is lost."""
+        if self.points is None or len(self.points) < 4:
+            return False
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, self.points, None, winSize=(15, 15), maxLevel=2)
+        good = status.reshape(-1) == 1
+        if good.sum() < 4:
+            return False
+        old, new = self.points[good].reshape(-1, 2), moved[good].reshape(-1, 2)
+        dx, dy = np.median(new - old, axis=0)
+
+        # Scale from how the spread of the points changed (face walking closer / away)
+        old_spread = np.linalg.norm(old - old.mean(axis=0), axis=1).mean()
+        new_spread = np.linalg.norm(new - new.mean(axis=0), axis=1).mean()
+        scale = new_spread / old_spread if old_spread > 1e-3 else 1.0
+        scale = float(np.clip(scale, 0.8, 1.25))
+
+        (x, y, w, h) = self.box
+        cx, cy = x + w / 2 + dx, y + h / 2 + dy
+        w, h = w * scale, h * scale
+        self.box = (int(cx - w / 2), int(cy - h / 2), int(w), int(h))
+        self.points = new.reshape(-1, 1, 2)
+        return True
+
+
+class _OpenCVTrack:
+    """Follows one face with an OpenCV correlation-filter tracker (KCF / MOSSE)."""
+    def __init__(self, frame, box, create):
+        self.box = box
+        self.tracker = create()
+        self.tracker.init(frame, tuple(box))
+
+    def update(self, frame):
+        ok, box = self.tracker.update(frame)
+        if ok:
+            self.box = tuple(int(v) for v in box)
+        return bool(ok)
+
+
+def _opencv_tracker_factory(backend):
+    """cv2 constructor for 'kcf' / 'mosse' (needs opencv-contrib-python), or None."""
+    names = {"kcf": "TrackerKCF_create", "mosse": "TrackerMOSSE_create"}[backend]
+    for module in (cv2, getattr(cv2, "legacy", None)):
+        if module is not None and hasattr(module, names):
+            return getattr(module, names)
+    return None
+
+
+class FaceTracker:
+    """
+    Runs the Haar detector only every 'detect_every' frames (or as soon as a
+    track is lost) and follows faces with a cheap tracker in between.
+    Every face gets a track ID that stays the same while it is followed, so
+    identity and liveness state can belong to a person rather than to
+    "the largest face in this frame".
+    Not thread-safe: feed it from a single (processing) thread, in frame order.
+    """
+    BACKENDS = ("flow", "kcf", "mosse")
+
+    def __init__(self, face_cascade, detect_every=5, backend="flow", scale_factor=1.3, min_neighbors=5,
+                 iou_threshold=0.3, max_misses=1, min_size=20):
+        """
+        backend: "flow" (optical flow, core OpenCV) or "kcf"/"mosse"
+                 (correlation filters, need opencv-contrib-python; falls back to flow).
+        max_misses: detections a track may go unmatched (Haar flicker) before it is dropped.
+        """
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown tracker backend: {backend}")
+        self.face_cascade = face_cascade
+        self.detect_every = max(1, detect_every)
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.min_size = min_size
+
+        self._create = None
+        if backend != "flow":
+            self._create = _opencv_tracker_factory(backend)
+            if self._create is None:
+                print(f"[WARNING] OpenCV {backend.upper()} tracker not available (needs opencv-contrib-python); using optical flow.")
+                backend = "flow"
+        self.backend = backend
+
+        self.frames = 0
+        self.detections = 0
+        self._tracks = {} # track id -> [tracker, misses]
+        self._next_id = 1
+        self._prev_gray = None
+        self._since_detect = self.detect_every # detect on the first frame
+
+    def reset(self):
+        self._tracks = {}
+        self._prev_gray = None
+        self._since_detect = self.detect_every
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "detections": self.detections,
+            "detect_ratio": self.detections / self.frames if self.frames else 0.0,
+            "tracks": len(self._tracks),
+        }
+
+    def update(self, frame, gray):
+        """
+        Advances all tracks to this frame.
+        Returns: (boxes, track ids), boxes as (x, y, w, h).
+        """
+        self.frames += 1
+        lost = self._follow(frame, gray)
+        self._since_detect += 1
+        # Nobody in view also waits for the next scheduled detection: an empty
+        # kiosk costs one Haar pass every N frames instead of every frame
+        if lost or self._since_detect >= self.detect_every:
+            self._detect(frame, gray)
+        self._prev_gray = gray
+
+        ids = list(self._tracks)
+        return [self._tracks[i][0].box for i in ids], ids
+
+    # --- Internals ---
+    def _follow(self, frame, gray):
+        """Moves every track with the cheap tracker. Returns True if any was lost."""
+        if self._prev_gray is None or self._prev_gray.shape != gray.shape:
+            return bool(self._tracks)
+        lost = False
+        height, width = gray.shape[:2]
+        for track_id in list(self._tracks):
+            track = self._tracks[track_id][0]
+            ok = track.update(self._prev_gray, gray) if self._create is None else track.update(frame)
+            if ok:
+                ok = self._clip(track, width, height)
+            if not ok:
+                del self._tracks[track_id]
+                metrics.inc("tracks_lost_total")
+                lost = True
+        return lost
+
+    def _clip(self, track, width, height):
+        (x, y, w, h) = track.box
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(width, x + w), min(height, y + h)
+        if x1 - x0 < self.min_size or y1 - y0 < self.min_size:
+            return False
+        track.box = (x0, y0, x1 - x0, y1 - y0)
+        return True
+
+    def _new_track(self, frame, gray, box):
+        if self._create is None:
+            return _FlowTrack(gray, box)
+        return _OpenCVTrack(frame, box, self._create)
+
+    def _detect(self, frame, gray):
+        """Full Haar pass: re-anchors matched tracks, starts new ones, ages the rest."""
+        self.detections += 1
+        self._since_detect = 0
+        with metrics.timer("face_detect_seconds"):
+            found = self.face_cascade.detectMultiScale(gray, self.scale_factor, self.min_neighbors)
+        boxes = [tuple(int(v) for v in f) for f in found]
+        metrics.inc("face_detections_total")
+
+        pairs = []
+        for i, box in enumerate(boxes):
+            for track_id, (track, _) in self._tracks.items():
+                overlap = iou(box, track.box)
+                if overlap >= self.iou_threshold:
+                    pairs.append((overlap, i, track_id))
+        pairs.sort(reverse=True)
+
+        matched_boxes, matched_tracks = set(), set()
+        for _, i, track_id in pairs:
+            if i in matched_boxes or track_id in matched_tracks:
+                continue
+            matched_boxes.add(i)
+            matched_tracks.add(track_id)
+            # Re-anchor on the detector's box so tracker drift never accumulates
+            self._tracks[track_id] = [self._new_track(frame, gray, boxes[i]), 0]
+
+        for track_id in list(self._tracks):
+            if track_id not in matched_tracks:
+                self._tracks[track_id][1] += 1
+                if self._tracks[track_id][1] > self.max_misses:
+                    del self._tracks[track_id]
+
+        for i, box in enumerate(boxes):
+            if i not in matched_boxes:
+                self._tracks[self._next_id] = [self._new_track(frame, gray, box), 0]
+                self._next_id += 1